@@ -0,0 +1,59 @@
+# stock aggregation (per-item totals and batch count histograms)
+import bisect
+import collections
+
+
+ItemTotals = collections.namedtuple('ItemTotals', ['item', 'batches', 'total', 'minimum', 'maximum'])
+HistogramBucket = collections.namedtuple('HistogramBucket', ['low', 'high', 'batches'])
+
+DEFAULT_EDGES = (1, 10, 100, 1000)
+
+
+class AggregateError(Exception):
+    pass
+
+
+def check_edges(edges):
+    edges = list(edges)
+    if not edges or edges != sorted(set(edges)):
+        raise AggregateError('Histogram edges must be unique and ascending!')
+    return edges
+
+
+def histogram_buckets(edges, counts_by_index):
+    bounds = [None] + edges + [None]
+    return [
+        HistogramBucket(bounds[i], bounds[i + 1], counts_by_index.get(i, 0))
+        for i in range(len(edges) + 1)
+    ]
+
+
+def compile_item_totals(table, item_expression):
+    return (
+        "SELECT {item} AS item, COUNT(*), SUM(count), MIN(count), MAX(count) "
+        "FROM {table} GROUP BY {item} ORDER BY {item}"
+    ).format(table=table, item=item_expression)
+
+
+def compile_histogram(table, placeholder, edges):
+    # bucket index i holds edges[i - 1] <= count < edges[i]
+    cases = ' '.join('WHEN count < {p} THEN %d' % (i,) for i in range(len(edges)))
+    sql = (
+        "SELECT CASE " + cases + " ELSE %d END AS bucket, COUNT(*) "
+        "FROM {table} GROUP BY bucket"
+    ) % (len(edges),)
+    return sql.format(table=table, p=placeholder), tuple(edges)
+
+
+def evaluate_item_totals(stock, name_id_map):
+    totals = []
+    for item in sorted(name_id_map):
+        counts = [stock[stock_id].get('count', 0) for stock_id, _ in name_id_map[item]]
+        if counts:
+            totals.append(ItemTotals(item, len(counts), sum(counts), min(counts), max(counts)))
+    return totals
+
+
+def evaluate_histogram(counts, edges):
+    buckets = collections.Counter(bisect.bisect_right(edges, count) for count in counts)
+    return histogram_buckets(edges, buckets)
@@ -0,0 +1,29 @@
+# storage backend registry (backend modules are imported only when selected)
+import importlib
+
+
+BACKENDS = {
+    'sqlite': ('app.stockist', 'SQLiteStockist'),
+    'postgresql': ('app.stockist', 'PostgreSQLStockist'),
+    'dbm': ('app.stockist', 'DBMStockist'),
+}
+
+
+class BackendError(Exception):
+    pass
+
+
+def register_backend(name, module, attribute):
+    BACKENDS[name] = (module, attribute)
+
+
+def get_backend(name):
+    try:
+        module, attribute = BACKENDS[name]
+    except KeyError:
+        raise BackendError('Unknown backend {0}!'.format(name))
+    return getattr(importlib.import_module(module), attribute)
+
+
+def create_stockist(name, database, **options):
+    return get_backend(name)(database, **options)
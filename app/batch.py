@@ -0,0 +1,185 @@
+# batch mode (run many stock commands against one loaded stockist)
+import shlex
+import time
+
+from app import stockist
+
+
+class BatchError(Exception):
+    pass
+
+
+def parse_amount(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise BatchError('Invalid amount.')
+
+
+def parse_key(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class BatchRunner(object):
+
+    # options taking a value are written --name=value
+    FLAGS = {
+        'stock': ('--create', '--location'),
+        'remove': ('--delete-if-zero', '--location'),
+        'delete': ('--delete-all',),
+        'count': ('--location',),
+    }
+    # accepted by every command; they carry the client's --lock and --verbose
+    COMMON_FLAGS = ('--lock', '--verbose')
+
+    def __init__(self, stock):
+        self.stock = stock
+        self.lines = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def parse(self, line):
+        words = shlex.split(line, comments=True)
+        if not words:
+            return None
+        command, arguments = words[0], words[1:]
+        if command not in self.FLAGS:
+            raise BatchError('Unknown command {0}.'.format(command))
+        flags = dict(
+            (name, value or True) for name, _, value in
+            (word.partition('=') for word in arguments if word.startswith('--'))
+        )
+        unknown = set(flags) - set(self.FLAGS[command]) - set(self.COMMON_FLAGS)
+        if unknown:
+            raise BatchError('Unknown option {0}.'.format(sorted(unknown)[0]))
+        arguments = [word for word in arguments if not word.startswith('--')]
+        if not 1 <= len(arguments) <= (1 if command in ('delete', 'count') else 2):
+            raise BatchError('Wrong number of arguments for {0}.'.format(command))
+        return command, arguments, flags
+
+    def execute(self, line):
+        parsed = self.parse(line)
+        if parsed is None:
+            return []
+        command, arguments, flags = parsed
+        # --lock refuses writes for this command only, like the cli's --lock
+        locked = self.stock.stock_locked
+        if '--lock' in flags:
+            self.stock.stock_locked = True
+        with self.stock.touching() as touched:
+            try:
+                return getattr(self, 'do_' + command)(arguments, flags)
+            except BatchError:
+                raise
+            except stockist.StockLockedError:
+                raise BatchError('Locked.')
+            except KeyError:
+                raise BatchError('Not found.')
+            except (stockist.StockError, stockist.locations_module.LocationError) as error:
+                raise BatchError(str(error))
+            except Exception as error:
+                # memory may be ahead of a write the database refused
+                self.stock.reload_rows(touched)
+                raise BatchError('{0}: {1}'.format(error.__class__.__name__, error))
+            finally:
+                self.stock.stock_locked = locked
+
+    def location(self, flags):
+        location = flags.get('--location')
+        if location is True:
+            raise BatchError('Missing location.')
+        if location is not None and self.stock.locations is None:
+            self.stock.enable_locations()
+        return location
+
+    def describe(self, stock_id, location):
+        # the line the cli prints for --verbose
+        data = self.stock[stock_id]
+        count = data['count'] if location is None else self.stock.locations.count_at(stock_id, location)
+        return [data['unique_name'] + ": " + str(count)]
+
+    def do_stock(self, arguments, flags):
+        key = parse_key(arguments[0])
+        amount = parse_amount(arguments[1]) if len(arguments) > 1 else 1
+        create = '--create' in flags
+        location = self.location(flags)
+        if isinstance(key, int):
+            stock_id = self.stock.stock_item(item_id=key, amount=amount, create=create, location=location)
+        else:
+            stock_id = self.stock.stock_item(item=key, amount=amount, create=create, location=location)
+        return self.describe(stock_id, location) if '--verbose' in flags else []
+
+    def do_remove(self, arguments, flags):
+        key = parse_key(arguments[0])
+        amount = abs(parse_amount(arguments[1])) * -1 if len(arguments) > 1 else -1
+        if not isinstance(key, int):
+            key = self.stock.last_stock_id_for_item(key)
+            if key is None:
+                raise BatchError('Not present.')
+        location = self.location(flags)
+        if location is None:
+            self.stock.increase_stock(key, amount)
+        else:
+            self.stock.increase_stock_at(key, location, amount)
+        if self.stock[key]['count'] < 1 and '--delete-if-zero' in flags:
+            del self.stock[key]
+            return ['Deleted.'] if '--verbose' in flags else []
+        return self.describe(key, location) if '--verbose' in flags else []
+
+    def do_delete(self, arguments, flags):
+        key = parse_key(arguments[0])
+        if not isinstance(key, int) and '--delete-all' not in flags:
+            key = self.stock.last_stock_id_for_item(key)
+            if key is None:
+                raise BatchError('Not present.')
+        del self.stock[key]
+        return []
+
+    def do_count(self, arguments, flags):
+        key = parse_key(arguments[0])
+        location = self.location(flags)
+        if location is not None:
+            count_at = self.stock.locations.count_at
+            if isinstance(key, int):
+                return [str(count_at(key, location))]
+            return [
+                "> " + data['unique_name'] + ": " + str(count_at(data['stock_id'], location))
+                for data in self.stock[key]
+            ]
+        if isinstance(key, int):
+            return [str(self.stock[key]['count'])]
+        return [
+            "> " + data['unique_name'] + ": " + str(data['count'])
+            for data in self.stock[key]
+        ]
+
+    def run(self, lines, batch_size=1000):
+        start = time.perf_counter()
+        lines = iter(lines)
+        number = 0
+        while True:
+            chunk = [line for _, line in zip(range(batch_size), lines)]
+            if not chunk:
+                break
+            # results are only handed out once their chunk has committed
+            results = []
+            with self.stock.transaction():
+                for line in chunk:
+                    number += 1
+                    try:
+                        output, error = self.execute(line), None
+                    except BatchError as failure:
+                        output, error = [], failure
+                        self.errors += 1
+                    self.lines += 1
+                    results.append((number, output, error))
+            for result in results:
+                yield result
+        self.elapsed += time.perf_counter() - start
+
+    @property
+    def throughput(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
@@ -1,18 +1,107 @@
-# TODO: shopping cart (add item, remove item, checkout + remove from stock, api)
+# shopping cart (add item, remove item, checkout + remove from stock)
+import collections
+
+from app import reservation
 
 
 class ShoppingCart(object):
 
-    def __init__(self):
-        pass
+    def __init__(self, stockist, ttl=None):
+        self.stockist = stockist
+        self.ttl = ttl
+        self.holds = collections.OrderedDict()
+
+    @property
+    def reservations(self):
+        return self.stockist.reservations
+
+    def add_item(self, item_or_stock_id, quantity=1):
+        if isinstance(item_or_stock_id, int):
+            holds = [self.reservations.reserve(item_or_stock_id, quantity, ttl=self.ttl)]
+        else:
+            holds = self.reservations.reserve_item(item_or_stock_id, quantity, ttl=self.ttl)
+        for hold in holds:
+            self.holds[hold.hold_id] = hold
+        return holds
+
+    def _matching_holds(self, item_or_stock_id):
+        if isinstance(item_or_stock_id, int):
+            stock_ids = set([item_or_stock_id])
+        else:
+            stock_ids = set(self.stockist.stock_ids_for_item(item_or_stock_id))
+        return [hold for hold in self.holds.values() if hold.stock_id in stock_ids]
+
+    def remove_item(self, item_or_stock_id, quantity=None):
+        removed = 0
+        # newest holds are given back first
+        for hold in reversed(self._matching_holds(item_or_stock_id)):
+            if quantity is not None and removed >= quantity:
+                break
+            take = hold.quantity if quantity is None else min(hold.quantity, quantity - removed)
+            try:
+                remaining = self.reservations.reduce(hold.hold_id, take)
+            except reservation.HoldExpiredError:
+                remaining = None
+            if remaining is None:
+                del self.holds[hold.hold_id]
+            else:
+                self.holds[hold.hold_id] = remaining
+            removed += take
+        return removed
+
+    def refresh(self):
+        for hold_id in list(self.holds):
+            self.holds[hold_id] = self.reservations.extend(hold_id, ttl=self.ttl)
+
+    @property
+    def lines(self):
+        lines = collections.OrderedDict()
+        for hold in self.holds.values():
+            lines[hold.stock_id] = lines.get(hold.stock_id, 0) + hold.quantity
+        return lines
 
-    def add_item(self):
-        pass
+    def clear(self):
+        for hold_id in list(self.holds):
+            self.reservations.release(hold_id)
+        self.holds.clear()
 
-    def remove_item(self):
-        pass
+    def _unpin(self, hold_ids):
+        for hold_id in hold_ids:
+            self.holds[hold_id] = self.reservations.extend(hold_id, ttl=self.ttl)
 
     def checkout(self):
-        pass
+        hold_ids = list(self.holds)
+        self.reservations.pin(hold_ids)
+        try:
+            request = self.stockist.checkout_engine.checkout(self.lines, hold_ids=hold_ids)
+        except Exception:
+            self._unpin(hold_ids)
+            raise
+        self.holds.clear()
+        return request
 
-    
\ No newline at end of file
+    def checkout_async(self, processor, amount, idempotency_key=None, block=True, timeout=None):
+        # the payment job owns the holds from here; it confirms them once the
+        # charge succeeds and releases them if it fails
+        hold_ids = list(self.holds)
+        self.reservations.pin(hold_ids)
+        try:
+            job = processor.submit(
+                self.lines,
+                hold_ids,
+                amount,
+                idempotency_key=idempotency_key,
+                block=block,
+                timeout=timeout,
+            )
+        except Exception:
+            self._unpin(hold_ids)
+            raise
+        if job.hold_ids != hold_ids:
+            # the key was already used; that job owns its own holds and these
+            # would otherwise stay pinned forever
+            self._unpin(hold_ids)
+            self.clear()
+            return job
+        self.holds.clear()
+        return job
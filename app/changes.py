@@ -0,0 +1,196 @@
+# external change detection for SQLite (data_version checks, trigger-fed change log)
+import contextlib
+import threading
+
+
+class ChangeError(Exception):
+    pass
+
+
+class StockChangeLog(object):
+
+    # triggers on the stock table append the pk of every row another writer
+    # inserts, updates or deletes; a NULL pk marks the table as replaced
+    # wholesale, after which only a full reload is trustworthy
+    CHANGE_TABLE = "stock_changes"
+    CREATE_SQL_STRING = "CREATE TABLE IF NOT EXISTS {changes}(seq INTEGER PRIMARY KEY AUTOINCREMENT, pk INT)"
+    TRIGGERS = (
+        ("insert", "INSERT", "INSERT INTO {changes}(pk) VALUES(NEW.pk);"),
+        ("update", "UPDATE", "INSERT INTO {changes}(pk) VALUES(NEW.pk); "
+                             "INSERT INTO {changes}(pk) SELECT OLD.pk WHERE OLD.pk IS NOT NEW.pk;"),
+        ("delete", "DELETE", "INSERT INTO {changes}(pk) VALUES(OLD.pk);"),
+    )
+    # every trigger also drops rows more than CAP behind the newest, so a log
+    # nobody polls any more (a crashed server, say) stays bounded
+    CAP = 100000
+    CAP_SQL_STRING = "DELETE FROM {changes} WHERE seq <= (SELECT MAX(seq) FROM {changes}) - {cap};"
+    CREATE_TRIGGER_SQL_STRING = (
+        "CREATE TRIGGER IF NOT EXISTS {table}_changes_{name} AFTER {event} ON {table} BEGIN {body} END"
+    )
+    DROP_TRIGGER_SQL_STRING = "DROP TRIGGER IF EXISTS {table}_changes_{name}"
+    DROP_SQL_STRING = "DROP TABLE IF EXISTS {changes}"
+    TRIGGER_COUNT_SQL_STRING = (
+        "SELECT COUNT(*) FROM sqlite_master WHERE type='trigger' AND name LIKE '{table}\\_changes\\_%' ESCAPE '\\'"
+    )
+    RESET_SQL_STRING = "INSERT INTO {changes}(pk) VALUES(NULL)"
+    BOUNDS_SQL_STRING = "SELECT MIN(seq), MAX(seq) FROM {changes}"
+    CHANGED_SQL_STRING = "SELECT DISTINCT pk FROM {changes} WHERE seq > ? AND seq <= ?"
+    ROWS_SQL_STRING = "SELECT pk, name, count FROM {table} WHERE pk IN ({ids})"
+    TRIM_SQL_STRING = "DELETE FROM {changes} WHERE seq <= ?"
+    DATA_VERSION_SQL_STRING = "PRAGMA data_version"
+    # SQLite caps bound parameters per statement
+    FETCH_CHUNK = 500
+
+    def __init__(self, stockist, keep=10000):
+        self.stockist = stockist
+        # change rows kept behind the newest one before trim() drops them
+        self.keep = keep
+        self.last_seq = 0
+        self.data_version = None
+        self.refreshes = 0
+        self.reloads = 0
+
+    def sql(self, template, **extra):
+        return template.format(table=self.stockist.STOCK_TABLE, changes=self.CHANGE_TABLE, **extra)
+
+    @property
+    def connection(self):
+        return self.stockist.connection
+
+    def install(self, reset=False):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.CREATE_SQL_STRING))
+            for name, event, body in self.TRIGGERS:
+                body = self.sql(body) + ' ' + self.sql(self.CAP_SQL_STRING, cap=self.CAP)
+                cur.execute(self.sql(self.CREATE_TRIGGER_SQL_STRING, name=name, event=event, body=body))
+            if reset:
+                cur.execute(self.sql(self.RESET_SQL_STRING))
+            connection.commit()
+            cur.execute(self.sql(self.BOUNDS_SQL_STRING))
+            self.last_seq = cur.fetchone()[1] or 0
+            self.data_version = self.current_version(cur)
+
+    def uninstall(self):
+        # without a reader the triggers would only grow the log for nothing
+        with self.connection as connection:
+            cur = connection.cursor()
+            for name, _, _ in self.TRIGGERS:
+                cur.execute(self.sql(self.DROP_TRIGGER_SQL_STRING, name=name))
+            cur.execute(self.sql(self.DROP_SQL_STRING))
+            connection.commit()
+        self.last_seq = 0
+        self.data_version = None
+
+    def current_version(self, cur):
+        cur.execute(self.DATA_VERSION_SQL_STRING)
+        return cur.fetchone()[0]
+
+    def poll(self):
+        # data_version only moves when another connection commits, so an idle
+        # database costs one pragma per poll
+        with self.connection as connection:
+            version = self.current_version(connection.cursor())
+        if version == self.data_version:
+            return None
+        self.data_version = version
+        return self.refresh()
+
+    def refresh(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.TRIGGER_COUNT_SQL_STRING))
+            if cur.fetchone()[0] < len(self.TRIGGERS):
+                # the stock table was recreated by a writer that does not track changes
+                return self.reload()
+            cur.execute(self.sql(self.BOUNDS_SQL_STRING))
+            first, last = cur.fetchone()
+            if last is None or last <= self.last_seq:
+                return []
+            if first > self.last_seq + 1:
+                # rows we have not seen were already trimmed
+                return self.reload()
+            cur.execute(self.sql(self.CHANGED_SQL_STRING), (self.last_seq, last))
+            stock_ids = [stock_id for stock_id, in cur.fetchall()]
+            if None in stock_ids:
+                return self.reload()
+            entries = {}
+            for start in range(0, len(stock_ids), self.FETCH_CHUNK):
+                chunk = stock_ids[start:start + self.FETCH_CHUNK]
+                cur.execute(self.sql(self.ROWS_SQL_STRING, ids=', '.join('?' * len(chunk))), chunk)
+                for stock_id, name, count in cur.fetchall():
+                    entries[stock_id] = {'stock_id': stock_id, 'unique_name': name, 'count': count}
+        deleted_ids = [stock_id for stock_id in stock_ids if stock_id not in entries]
+        changed = self.stockist.apply_changes(
+            [entries[stock_id] for stock_id in stock_ids if stock_id in entries], deleted_ids
+        )
+        self.last_seq = last
+        self.refreshes += 1
+        if last - first >= 2 * self.keep:
+            self.trim()
+        return changed
+
+    def reload(self):
+        self.install()
+        self.reloads += 1
+        return self.stockist.sync_from_db()
+
+    def trim(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.TRIM_SQL_STRING), (min(self.last_seq, self.latest() - self.keep),))
+            connection.commit()
+
+    def latest(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.BOUNDS_SQL_STRING))
+            return cur.fetchone()[1] or 0
+
+
+class ChangePoller(object):
+
+    def __init__(self, changes, interval=1.0, lock=None):
+        if interval <= 0:
+            raise ChangeError('Invalid interval {0}!'.format(interval))
+        self.changes = changes
+        self.interval = interval
+        # held around each refresh so it never interleaves with a request
+        self.lock = lock
+        self.errors = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            raise ChangeError('Poller already running!')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stock-change-poller')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll_once()
+
+    def poll_once(self):
+        try:
+            with self.lock if self.lock is not None else contextlib.nullcontext():
+                return self.changes.poll()
+        except Exception as e:
+            # a busy database is retried on the next tick
+            self.errors += 1
+            self.last_error = e
+            return None
+
+    def stop(self, timeout=None, uninstall=True):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if uninstall:
+            with self.lock if self.lock is not None else contextlib.nullcontext():
+                self.changes.stockist.disable_change_tracking()
@@ -0,0 +1,117 @@
+# checkout engine (all-or-nothing multi-line decrements with group commit)
+import collections
+import threading
+
+from app import metrics as metrics_module
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class CheckoutRequest(object):
+
+    def __init__(self, lines, hold_ids=()):
+        self.lines = collections.OrderedDict(sorted(lines.items()))
+        self.hold_ids = list(hold_ids)
+        self.error = None
+        self.done = False
+
+
+class CheckoutEngine(object):
+
+    def __init__(self, stockist, max_batch=256):
+        self.stockist = stockist
+        self.max_batch = max_batch
+        self._queue = collections.deque()
+        self._queue_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self.commits = 0
+        self.checkouts = 0
+
+    def checkout(self, lines, hold_ids=()):
+        lines = dict((stock_id, quantity) for stock_id, quantity in lines.items() if quantity)
+        if any(quantity < 0 for quantity in lines.values()):
+            raise CheckoutError('Checkout quantities must be positive!')
+        request = CheckoutRequest(lines, hold_ids)
+        with self._queue_lock:
+            self._queue.append(request)
+        # group commit: whoever holds the commit lock drains everything queued
+        # behind it, so requests arriving under load share one transaction
+        with metrics_module.timed_lock(self._commit_lock, self.stockist.metrics, 'checkout'):
+            if not request.done:
+                self._drain()
+        if request.error is not None:
+            raise request.error
+        return request
+
+    def _drain(self):
+        while True:
+            with self._queue_lock:
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(self.max_batch, len(self._queue)))
+                ]
+            if not batch:
+                return
+            self._process(batch)
+
+    def _own_holds(self, request):
+        own = collections.defaultdict(int)
+        for hold_id in request.hold_ids:
+            hold = self.stockist.reservations.get(hold_id)
+            own[hold.stock_id] += hold.quantity
+        return own
+
+    def _validate(self, batch):
+        reservations = self.stockist.reservations
+        available = {}
+        accepted = []
+        for request in batch:
+            try:
+                own = self._own_holds(request)
+                for stock_id, quantity in request.lines.items():
+                    if stock_id not in available:
+                        available[stock_id] = (
+                            self.stockist[stock_id]['count'] - reservations.held(stock_id)
+                        )
+                    if available[stock_id] + own.get(stock_id, 0) < quantity:
+                        raise CheckoutError('Not enough stock for {0}!'.format(stock_id))
+            except Exception as error:
+                request.error = error
+                continue
+            for stock_id, quantity in request.lines.items():
+                available[stock_id] -= quantity - own.get(stock_id, 0)
+            accepted.append(request)
+        return accepted
+
+    def _commit(self, requests):
+        lines = collections.defaultdict(int)
+        for request in requests:
+            for stock_id, quantity in request.lines.items():
+                lines[stock_id] += quantity
+        self.stockist.decrement_stock(dict(lines))
+        self.commits += 1
+        for request in requests:
+            for hold_id in request.hold_ids:
+                self.stockist.reservations.release(hold_id)
+            self.checkouts += 1
+
+    def _process(self, batch):
+        # the book stays locked from validation until the holds are released,
+        # so no reserve() can promise stock this batch is about to take
+        with self.stockist.reservations.lock:
+            accepted = self._validate(batch)
+            if accepted:
+                try:
+                    self._commit(accepted)
+                except Exception:
+                    # the database disagreed with memory; retry one at a time so a
+                    # single bad checkout cannot fail the whole group
+                    for request in accepted:
+                        try:
+                            self._commit([request])
+                        except Exception as error:
+                            request.error = error
+        for request in batch:
+            request.done = True
@@ -1,7 +1,18 @@
 # click app exercising the various components
+import importlib
+import json
 import os
+import shutil
+import signal
+import tempfile
+import time
 import click
-from app import stockist
+from app import backends, stockist
+
+
+def load(name):
+    # command-specific modules are imported only by the commands that use them
+    return importlib.import_module('app.' + name)
 
 
 class Config(object):
@@ -15,11 +26,20 @@ class Config(object):
         self.default_debug = False
         self.default_silent = False
         self.default_lock = False
+        self.default_backend = "sqlite"
+        self.default_metrics = False
+        self.default_events = ""
         self._default_verbose_spec = bool
         self._default_debug_spec = bool
         self._default_silent_spec = bool
         self._default_database_spec = str
+        self._default_backend_spec = str
+        self._default_metrics_spec = bool
+        self._default_events_spec = str
         self.config = "~/.stockistconfig"
+        self.client = None
+        self.events = None
+        self.lock = False
     
     def __setattr__(self, name, value):
         spec = getattr(self, "_{}_spec".format(name), None)
@@ -40,8 +60,8 @@ class Config(object):
         try:
             with open(os.path.expanduser(self.config), 'r') as fh:
                 for line in fh.readlines():
-                    if line.startswith('default'):
-                        name, value = line.split('=')
+                    if line.startswith('default') and '=' in line:
+                        name, value = line.split('=', 1)
                         setattr(self, name, value.strip())
                         if self.debug:
                             click.secho('Set {0} to {1}.'.format(name, value), fg="cyan")
@@ -81,6 +101,60 @@ class Config(object):
 
 pass_config = click.make_pass_decorator(Config, ensure=True)
 
+# commands a running server can answer without loading the database
+SERVED_COMMANDS = ('stock', 'remove', 'delete', 'count')
+# commands that only touch the config file and never open a backend
+CONFIG_COMMANDS = ('set', 'reset', 'defaults')
+# read-only commands a database answers with one query, so they skip the full load
+QUERY_COMMANDS = ('listall', 'listname', 'low-stock')
+
+
+def forward(config, *words):
+    if config.client is None:
+        return False
+    shlex = importlib.import_module('shlex')
+    # the server's stock is shared, so --lock and --verbose travel per request
+    words += ('--lock' if config.lock else None, '--verbose' if config.verbose else None)
+    line = ' '.join(shlex.quote(str(word)) for word in words if word is not None)
+    try:
+        for output in config.client.request(line):
+            click.echo(output)
+    except load('batch').BatchError as error:
+        click.secho(str(error), fg="red")
+    return True
+
+
+def record_metrics(config, ctx):
+    # time the whole command and add this run to the database's metrics file
+    metrics = config.stock.enable_metrics()
+    command = ctx.invoked_subcommand or ''
+    start = time.perf_counter()
+
+    def save():
+        metrics.observe('command', command, time.perf_counter() - start)
+        try:
+            stockist.metrics_module.save_snapshot(
+                stockist.metrics_module.default_metrics_path(config.database),
+                metrics,
+            )
+        except (IOError, OSError, stockist.metrics_module.MetricsError) as error:
+            click.secho('Unable to save metrics: {0}'.format(error), fg="red")
+    ctx.call_on_close(save)
+
+
+def stream_events(config, ctx, path):
+    # threshold events from this run are appended to path as json lines
+    thresholds = config.stock.thresholds
+    sink = None
+    if path:
+        sink = thresholds.subscribe(load('events').JSONLSink(path))
+
+    def close():
+        thresholds.close()
+        if sink is not None:
+            sink.close()
+    ctx.call_on_close(close)
+
 
 @click.group()
 @click.option('--verbose', is_flag=True)
@@ -88,8 +162,11 @@ pass_config = click.make_pass_decorator(Config, ensure=True)
 @click.option('--silent', is_flag=True)
 @click.option('--database', default=None)
 @click.option('--lock', is_flag=True)
+@click.option('--no-server', is_flag=True)
+@click.option('--metrics', is_flag=True)
+@click.option('--events', default=None, help='Append threshold events to this jsonl file.')
 @pass_config
-def cli(config, verbose, debug, silent, database, lock):
+def cli(config, verbose, debug, silent, database, lock, no_server, metrics, events):
 
     config.initialise_defaults()
     if verbose or config.default_verbose:
@@ -98,11 +175,44 @@ def cli(config, verbose, debug, silent, database, lock):
     config.verbose = verbose | bool(config.default_verbose)
     config.debug = debug | bool(config.default_debug) 
     config.silent = silent | bool(config.default_silent)
-    config.stock = stockist.SQLiteStockist(database or config.default_database)
+    config.database = database or config.default_database
+    config.events = events or config.default_events
+    config.lock = lock | bool(config.default_lock)
+    if click.get_current_context().invoked_subcommand in CONFIG_COMMANDS:
+        return
+    if not no_server and click.get_current_context().invoked_subcommand in SERVED_COMMANDS:
+        server_module = load('server')
+        socket = server_module.default_socket_path(config.database)
+        config.client = server_module.connect(socket)
+        if config.client is not None:
+            if config.debug:
+                click.secho('Using server at {0}.'.format(socket), fg="cyan")
+            return
+    try:
+        config.stock = backends.create_stockist(config.default_backend, config.database)
+    except (backends.BackendError, stockist.storage_module.StorageError) as error:
+        click.secho(str(error), fg="red")
+        raise click.Abort()
+    if hasattr(config.stock, 'close'):
+        click.get_current_context().call_on_close(config.stock.close)
+    if metrics or config.default_metrics:
+        record_metrics(config, click.get_current_context())
+    queried = (
+        click.get_current_context().invoked_subcommand in QUERY_COMMANDS
+        and isinstance(config.stock, stockist.DatabaseStockist)
+    )
     try:
         config.stock.create_database()
-        config.stock.update_stock_from_db()
-        config.stock.stock_locked = lock | bool(config.default_lock)
+        if not queried:
+            config.stock.update_stock_from_db()
+            # keep the verification side table current once `verify` has created it
+            config.stock.enable_merkle(create=False)
+            # and record history once anything has started it
+            config.stock.enable_history(create=False)
+            config.stock.enable_locations(create=False)
+            if config.stock.enable_thresholds(create=False) is not None:
+                stream_events(config, click.get_current_context(), config.events)
+        config.stock.stock_locked = config.lock
     except stockist.StockError:
         click.secho('No database!', fg="red")
 
@@ -159,47 +269,240 @@ def defaults(config):
             click.echo('{0}: {1}'.format(default, getattr(config, default)))
 
 
+# kept here so the listing module is only imported when a listing is written
+LISTING_FORMATS = ('table', 'json', 'csv')
+
+
+def listing_options(command):
+    command = click.option('--format', 'output_format', type=click.Choice(LISTING_FORMATS), default='table')(command)
+    command = click.option('--offset', type=int, default=0)(command)
+    command = click.option('--limit', type=int, default=None)(command)
+    return command
+
+
+def write_listing(entries, output_format):
+    try:
+        load('listing').write_listing(entries, click.echo, output_format)
+    except load('query').QueryError as error:
+        click.secho(str(error), fg="red")
+
+
+@cli.command()
+@listing_options
+@pass_config
+def listall(config, limit, offset, output_format):
+    write_listing(
+        config.stock.iter_find(limit=limit, offset=offset, order_by='name'),
+        output_format,
+    )
+
+
 @cli.command()
+@click.option('--edges', default='1,10,100,1000')
 @pass_config
-def listall(config):
-    for name, mapping in config.stock.name_id_map.items():
-        click.echo()
-        click.echo('=' * 20)
-        click.echo(name)
-        click.echo('=' * 20)
-        for i, unique in sorted(mapping):
-            click.echo("> " + unique + ": " + str(config.stock[i]['count']))
-        click.echo('=' * 20)
-        click.echo()
+def summary(config, edges):
+    try:
+        edges = [int(edge) for edge in edges.split(',')]
+        histogram = config.stock.count_histogram(edges)
+    except (ValueError, load('aggregate').AggregateError):
+        click.secho('Invalid edges.', fg="red")
+        return
+    totals = config.stock.item_totals()
+    click.echo('{0:<20} {1:>8} {2:>10} {3:>8} {4:>8}'.format('item', 'batches', 'total', 'min', 'max'))
+    click.echo('=' * 58)
+    for row in totals:
+        click.echo('{0:<20} {1:>8} {2:>10} {3:>8} {4:>8}'.format(*row))
+    click.echo('=' * 58)
+    click.echo('{0:<20} {1:>8} {2:>10}'.format(
+        'all',
+        sum(row.batches for row in totals),
+        sum(row.total for row in totals),
+    ))
+    click.echo()
+    for bucket in histogram:
+        low = '' if bucket.low is None else bucket.low
+        high = '' if bucket.high is None else bucket.high
+        click.echo('{0:>8} .. {1:<8} {2}'.format(low, high, bucket.batches))
 
 
 @cli.command()
 @click.argument('name', default='')
+@listing_options
 @pass_config
-def listname(config, name):
-    if name in config.stock:
-        click.echo()
-        click.echo('=' * 20)
-        click.echo(name)
-        click.echo('=' * 20)
-        for stock in config.stock.stock_for_item(name):
-            click.echo("> " + stock['unique_name'] + ": " + str(stock['count']))
-        click.echo('=' * 20)
-        click.echo()
+def listname(config, name, limit, offset, output_format):
+    # asked of the database, since the stock is not loaded for listings
+    if config.stock.find(name_prefix=name + '_#', limit=1):
+        write_listing(
+            config.stock.iter_find(name_prefix=name + '_#', limit=limit, offset=offset),
+            output_format,
+        )
     else:
         click.secho('Not found.', fg="red")
 
 
+@cli.command()
+@click.option('--format', 'output_format', type=click.Choice(('table', 'prometheus', 'json')), default='table')
+@click.option('--reset', is_flag=True)
+@pass_config
+def stats(config, output_format, reset):
+    metrics_module = stockist.metrics_module
+    path = metrics_module.default_metrics_path(config.database)
+    if reset:
+        if os.path.exists(path):
+            os.unlink(path)
+        if config.verbose:
+            click.echo('Metrics reset.')
+        return
+    metrics = metrics_module.Metrics()
+    try:
+        snapshot = metrics_module.load_snapshot(path)
+        if snapshot is not None:
+            metrics.merge(snapshot)
+    except metrics_module.MetricsError as error:
+        click.secho(str(error), fg="red")
+        return
+    if output_format == 'prometheus':
+        click.echo(metrics.to_prometheus().rstrip('\n'))
+        return
+    if output_format == 'json':
+        click.echo(json.dumps(metrics.snapshot(), indent=2))
+        return
+    if snapshot is None:
+        click.secho('No metrics recorded, run commands with --metrics.', fg="red")
+        return
+    for (name, label), value in sorted(metrics.counters.items()):
+        click.echo('{0:<40} {1:>10}'.format(' '.join(filter(None, (name, label))), value))
+    click.echo()
+    click.echo('{0:<40} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+        'latency (ms)', 'count', 'mean', 'p50', 'p95', 'p99'
+    ))
+    click.echo('=' * 93)
+    for (family, label), histogram in sorted(metrics.histograms.items()):
+        click.echo('{0:<40} {1:>8} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>10.3f}'.format(
+            '{0} {1}'.format(family, label),
+            histogram.count,
+            histogram.mean * 1000,
+            histogram.quantile(0.5) * 1000,
+            histogram.quantile(0.95) * 1000,
+            histogram.quantile(0.99) * 1000,
+        ))
+
+
+@cli.command()
+@click.option('--repair', is_flag=True)
+@click.option('--source', type=click.Choice(('database', 'memory')), default='database')
+@pass_config
+def verify(config, repair, source):
+    try:
+        if config.stock.merkle is None:
+            config.stock.enable_merkle()
+        report = config.stock.verify()
+    except stockist.StockError:
+        click.secho('No database!', fg="red")
+        return
+    if not report:
+        click.echo('Memory and database agree.')
+        return
+    for low, high, differing in report:
+        if differing:
+            click.secho('{0}..{1}: {2} rows differ ({3})'.format(
+                low, high - 1, len(differing), ', '.join(str(stock_id) for stock_id in differing[:10])
+            ), fg="red")
+        else:
+            click.secho('{0}..{1}: stored digest is stale'.format(low, high - 1), fg="red")
+    if repair:
+        repaired = config.stock.repair(source)
+        click.echo('Repaired {0} ranges from {1}.'.format(len(repaired), source))
+
+
+@cli.command()
+@click.argument('name-or-id')
+@click.argument('level', type=int, required=False)
+@click.option('--clear', is_flag=True)
+@pass_config
+def threshold(config, name_or_id, level, clear):
+    try:
+        key = int(name_or_id)
+    except ValueError:
+        key = name_or_id
+    thresholds = config.stock.thresholds
+    try:
+        if thresholds is None:
+            thresholds = config.stock.enable_thresholds()
+            stream_events(config, click.get_current_context(), config.events)
+        if clear:
+            thresholds.clear_threshold(key)
+        elif level is None:
+            click.secho('Missing level.', fg="red")
+            return
+        else:
+            thresholds.set_threshold(key, level)
+    except stockist.thresholds_module.ThresholdError as error:
+        click.secho(str(error), fg="red")
+        return
+    except stockist.StockError:
+        click.secho('No database!', fg="red")
+        return
+    if config.verbose:
+        click.echo('Cleared.' if clear else 'Reorder below {0}.'.format(level))
+
+
+@cli.command()
+@click.option('--below', is_flag=True, help='Only thresholds the stock is under.')
+@pass_config
+def thresholds(config, below):
+    if config.stock.thresholds is None:
+        click.echo('No thresholds.')
+        return
+    if below:
+        for kind, target, count, level in config.stock.thresholds.below():
+            click.echo('> {0} {1}: {2} < {3}'.format(kind, target, count, level))
+        return
+    for kind, target, level in config.stock.thresholds.thresholds():
+        click.echo('> {0} {1}: {2}'.format(kind, target, level))
+
+
+@cli.command('low-stock')
+@click.argument('threshold', type=int)
+@click.option('--limit', type=int, default=None)
+@click.option('--prefix', default=None)
+@pass_config
+def low_stock(config, threshold, limit, prefix):
+    for stock in config.stock.iter_find(
+        count_lt=threshold,
+        name_prefix=prefix,
+        limit=limit,
+        order_by='count',
+    ):
+        click.echo("> " + stock['unique_name'] + ": " + str(stock['count']))
+
+
+def location_flag(location):
+    return None if location is None else '--location={0}'.format(location)
+
+
+def count_at(config, location):
+    # a batch's count, or its count at one location
+    if location is None:
+        return lambda stock: stock['count']
+    locations = config.stock.locations or config.stock.enable_locations()
+    return lambda stock: locations.count_at(stock['stock_id'], location)
+
+
 @cli.command()
 @click.argument('name-or-id')
+@click.option('--location', default=None)
 @pass_config
-def count(config, name_or_id):
+def count(config, name_or_id, location):
+    if forward(config, 'count', name_or_id, location_flag(location)):
+        return
+    counted = count_at(config, location)
     try:
         try:
-            click.echo(config.stock[int(name_or_id)]['count'])
+            click.echo(counted(config.stock[int(name_or_id)]))
         except ValueError:
             for stock in config.stock[name_or_id]:
-                click.echo("> " + stock['unique_name'] + ": " + str(stock['count']))
+                click.echo("> " + stock['unique_name'] + ": " + str(counted(stock)))
     except KeyError:
         click.secho('Not found.', fg="red")
 
@@ -208,30 +511,42 @@ def count(config, name_or_id):
 @click.argument('name-or-id')
 @click.argument('amount', default=1)
 @click.option('--create', is_flag=True)
+@click.option('--location', default=None)
 @pass_config
-def stock(config, name_or_id, amount, create):
+def stock(config, name_or_id, amount, create, location):
+    if forward(config, 'stock', name_or_id, amount, '--create' if create else None, location_flag(location)):
+        return
     try:
         amount = int(amount)
     except ValueError:
         click.secho('Invalid amount.', fg="red")
         return
+    counted = count_at(config, location)
     try:
         try:
-            i = config.stock.stock_item(item_id=int(name_or_id), amount=amount, create=create)
+            i = config.stock.stock_item(item_id=int(name_or_id), amount=amount, create=create, location=location)
         except ValueError:
-            i = config.stock.stock_item(item=name_or_id, amount=amount, create=create)
+            i = config.stock.stock_item(item=name_or_id, amount=amount, create=create, location=location)
     except stockist.StockLockedError:
         click.secho('Locked.', fg="red")
+        return
+    except stockist.locations_module.LocationError as error:
+        click.secho(str(error), fg="red")
+        return
     if config.verbose:
-        click.echo(config.stock[i]['unique_name'] + ": " + str(config.stock[i]['count']))
+        click.echo(config.stock[i]['unique_name'] + ": " + str(counted(config.stock[i])))
 
 
 @cli.command()
 @click.argument('name-or-id')
 @click.argument('amount', default=-1)
 @click.option('--delete-if-zero', is_flag=True)
+@click.option('--location', default=None)
 @pass_config
-def remove(config, name_or_id, amount, delete_if_zero=False):
+def remove(config, name_or_id, amount, delete_if_zero=False, location=None):
+    if forward(config, 'remove', name_or_id, amount, '--delete-if-zero' if delete_if_zero else None,
+               location_flag(location)):
+        return
     try:
         amount = abs(int(amount)) * -1
     except ValueError:
@@ -242,20 +557,74 @@ def remove(config, name_or_id, amount, delete_if_zero=False):
     except ValueError:
         key = config.stock.last_stock_id_for_item(name_or_id)
     if key is not None:
+        counted = count_at(config, location)
         try:
-            config.stock.increase_stock(key, amount)
+            if location is None:
+                config.stock.increase_stock(key, amount)
+            else:
+                config.stock.increase_stock_at(key, location, amount)
             if config.stock[key]['count'] < 1 and delete_if_zero:
                 del config.stock[key]
                 if config.verbose:
                     click.echo('Deleted.')
             elif config.verbose:
-                click.echo(config.stock[key]['unique_name'] + ": " + str(config.stock[key]['count']))
+                click.echo(config.stock[key]['unique_name'] + ": " + str(counted(config.stock[key])))
         except KeyError:
             click.secho('Not found.', fg="red")
         except stockist.StockLockedError:
             click.secho('Locked.', fg="red")
+        except stockist.locations_module.LocationError as error:
+            click.secho(str(error), fg="red")
     elif config.verbose:
         click.echo('Not present.')
+
+
+@cli.command()
+@click.argument('name-or-id')
+@click.argument('amount', type=int)
+@click.option('--from', 'source', default=lambda: load('locations').DEFAULT_LOCATION)
+@click.option('--to', 'destination', required=True)
+@pass_config
+def transfer(config, name_or_id, amount, source, destination):
+    try:
+        key = int(name_or_id)
+    except ValueError:
+        key = config.stock.last_stock_id_for_item(name_or_id)
+    if key is None:
+        click.secho('Not present.', fg="red")
+        return
+    if config.stock.locations is None:
+        config.stock.enable_locations()
+    try:
+        config.stock.transfer(key, source, destination, amount)
+    except KeyError:
+        click.secho('Not found.', fg="red")
+        return
+    except stockist.locations_module.LocationError as error:
+        click.secho(str(error), fg="red")
+        return
+    if config.verbose:
+        counts = config.stock.locations.counts(key)
+        click.echo('{0}: {1} at {2}, {3} at {4}'.format(
+            config.stock[key]['unique_name'], counts.get(source, 0), source,
+            counts.get(destination, 0), destination,
+        ))
+
+
+@cli.command()
+@click.option('--item', default=None, help='Totals for one item by location.')
+@pass_config
+def locations(config, item):
+    located = config.stock.locations
+    if located is None:
+        located = config.stock.enable_locations()
+    for location in located.locations():
+        if item is None:
+            total = located.location_totals[location]
+        else:
+            total = located.item_total(item, location)
+        click.echo('> {0}: {1}'.format(location, total))
+    click.echo('total: {0}'.format(located.total if item is None else located.item_total(item)))
     
 
 @cli.command()
@@ -263,6 +632,8 @@ def remove(config, name_or_id, amount, delete_if_zero=False):
 @click.option('--delete-all', is_flag=True)
 @pass_config
 def delete(config, name_or_id, delete_all=False):
+    if forward(config, 'delete', name_or_id, '--delete-all' if delete_all else None):
+        return
     try:
         key = int(name_or_id)
     except ValueError:
@@ -272,3 +643,190 @@ def delete(config, name_or_id, delete_all=False):
             del config.stock[key]
         except stockist.StockLockedError:
             click.secho('Locked.', fg="red")
+
+
+@cli.command()
+@click.option('--empty', is_flag=True, help='Delete entries with a count of zero.')
+@click.option('--item', default=None, help='Only delete entries of this item.')
+@pass_config
+def purge(config, empty, item):
+    if not empty and item is None:
+        click.secho('Nothing to purge.', fg="red")
+        return
+    try:
+        deleted = config.stock.delete_where(item=item, count_eq=0 if empty else None)
+    except stockist.StockLockedError:
+        click.secho('Locked.', fg="red")
+        return
+    if config.verbose:
+        click.echo('Purged {0} entries.'.format(len(deleted)))
+
+
+@cli.command()
+@click.argument('commands', type=click.File('r'))
+@click.option('--batch-size', default=1000)
+@pass_config
+def batch(config, commands, batch_size):
+    runner = load('batch').BatchRunner(config.stock)
+    for number, output, error in runner.run(commands, batch_size=max(1, batch_size)):
+        for line in output:
+            click.echo(line)
+        if error is not None:
+            click.secho('{0}: {1}'.format(number, error), fg="red", err=True)
+    click.secho(
+        '{0} lines, {1} errors in {2:.3f}s ({3:.0f} lines/s).'
+        .format(runner.lines, runner.errors, runner.elapsed, runner.throughput),
+        fg="cyan",
+        err=True
+    )
+
+
+@cli.command()
+@click.argument('feed', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', default=None, type=int, help='Parsing processes (defaults to the CPU count).')
+@click.option('--batch-size', default=50000)
+@pass_config
+def ingest(config, feed, workers, batch_size):
+    ingest_module = load('ingest')
+    runner = ingest_module.FeedIngest(config.stock, workers=workers, batch_size=max(1, batch_size))
+    try:
+        changed = runner.run(feed)
+    except ingest_module.IngestError as error:
+        click.secho(str(error), fg="red")
+        return
+    except stockist.StockLockedError:
+        click.secho('Locked.', fg="red")
+        return
+    for offset, error in runner.errors:
+        click.secho('byte {0}: {1}'.format(offset, error), fg="red", err=True)
+    click.secho(
+        '{0} rows, {1} rejected, {2} entries changed in {3:.3f}s ({4:.0f} rows/s).'
+        .format(runner.rows, runner.rejected, changed, runner.elapsed, runner.throughput),
+        fg="cyan",
+        err=True
+    )
+
+
+@cli.command()
+@click.option('--target', type=click.Choice(('memory', 'sqlite', 'cli')), default='sqlite')
+@click.option('--target-database', default=None)
+@click.option('--clients', default=8)
+@click.option('--operations', default=10000)
+@click.option('--items', default=1000)
+@click.option('--skew', default=1.1)
+@click.option('--mix', default='stock=20,remove=20,count=50,checkout=10')
+@click.option('--seed', default=0)
+@click.option('--trace', 'trace_path', default=None)
+@click.option('--replay', 'replay_path', default=None)
+@click.option('--json', 'as_json', is_flag=True)
+@pass_config
+def loadgen(config, target, target_database, clients, operations, items, skew, mix,
+            seed, trace_path, replay_path, as_json):
+    loadgen_module = load('loadgen')
+    try:
+        if replay_path is not None:
+            workload, entries = loadgen_module.load_trace(replay_path)
+        else:
+            workload = loadgen_module.Workload(
+                items=max(1, items),
+                mix=loadgen_module.parse_mix(mix),
+                skew=skew,
+                clients=max(1, clients),
+                seed=seed,
+            )
+            entries = list(workload.generate(operations))
+    except (IOError, OSError, loadgen_module.LoadError) as error:
+        click.secho(str(error), fg="red")
+        return
+    if trace_path is not None:
+        loadgen_module.save_trace(trace_path, workload, entries)
+    directory = tempfile.mkdtemp()
+    database = target_database or os.path.join(directory, 'loadgen.db')
+    try:
+        if target == 'memory':
+            driver = loadgen_module.StockistDriver(stockist.Stockist())
+        elif target == 'sqlite':
+            stock = backends.create_stockist('sqlite', database)
+            stock.reset_database()
+            driver = loadgen_module.StockistDriver(stock)
+        else:
+            driver = loadgen_module.CLIDriver(database)
+        driver.prepare(workload)
+        report = loadgen_module.run_load(driver, entries, workload.clients)
+    finally:
+        shutil.rmtree(directory)
+    if as_json:
+        click.echo(json.dumps(report, indent=2, sort_keys=True))
+        return
+    click.echo('{0:<10} {1:>8} {2:>8} {3:>10} {4:>10} {5:>10}'.format(
+        'operation', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'
+    ))
+    click.echo('=' * 61)
+    rows = sorted(report['operations'].items()) + [('total', report['total'])]
+    for op, row in rows:
+        click.echo('{0:<10} {1:>8} {2:>7.1%} {3:>10.3f} {4:>10.3f} {5:>10.3f}'.format(
+            op, row['operations'], row['error_rate'],
+            row['p50'] * 1000, row['p95'] * 1000, row['p99'] * 1000,
+        ))
+    click.echo()
+    click.echo('{0} operations from {1} clients in {2:.2f}s ({3:.0f} ops/s).'.format(
+        report['total']['operations'], workload.clients, report['elapsed'], report['throughput']
+    ))
+
+
+@cli.command()
+@click.option('--socket', 'path', default=None)
+@click.option('--shared-memory', 'shared_name', default=None,
+              help='Mirror counts into this shared memory segment for local readers.')
+@click.option('--poll', 'poll_interval', type=float, default=None,
+              help='Pick up changes other processes make to the database every SECONDS.')
+@pass_config
+def serve(config, path, shared_name, poll_interval):
+    try:
+        server = load('server').StockServer(
+            config.stock,
+            path or load('server').default_socket_path(config.database)
+        )
+    except load('batch').BatchError as error:
+        click.secho(str(error), fg="red")
+        return
+    if shared_name:
+        try:
+            config.stock.publish_shared(shared_name)
+        except (load('shared').SharedStockError, OSError) as error:
+            server.server_close()
+            click.secho(str(error), fg="red")
+            return
+    poller = None
+    if poll_interval is not None:
+        if not hasattr(config.stock, 'start_polling'):
+            server.server_close()
+            click.secho('Polling needs an SQLite database.', fg="red")
+            return
+        try:
+            poller = config.stock.start_polling(poll_interval, lock=server.lock)
+        except load('changes').ChangeError as error:
+            server.server_close()
+            click.secho(str(error), fg="red")
+            return
+    if config.verbose:
+        click.echo('Serving on {0}.'.format(server.path))
+        if shared_name:
+            click.echo('Publishing counts to {0}.'.format(shared_name))
+        if poller is not None:
+            click.echo('Polling for changes every {0}s.'.format(poll_interval))
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if poller is not None:
+            poller.stop()
+        server.server_close()
+        if config.stock.shared is not None:
+            config.stock.shared.close()
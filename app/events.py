@@ -0,0 +1,137 @@
+# event delivery (batched, off the write path, to callbacks and jsonl files)
+import json
+import os
+import queue
+import threading
+import time
+
+
+class EventError(Exception):
+    pass
+
+
+class EventDispatcher(object):
+
+    # publish() only enqueues; a daemon thread hands subscribers lists of events
+    def __init__(self, batch_size=256, max_pending=100000):
+        self.batch_size = batch_size
+        self.subscribers = []
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failures = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = 0
+        self._done = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def subscribe(self, subscriber):
+        # subscriber(events) is called with each batch, on the delivery thread
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._deliver_forever, name='stockist-events')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def publish(self, event):
+        if self._closed:
+            raise EventError('Dispatcher closed!')
+        if not self.subscribers:
+            return False
+        with self._done:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # a slow subscriber costs events, never write latency
+            with self._done:
+                self._pending -= 1
+                self.dropped += 1
+            return False
+        self.published += 1
+        self._start()
+        return True
+
+    def _deliver_forever(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            events = [event for event in batch if event is not None]
+            if events:
+                for subscriber in list(self.subscribers):
+                    try:
+                        subscriber(events)
+                    except Exception:
+                        # one failing subscriber must not starve the others
+                        self.failures += 1
+                self.delivered += len(events)
+            with self._done:
+                self._pending -= len(events)
+                self._done.notify_all()
+            if stop:
+                return
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._done:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._done.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+class JSONLSink(object):
+
+    # appends one json object per event, flushed once per batch
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._fh = None
+
+    def __call__(self, events):
+        if self._fh is None:
+            self._fh = open(self.path, 'a')
+        for event in events:
+            self._fh.write(json.dumps(as_dict(event), sort_keys=True) + '\n')
+        self._fh.flush()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def as_dict(event):
+    if hasattr(event, '_asdict'):
+        return dict(event._asdict())
+    return dict(event)
+
+
+def read_events(path):
+    with open(path, 'r') as fh:
+        try:
+            return [json.loads(line) for line in fh if line.strip()]
+        except ValueError:
+            raise EventError('Unreadable event file {0}!'.format(path))
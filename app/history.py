@@ -0,0 +1,221 @@
+# stock history (timestamped count deltas, materialized checkpoints, retention)
+import collections
+import time
+
+
+class HistoryError(Exception):
+    pass
+
+
+class StockHistory(object):
+
+    HISTORY_TABLE = "stock_history"
+    CHECKPOINT_TABLE = "stock_history_checkpoint"
+    CREATE_HISTORY_SQL_STRING = "CREATE TABLE IF NOT EXISTS {table}(pk INT, ts DOUBLE PRECISION, delta INT)"
+    CREATE_CHECKPOINT_SQL_STRING = "CREATE TABLE IF NOT EXISTS {table}(ts DOUBLE PRECISION, pk INT, count INT)"
+    CREATE_HISTORY_INDEX_SQL_STRING = "CREATE INDEX IF NOT EXISTS {table}_pk_ts ON {table}(pk, ts)"
+    CREATE_CHECKPOINT_INDEX_SQL_STRING = "CREATE INDEX IF NOT EXISTS {table}_ts_pk ON {table}(ts, pk)"
+    DROP_SQL_STRING = "DROP TABLE IF EXISTS {table}"
+    INSERT_DELTA_SQL_STRING = "INSERT INTO {table} VALUES({p}, {p}, {p})"
+    INSERT_CHECKPOINT_SQL_STRING = "INSERT INTO {table} VALUES({p}, {p}, {p})"
+    # checkpoints carry a sentinel row with a NULL pk so an all-zero checkpoint
+    # still exists; its count is 1 when older history has been discarded
+    LATEST_CHECKPOINT_SQL_STRING = "SELECT MAX(ts) FROM {table} WHERE pk IS NULL AND ts <= {p}"
+    HORIZON_SQL_STRING = "SELECT MAX(ts) FROM {table} WHERE pk IS NULL AND count = 1"
+    CHECKPOINT_COUNT_SQL_STRING = "SELECT count FROM {table} WHERE ts = {p} AND pk = {p}"
+    CHECKPOINT_TOTALS_SQL_STRING = "SELECT pk, count FROM {table} WHERE ts = {p} AND pk IS NOT NULL"
+    DELTA_SUM_SQL_STRING = "SELECT SUM(delta) FROM {table} WHERE pk = {p} AND ts > {p} AND ts <= {p}"
+    DELTA_TOTALS_SQL_STRING = (
+        "SELECT pk, SUM(delta) FROM {table} WHERE ts > {p} AND ts <= {p} GROUP BY pk"
+    )
+    DELTA_RANGE_SQL_STRING = "SELECT pk, ts, delta FROM {table} WHERE ts > {p} AND ts < {p}"
+    DELETE_DELTAS_BEFORE_SQL_STRING = "DELETE FROM {table} WHERE ts <= {p}"
+    DELETE_DELTA_RANGE_SQL_STRING = "DELETE FROM {table} WHERE ts > {p} AND ts < {p}"
+    DELETE_CHECKPOINTS_BEFORE_SQL_STRING = "DELETE FROM {table} WHERE ts < {p}"
+    DELETE_CHECKPOINT_RANGE_SQL_STRING = "DELETE FROM {table} WHERE ts > {p} AND ts < {p}"
+
+    def __init__(self, stockist, checkpoint_every=1000, clock=time.time):
+        if stockist.PLACEHOLDER is None:
+            raise NotImplementedError
+        self.stockist = stockist
+        self.checkpoint_every = checkpoint_every
+        self.clock = clock
+        self._since_checkpoint = 0
+
+    def sql(self, template, table):
+        return template.format(table=table, p=self.stockist.PLACEHOLDER)
+
+    @property
+    def connection(self):
+        return self.stockist.connection
+
+    def create_tables(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.CREATE_HISTORY_SQL_STRING, self.HISTORY_TABLE))
+            cur.execute(self.sql(self.CREATE_CHECKPOINT_SQL_STRING, self.CHECKPOINT_TABLE))
+            cur.execute(self.sql(self.CREATE_HISTORY_INDEX_SQL_STRING, self.HISTORY_TABLE))
+            cur.execute(self.sql(self.CREATE_CHECKPOINT_INDEX_SQL_STRING, self.CHECKPOINT_TABLE))
+            connection.commit()
+
+    def reset(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.DROP_SQL_STRING, self.HISTORY_TABLE))
+            cur.execute(self.sql(self.DROP_SQL_STRING, self.CHECKPOINT_TABLE))
+            connection.commit()
+        self._since_checkpoint = 0
+        self.create_tables()
+
+    def record(self, cur, stock_id, delta, ts=None):
+        if not delta:
+            return
+        cur.execute(
+            self.sql(self.INSERT_DELTA_SQL_STRING, self.HISTORY_TABLE),
+            (stock_id, self.clock() if ts is None else ts, delta)
+        )
+        self._since_checkpoint += 1
+
+    def record_many(self, cur, deltas, ts=None):
+        ts = self.clock() if ts is None else ts
+        rows = [(stock_id, ts, delta) for stock_id, delta in deltas if delta]
+        cur.executemany(self.sql(self.INSERT_DELTA_SQL_STRING, self.HISTORY_TABLE), rows)
+        self._since_checkpoint += len(rows)
+
+    def maybe_checkpoint(self):
+        if self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _latest_checkpoint(self, cur, t):
+        cur.execute(self.sql(self.LATEST_CHECKPOINT_SQL_STRING, self.CHECKPOINT_TABLE), (t,))
+        row = cur.fetchone()
+        return None if row is None else row[0]
+
+    def _horizon(self, cur):
+        cur.execute(self.sql(self.HORIZON_SQL_STRING, self.CHECKPOINT_TABLE))
+        row = cur.fetchone()
+        return float('-inf') if row is None or row[0] is None else row[0]
+
+    def _check_horizon(self, cur, t):
+        horizon = self._horizon(cur)
+        if t < horizon:
+            raise HistoryError('History before {0} has been discarded!'.format(horizon))
+
+    def _count_at(self, cur, stock_id, t):
+        base_ts = self._latest_checkpoint(cur, t)
+        count = 0
+        if base_ts is None:
+            base_ts = float('-inf')
+        else:
+            cur.execute(
+                self.sql(self.CHECKPOINT_COUNT_SQL_STRING, self.CHECKPOINT_TABLE),
+                (base_ts, stock_id)
+            )
+            row = cur.fetchone()
+            count = row[0] if row is not None else 0
+        cur.execute(
+            self.sql(self.DELTA_SUM_SQL_STRING, self.HISTORY_TABLE),
+            (stock_id, base_ts, t)
+        )
+        return count + (cur.fetchone()[0] or 0)
+
+    def count_at(self, stock_id, t):
+        with self.connection as connection:
+            cur = connection.cursor()
+            self._check_horizon(cur, t)
+            return self._count_at(cur, stock_id, t)
+
+    def reconcile(self, cur, counts, ts=None):
+        # writers that keep no history still change counts, so record whatever
+        # separates the reconstructed count from the one the table holds
+        ts = self.clock() if ts is None else ts
+        self.record_many(cur, [
+            (stock_id, count - self._count_at(cur, stock_id, ts))
+            for stock_id, count in counts.items()
+        ], ts=ts)
+
+    def _totals_at(self, cur, t):
+        base_ts = self._latest_checkpoint(cur, t)
+        totals = collections.defaultdict(int)
+        if base_ts is None:
+            base_ts = float('-inf')
+        else:
+            cur.execute(
+                self.sql(self.CHECKPOINT_TOTALS_SQL_STRING, self.CHECKPOINT_TABLE),
+                (base_ts,)
+            )
+            for stock_id, count in cur.fetchall():
+                totals[stock_id] += count
+        cur.execute(self.sql(self.DELTA_TOTALS_SQL_STRING, self.HISTORY_TABLE), (base_ts, t))
+        for stock_id, delta in cur.fetchall():
+            totals[stock_id] += delta
+        return dict((stock_id, count) for stock_id, count in totals.items() if count)
+
+    def totals_at(self, t):
+        with self.connection as connection:
+            cur = connection.cursor()
+            self._check_horizon(cur, t)
+            return self._totals_at(cur, t)
+
+    def _write_checkpoint(self, cur, t, horizon=False, totals=None):
+        insert = self.sql(self.INSERT_CHECKPOINT_SQL_STRING, self.CHECKPOINT_TABLE)
+        if totals is None:
+            totals = self._totals_at(cur, t)
+        cur.execute(insert, (t, None, int(horizon)))
+        cur.executemany(insert, [(t, stock_id, count) for stock_id, count in totals.items()])
+
+    def checkpoint(self, t=None, totals=None):
+        # totals, as {pk: count}, replace the reconstructed ones (a baseline)
+        t = self.clock() if t is None else t
+        with self.connection as connection:
+            cur = connection.cursor()
+            self._write_checkpoint(cur, t, totals=totals)
+            connection.commit()
+        self._since_checkpoint = 0
+        return t
+
+    def apply_retention(self, raw_for, bucket, keep_for=None, now=None):
+        now = self.clock() if now is None else now
+        with self.connection as connection:
+            cur = connection.cursor()
+            horizon = self._horizon(cur)
+            if keep_for is not None and now - keep_for > horizon:
+                # fold everything older than the horizon into one checkpoint
+                horizon = now - keep_for
+                self._write_checkpoint(cur, horizon, horizon=True)
+                cur.execute(
+                    self.sql(self.DELETE_DELTAS_BEFORE_SQL_STRING, self.HISTORY_TABLE),
+                    (horizon,)
+                )
+                cur.execute(
+                    self.sql(self.DELETE_CHECKPOINTS_BEFORE_SQL_STRING, self.CHECKPOINT_TABLE),
+                    (horizon,)
+                )
+            # downsample deltas older than the raw window into bucket sums; the
+            # cutoff is bucket aligned so no delta moves past a kept checkpoint
+            cutoff = (now - raw_for) // bucket * bucket
+            if cutoff > horizon:
+                cur.execute(
+                    self.sql(self.DELTA_RANGE_SQL_STRING, self.HISTORY_TABLE),
+                    (horizon, cutoff)
+                )
+                buckets = collections.defaultdict(int)
+                for stock_id, ts, delta in cur.fetchall():
+                    buckets[(stock_id, (ts // bucket + 1) * bucket)] += delta
+                cur.execute(
+                    self.sql(self.DELETE_DELTA_RANGE_SQL_STRING, self.HISTORY_TABLE),
+                    (horizon, cutoff)
+                )
+                cur.execute(
+                    self.sql(self.DELETE_CHECKPOINT_RANGE_SQL_STRING, self.CHECKPOINT_TABLE),
+                    (horizon, cutoff)
+                )
+                cur.executemany(
+                    self.sql(self.INSERT_DELTA_SQL_STRING, self.HISTORY_TABLE),
+                    [
+                        (stock_id, ts, delta)
+                        for (stock_id, ts), delta in sorted(buckets.items())
+                        if delta
+                    ]
+                )
+            connection.commit()
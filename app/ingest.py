@@ -0,0 +1,174 @@
+# parallel feed ingest (byte-range parsing in a process pool, one writer)
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+from app import stockist
+from app import vectorized
+
+
+# each feed line is <item>,<amount>; an optional first line is this header
+HEADER = b'item,amount'
+# rejected rows reported per chunk, the rest are only counted
+MAX_ERRORS = 10
+
+
+class IngestError(Exception):
+    pass
+
+
+def split_ranges(path, parts):
+    # byte ranges of roughly equal size, each starting at the start of a line
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as fh:
+        for part in range(1, parts):
+            offset = size * part // parts
+            if offset <= bounds[-1]:
+                continue
+            fh.seek(offset - 1)
+            fh.readline()
+            if bounds[-1] < fh.tell() < size:
+                bounds.append(fh.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def parse_line(line):
+    name, comma, amount = line.strip().rpartition(b',')
+    if not comma:
+        raise IngestError('Expected item,amount.')
+    try:
+        name = name.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        raise IngestError('Invalid utf-8 in item name.')
+    if not name or '_#' in name:
+        raise IngestError('Invalid item name {0!r}.'.format(name))
+    try:
+        return name, int(amount)
+    except ValueError:
+        raise IngestError('Invalid amount {0!r}.'.format(amount.decode('utf-8', 'replace')))
+
+
+def parse_range(task):
+    # runs in a worker process; only the per-item totals travel back
+    path, start, end = task
+    totals = {}
+    rows = rejected = 0
+    errors = []
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        position = start
+        for line in fh:
+            offset, position = position, position + len(line)
+            if offset >= end:
+                break
+            if not line.strip() or line.startswith(b'#') or (offset == 0 and line.strip() == HEADER):
+                continue
+            try:
+                name, amount = parse_line(line)
+            except IngestError as error:
+                rejected += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append((offset, str(error)))
+                continue
+            rows += 1
+            totals[name] = totals.get(name, 0) + amount
+    return totals, rows, rejected, errors
+
+
+class FeedIngest(object):
+
+    def __init__(self, stock, workers=None, chunks_per_worker=4, batch_size=50000):
+        self.stock = stock
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # a few chunks per worker so one slow range does not hold the rest
+        self.chunks_per_worker = chunks_per_worker
+        self.batch_size = batch_size
+        self.rows = 0
+        self.rejected = 0
+        self.errors = []
+        self.parse_elapsed = 0.0
+        self.apply_elapsed = 0.0
+
+    def tasks(self, path):
+        return [(path, start, end) for start, end in split_ranges(path, self.workers * self.chunks_per_worker)]
+
+    def parse(self, path):
+        start = time.perf_counter()
+        tasks = self.tasks(path)
+        if self.workers == 1:
+            totals = self.merge(map(parse_range, tasks))
+        else:
+            # spawned workers do not inherit the writer's connection or threads
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            ) as pool:
+                totals = self.merge(pool.map(parse_range, tasks))
+        self.parse_elapsed = time.perf_counter() - start
+        return totals
+
+    def merge(self, results):
+        totals = {}
+        for chunk_totals, rows, rejected, errors in results:
+            for name, amount in chunk_totals.items():
+                totals[name] = totals.get(name, 0) + amount
+            self.rows += rows
+            self.rejected += rejected
+            self.errors.extend(errors)
+        self.errors.sort()
+        return totals
+
+    def plan(self, totals):
+        # everything is checked before the first write, so a bad feed changes nothing
+        changes, new_items = [], []
+        for name in sorted(totals):
+            amount = totals[name]
+            if not amount:
+                continue
+            stock_id = self.stock.last_stock_id_for_item(name)
+            count = 0 if stock_id is None else self.stock.stock[stock_id].get('count', 0)
+            if count + amount < 0:
+                raise IngestError('Feed makes stock negative for {0}!'.format(name))
+            if stock_id is None:
+                new_items.append(name)
+            changes.append((name, stock_id, amount))
+        return changes, new_items
+
+    def apply(self, totals):
+        if self.stock.is_locked:
+            raise stockist.StockLockedError
+        start = time.perf_counter()
+        changes, new_items = self.plan(totals)
+        created = {}
+        # numpy is an optional extra; without it each row is a plain increase
+        bulk = vectorized.numpy_available()
+        for first in range(0, len(changes), self.batch_size):
+            with self.stock.transaction():
+                if not first:
+                    # new items commit with the first deltas, never on their own
+                    for name in new_items:
+                        created[name] = self.stock.new_stock_item(name)
+                chunk = [
+                    (created[name] if stock_id is None else stock_id, amount)
+                    for name, stock_id, amount in changes[first:first + self.batch_size]
+                ]
+                if bulk:
+                    self.stock.apply_deltas([stock_id for stock_id, _ in chunk], [amount for _, amount in chunk])
+                else:
+                    for stock_id, amount in chunk:
+                        self.stock.increase_stock(stock_id, amount)
+        self.apply_elapsed = time.perf_counter() - start
+        return len(changes)
+
+    def run(self, path):
+        return self.apply(self.parse(path))
+
+    @property
+    def elapsed(self):
+        return self.parse_elapsed + self.apply_elapsed
+
+    @property
+    def throughput(self):
+        return (self.rows + self.rejected) / self.elapsed if self.elapsed else 0.0
@@ -1,9 +1,95 @@
+# items and the interning catalog (compact, hash-cached, integer keyed)
 
 
 class Item(object):
 
-    def __init__(self, identifier):
-        self.identifier = identifier
+    __slots__ = ('_identifier', '_name', '_hash', 'key', 'sku', 'price')
+
+    def __init__(self, identifier, key=None, sku=None, price=None):
+        self._identifier = identifier
+        self._name = str(identifier)
+        self._hash = hash(self._name)
+        self.key = key
+        self.sku = sku
+        self.price = price
+
+    @property
+    def identifier(self):
+        return self._identifier
+
+    @property
+    def name(self):
+        return self._name
 
     def __str__(self):
-        return str(self.identifier)
\ No newline at end of file
+        return self._name
+
+    def __repr__(self):
+        return 'Item({0!r})'.format(self._identifier)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        # hashes and compares like its name so it can index name-keyed maps
+        if isinstance(other, Item):
+            return self._name == other._name
+        if isinstance(other, str):
+            return self._name == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+
+class ItemCatalog(object):
+
+    def __init__(self):
+        self._by_name = {}
+        self._by_key = []
+        self._by_sku = {}
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def __iter__(self):
+        return iter(self._by_key)
+
+    def __contains__(self, item):
+        return self.name_of(item) in self._by_name
+
+    def __getitem__(self, key):
+        return self._by_key[key]
+
+    @staticmethod
+    def name_of(item):
+        if item.__class__ is str:
+            return item
+        if isinstance(item, Item):
+            return item.name
+        return str(item)
+
+    def get(self, item, default=None):
+        return self._by_name.get(self.name_of(item), default)
+
+    def by_sku(self, sku):
+        return self._by_sku.get(sku)
+
+    def intern(self, item, sku=None, price=None):
+        interned = self._by_name.get(self.name_of(item))
+        if interned is None:
+            identifier = item.identifier if isinstance(item, Item) else item
+            interned = Item(identifier, key=len(self._by_key))
+            if isinstance(item, Item):
+                interned.sku, interned.price = item.sku, item.price
+            self._by_name[interned.name] = interned
+            self._by_key.append(interned)
+        if sku is not None:
+            self._by_sku.pop(interned.sku, None)
+            interned.sku = sku
+        if price is not None:
+            interned.price = price
+        if interned.sku is not None:
+            self._by_sku[interned.sku] = interned
+        return interned
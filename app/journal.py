@@ -0,0 +1,139 @@
+# append-only mutation journal (length-prefixed records, checkpoints, replay)
+import os
+import struct
+import zlib
+
+
+OP_NEW = 1
+OP_INCREASE = 2
+OP_DELETE = 3
+OP_ENTRY = 4
+OP_CHECKPOINT = 5
+
+# every record is framed as <length><crc32><payload>
+FRAME = struct.Struct('>II')
+# payload header is <sequence><op><stock id><value> followed by a utf-8 name
+RECORD = struct.Struct('>QBqq')
+
+
+class JournalError(Exception):
+    pass
+
+
+def encode_record(seq, op, stock_id, value=0, name=''):
+    payload = RECORD.pack(seq, op, stock_id, value) + name.encode('utf-8')
+    return FRAME.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def read_records(fh):
+    while True:
+        frame = fh.read(FRAME.size)
+        if len(frame) < FRAME.size:
+            return
+        length, crc = FRAME.unpack(frame)
+        payload = fh.read(length)
+        if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+            # torn tail from a crash mid-write, everything before it is valid
+            return
+        seq, op, stock_id, value = RECORD.unpack_from(payload)
+        yield seq, op, stock_id, value, payload[RECORD.size:].decode('utf-8')
+
+
+class Journal(object):
+
+    def __init__(self, path, sync_every=64, checkpoint_every=10000):
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.sync_every = sync_every
+        self.checkpoint_every = checkpoint_every
+        self._pending = 0
+        self._since_checkpoint = 0
+        self._seq = self._last_sequence()
+        self._fh = open(self.path, 'ab')
+
+    def _last_sequence(self):
+        seq = self.snapshot_sequence
+        if os.path.exists(self.path):
+            with open(self.path, 'r+b') as fh:
+                valid_end = 0
+                for record in read_records(fh):
+                    seq = max(seq, record[0])
+                    self._since_checkpoint += 1
+                    valid_end = fh.tell()
+                # drop any torn tail so new records are not appended after it
+                fh.truncate(valid_end)
+        return seq
+
+    @property
+    def snapshot_sequence(self):
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, 'rb') as fh:
+            for seq, op, _, _, _ in read_records(fh):
+                if op != OP_CHECKPOINT:
+                    raise JournalError('Snapshot has no checkpoint header!')
+                return seq
+        return 0
+
+    @property
+    def needs_checkpoint(self):
+        return bool(self.checkpoint_every) and self._since_checkpoint >= self.checkpoint_every
+
+    def append(self, op, stock_id, value=0, name=''):
+        if self._fh is None:
+            raise JournalError('Journal is closed!')
+        self._seq += 1
+        self._fh.write(encode_record(self._seq, op, stock_id, value, name))
+        self._pending += 1
+        self._since_checkpoint += 1
+        if self._pending >= self.sync_every:
+            self.sync()
+        return self._seq
+
+    def sync(self):
+        if self._fh is None or not self._pending:
+            return
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._pending = 0
+
+    def checkpoint(self, stock_entries):
+        self.sync()
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as fh:
+            fh.write(encode_record(self._seq, OP_CHECKPOINT, 0))
+            for data in stock_entries:
+                fh.write(encode_record(
+                    self._seq, OP_ENTRY, data['stock_id'],
+                    data.get('count', 0), data['unique_name'],
+                ))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # records up to the snapshot sequence are skipped on replay, so a
+        # crash before this truncate still recovers correctly
+        self._fh.close()
+        self._fh = open(self.path, 'wb')
+        self._since_checkpoint = 0
+
+    def replay(self):
+        self.sync()
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as fh:
+                for seq, op, stock_id, value, name in read_records(fh):
+                    if op == OP_CHECKPOINT:
+                        snapshot_seq = seq
+                    else:
+                        yield op, stock_id, value, name
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as fh:
+                for seq, op, stock_id, value, name in read_records(fh):
+                    if seq > snapshot_seq:
+                        yield op, stock_id, value, name
+
+    def close(self):
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
@@ -0,0 +1,87 @@
+# streaming stock listings (table, csv or json, written in buffered chunks)
+import csv
+import io
+import json
+
+
+FIELDS = ('stock_id', 'item', 'unique_name', 'count')
+
+
+def item_name(unique_name):
+    return unique_name.split('_#', 1)[0]
+
+
+def listing_rows(entries):
+    for data in entries:
+        yield {
+            'stock_id': data['stock_id'],
+            'item': item_name(data['unique_name']),
+            'unique_name': data['unique_name'],
+            'count': data.get('count', 0),
+        }
+
+
+def format_table(rows):
+    # rows arrive sorted by name, so each item's batches are contiguous
+    current = None
+    for row in rows:
+        if row['item'] != current:
+            if current is not None:
+                yield '=' * 20
+                yield ''
+            current = row['item']
+            yield ''
+            yield '=' * 20
+            yield current
+            yield '=' * 20
+        yield '> {0}: {1}'.format(row['unique_name'], row['count'])
+    if current is not None:
+        yield '=' * 20
+        yield ''
+
+
+def format_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS, lineterminator='\n')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 8192:
+            yield buffer.getvalue()[:-1]
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()[:-1]
+
+
+def format_json(rows):
+    # one array, written as rows arrive; the comma goes on the previous row
+    # so nothing has to be held back beyond a single row
+    yield '['
+    previous = None
+    for row in rows:
+        if previous is not None:
+            yield '  ' + json.dumps(previous, sort_keys=True) + ','
+        previous = row
+    if previous is not None:
+        yield '  ' + json.dumps(previous, sort_keys=True)
+    yield ']'
+
+
+FORMATTERS = {
+    'table': format_table,
+    'json': format_json,
+    'csv': format_csv,
+}
+
+
+def write_listing(entries, echo, output_format='table', buffer_lines=1000):
+    lines = FORMATTERS[output_format](listing_rows(entries))
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= buffer_lines:
+            echo('\n'.join(chunk))
+            chunk = []
+    if chunk:
+        echo('\n'.join(chunk))
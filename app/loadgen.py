@@ -0,0 +1,269 @@
+# synthetic load (zipf item popularity, concurrent clients, replayable traces)
+import bisect
+import json
+import os
+import random
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+
+DEFAULT_MIX = (('stock', 20), ('remove', 20), ('count', 50), ('checkout', 10))
+SUMMARY_PATTERN = re.compile(r'(\d+) lines, (\d+) errors')
+
+
+class LoadError(Exception):
+    pass
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(','):
+        op, _, weight = part.partition('=')
+        if op not in dict(DEFAULT_MIX):
+            raise LoadError('Unknown operation {0}.'.format(op))
+        try:
+            mix.append((op, float(weight)))
+        except ValueError:
+            raise LoadError('Invalid weight for {0}.'.format(op))
+    if not any(weight > 0 for _, weight in mix):
+        raise LoadError('The operation mix needs a positive weight.')
+    return tuple(mix)
+
+
+def cumulative(weights):
+    total, bounds = 0.0, []
+    for weight in weights:
+        total += weight
+        bounds.append(total)
+    return bounds
+
+
+def item_name(rank):
+    return 'sku-{0}'.format(rank)
+
+
+class Workload(object):
+
+    def __init__(self, items=1000, mix=DEFAULT_MIX, skew=1.1, clients=8,
+                 initial=1000, max_amount=5, max_lines=4, seed=0):
+        self.items = items
+        self.mix = tuple(mix)
+        self.skew = skew
+        self.clients = clients
+        self.initial = initial
+        self.max_amount = max_amount
+        self.max_lines = max_lines
+        self.seed = seed
+        # rank r is picked with weight 1 / (r + 1) ** skew
+        self._popularity = cumulative(1.0 / (rank + 1) ** skew for rank in range(items))
+        self._ops = cumulative(weight for _, weight in self.mix)
+
+    @property
+    def header(self):
+        return {
+            'items': self.items,
+            'mix': [list(pair) for pair in self.mix],
+            'skew': self.skew,
+            'clients': self.clients,
+            'initial': self.initial,
+            'seed': self.seed,
+        }
+
+    def pick(self, rng, bounds):
+        return min(bisect.bisect_left(bounds, rng.random() * bounds[-1]), len(bounds) - 1)
+
+    def item(self, rng):
+        return item_name(self.pick(rng, self._popularity))
+
+    def generate(self, operations):
+        rng = random.Random(self.seed)
+        for number in range(operations):
+            op = self.mix[self.pick(rng, self._ops)][0]
+            entry = {'client': number % self.clients, 'op': op}
+            if op == 'checkout':
+                entry['lines'] = dict(
+                    (self.item(rng), rng.randint(1, self.max_amount))
+                    for _ in range(rng.randint(1, self.max_lines))
+                )
+            else:
+                entry['item'] = self.item(rng)
+                if op != 'count':
+                    entry['amount'] = rng.randint(1, self.max_amount)
+            yield entry
+
+
+def save_trace(path, workload, operations):
+    with open(path, 'w') as fh:
+        fh.write(json.dumps(workload.header, sort_keys=True) + '\n')
+        for entry in operations:
+            fh.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def load_trace(path):
+    with open(path, 'r') as fh:
+        try:
+            header = json.loads(fh.readline())
+            workload = Workload(
+                items=header['items'],
+                mix=[tuple(pair) for pair in header['mix']],
+                skew=header['skew'],
+                clients=header['clients'],
+                initial=header['initial'],
+                seed=header['seed'],
+            )
+            return workload, [json.loads(line) for line in fh if line.strip()]
+        except (ValueError, KeyError, TypeError):
+            raise LoadError('Unreadable trace {0}.'.format(path))
+
+
+class StockistDriver(object):
+
+    # commands run one at a time against the stockist, as the server does
+    def __init__(self, stock):
+        self.stock = stock
+        self.lock = threading.Lock()
+
+    def prepare(self, workload):
+        with self.stock.transaction():
+            for rank in range(workload.items):
+                self.stock.stock_item(item=item_name(rank), amount=workload.initial)
+
+    def stock_id(self, name):
+        stock_id = self.stock.last_stock_id_for_item(name)
+        if stock_id is None:
+            raise LoadError('Not present.')
+        return stock_id
+
+    def execute(self, entry):
+        with self.lock:
+            op = entry['op']
+            if op == 'stock':
+                self.stock.stock_item(item=entry['item'], amount=entry['amount'])
+            elif op == 'remove':
+                self.stock.increase_stock(self.stock_id(entry['item']), -entry['amount'])
+            elif op == 'count':
+                self.stock[entry['item']]
+            else:
+                self.stock.checkout_engine.checkout(dict(
+                    (self.stock_id(name), quantity) for name, quantity in entry['lines'].items()
+                ))
+
+
+class CLIDriver(object):
+
+    # every operation is a fresh `stockist batch -` process, cold start included
+    def __init__(self, database):
+        self.database = database
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.environment = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, (root, os.environ.get('PYTHONPATH')))
+        ))
+        self.command = [
+            sys.executable, '-c', 'from app.cli import cli; cli()',
+            '--database', database, '--no-server', 'batch', '-',
+        ]
+
+    def run(self, lines):
+        process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self.environment,
+            universal_newlines=True,
+        )
+        _, errors = process.communicate('\n'.join(lines) + '\n')
+        match = SUMMARY_PATTERN.search(errors)
+        if process.returncode or match is None:
+            raise LoadError('stockist exited with {0}.'.format(process.returncode))
+        if int(match.group(2)):
+            raise LoadError(errors.splitlines()[0])
+
+    def prepare(self, workload):
+        self.run([
+            'stock {0} {1}'.format(shlex.quote(item_name(rank)), workload.initial)
+            for rank in range(workload.items)
+        ])
+
+    def execute(self, entry):
+        op = entry['op']
+        if op == 'checkout':
+            # the cli has no checkout, so the lines become removes in one process
+            self.run([
+                'remove {0} {1}'.format(shlex.quote(name), quantity)
+                for name, quantity in sorted(entry['lines'].items())
+            ])
+        elif op == 'count':
+            self.run(['count {0}'.format(shlex.quote(entry['item']))])
+        else:
+            self.run(['{0} {1} {2}'.format(op, shlex.quote(entry['item']), entry['amount'])])
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def summarise(latencies, errors):
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        'operations': total,
+        'errors': errors,
+        'error_rate': errors / float(total) if total else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def run_load(driver, operations, clients):
+    queues = [[] for _ in range(clients)]
+    for entry in operations:
+        queues[entry['client'] % clients].append(entry)
+    samples = []
+    samples_lock = threading.Lock()
+
+    def client(entries):
+        mine = []
+        for entry in entries:
+            start = time.perf_counter()
+            try:
+                driver.execute(entry)
+                error = None
+            except Exception as failure:
+                # failed operations are part of the load, not a reason to stop
+                error = failure
+            mine.append((entry['op'], time.perf_counter() - start, error))
+        with samples_lock:
+            samples.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(entries,)) for entries in queues]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    by_op = {}
+    for op, latency, error in samples:
+        latencies, errors = by_op.setdefault(op, ([], [0]))
+        latencies.append(latency)
+        errors[0] += error is not None
+    report = {
+        'elapsed': elapsed,
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'total': summarise(
+            [latency for _, latency, _ in samples],
+            sum(1 for _, _, error in samples if error is not None),
+        ),
+        'operations': dict(
+            (op, summarise(latencies, errors[0])) for op, (latencies, errors) in by_op.items()
+        ),
+    }
+    return report
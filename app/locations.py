@@ -0,0 +1,221 @@
+# multi-location stock (per-location counts with incrementally kept rollups)
+import collections
+
+
+DEFAULT_LOCATION = 'default'
+
+
+class LocationError(Exception):
+    pass
+
+
+def item_of(unique_name):
+    return unique_name.split('_#')[0]
+
+
+class StockLocations(object):
+
+    # a batch's count stays the total over its locations; only explicit
+    # locations are stored, whatever is left unplaced is at DEFAULT_LOCATION,
+    # so code that knows nothing of locations keeps working on the default
+    LOCATION_TABLE = "stock_locations"
+    # the location leads the key so one location's rows are contiguous
+    CREATE_SQL_STRINGS = (
+        "CREATE TABLE IF NOT EXISTS {table}(location TEXT, pk BIGINT, count BIGINT, "
+        "PRIMARY KEY(location, pk))",
+        "CREATE INDEX IF NOT EXISTS {table}_pk ON {table}(pk)",
+    )
+    DROP_SQL_STRING = "DROP TABLE IF EXISTS {table}"
+    SELECT_SQL_STRING = "SELECT location, pk, count FROM {table}"
+    ADD_SQL_STRING = "UPDATE {table} SET count = count + {p} WHERE location = {p} AND pk = {p}"
+    INSERT_SQL_STRING = "INSERT INTO {table} VALUES({p}, {p}, {p})"
+    DELETE_EMPTY_SQL_STRING = "DELETE FROM {table} WHERE location = {p} AND pk = {p} AND count = 0"
+    DELETE_SQL_STRING = "DELETE FROM {table} WHERE pk = {p}"
+
+    def __init__(self, stockist):
+        self.stockist = stockist
+        self.persistent = False
+        # explicit locations per batch, and the (item, count) last seen per batch
+        self.by_stock = {}
+        self.seen = {}
+        # rollups: units per location, per (item, location), per item and overall
+        self.location_totals = collections.defaultdict(int)
+        self.item_totals = collections.defaultdict(int)
+        self.items = collections.defaultdict(int)
+        self.total = 0
+
+    def sql(self, template):
+        return template.format(table=self.LOCATION_TABLE, p=self.stockist.PLACEHOLDER)
+
+    def create_tables(self):
+        with self.stockist.connection as connection:
+            cur = connection.cursor()
+            for template in self.CREATE_SQL_STRINGS:
+                cur.execute(self.sql(template))
+            connection.commit()
+        self.persistent = True
+
+    def load(self):
+        with self.stockist.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.SELECT_SQL_STRING))
+            rows = cur.fetchall()
+        self.by_stock = {}
+        for location, stock_id, count in rows:
+            self.by_stock.setdefault(stock_id, {})[location] = count
+        self.rebuild()
+
+    def reset(self):
+        if self.persistent:
+            with self.stockist.connection as connection:
+                cur = connection.cursor()
+                cur.execute(self.sql(self.DROP_SQL_STRING))
+                for template in self.CREATE_SQL_STRINGS:
+                    cur.execute(self.sql(template))
+                connection.commit()
+        self.by_stock = {}
+        self.rebuild()
+
+    def rebuild(self):
+        # one pass to seed the rollups; afterwards they only move by deltas
+        self.seen = {}
+        self.location_totals = collections.defaultdict(int)
+        self.item_totals = collections.defaultdict(int)
+        self.items = collections.defaultdict(int)
+        self.total = 0
+        stock = self.stockist.stock
+        for stock_id in [stock_id for stock_id in self.by_stock if stock_id not in stock]:
+            del self.by_stock[stock_id]
+        for stock_id, data in stock.items():
+            item, count = item_of(data['unique_name']), data.get('count', 0)
+            self.seen[stock_id] = (item, count)
+            self._add(item, DEFAULT_LOCATION, count - sum(self.by_stock.get(stock_id, {}).values()))
+            for location, placed in self.by_stock.get(stock_id, {}).items():
+                self._add(item, location, placed)
+
+    def _add(self, item, location, amount):
+        self.location_totals[location] += amount
+        self.item_totals[(item, location)] += amount
+        self.items[item] += amount
+        self.total += amount
+
+    def count_at(self, stock_id, location):
+        data = self.stockist.stock[stock_id]
+        placed = self.by_stock.get(stock_id, {})
+        if location == DEFAULT_LOCATION:
+            return data.get('count', 0) - sum(placed.values())
+        return placed.get(location, 0)
+
+    def counts(self, stock_id):
+        counts = dict(self.by_stock.get(stock_id, {}))
+        counts[DEFAULT_LOCATION] = self.count_at(stock_id, DEFAULT_LOCATION)
+        return counts
+
+    def item_total(self, item, location=None):
+        item = self.stockist.catalog.name_of(item)
+        if location is None:
+            return self.items.get(item, 0)
+        return self.item_totals.get((item, location), 0)
+
+    def locations(self):
+        return sorted(location for location, total in self.location_totals.items()
+                      if total or location != DEFAULT_LOCATION)
+
+    def _write(self, cur, stock_id, location, amount):
+        if not self.persistent or location == DEFAULT_LOCATION:
+            return
+        cur.execute(self.sql(self.ADD_SQL_STRING), (amount, location, stock_id))
+        if cur.rowcount < 1:
+            cur.execute(self.sql(self.INSERT_SQL_STRING), (location, stock_id, amount))
+        else:
+            cur.execute(self.sql(self.DELETE_EMPTY_SQL_STRING), (location, stock_id))
+
+    def _move(self, stock_id, location, amount):
+        if location == DEFAULT_LOCATION:
+            return
+        placed = self.by_stock.setdefault(stock_id, {})
+        placed[location] = placed.get(location, 0) + amount
+        if not placed[location]:
+            del placed[location]
+            if not placed:
+                del self.by_stock[stock_id]
+
+    def adjust(self, cur, stock_id, location, amount):
+        # called before the batch's own count changes by the same amount, so
+        # touch() then sees nothing left over for the default location
+        if not location:
+            raise LocationError('Invalid location!')
+        item, count = self.seen[stock_id]
+        if amount < 0 and self.count_at(stock_id, location) + amount < 0:
+            raise LocationError('Not enough stock for {0} at {1}!'.format(stock_id, location))
+        self._move(stock_id, location, amount)
+        self._add(item, location, amount)
+        self.seen[stock_id] = (item, count + amount)
+        if cur is not None:
+            self._write(cur, stock_id, location, amount)
+
+    def transfer(self, cur, stock_id, source, destination, amount):
+        if amount <= 0:
+            raise LocationError('Invalid amount {0}!'.format(amount))
+        if source == destination:
+            raise LocationError('Source and destination are the same!')
+        if self.count_at(stock_id, source) < amount:
+            raise LocationError('Not enough stock for {0} at {1}!'.format(stock_id, source))
+        item, _ = self.seen[stock_id]
+        self._move(stock_id, source, -amount)
+        self._move(stock_id, destination, amount)
+        self._add(item, source, -amount)
+        self._add(item, destination, amount)
+        if cur is not None:
+            self._write(cur, stock_id, source, -amount)
+            self._write(cur, stock_id, destination, amount)
+
+    def touch(self, stock_id):
+        # called after every in-memory mutation; changes made without a
+        # location land on the default one
+        data = self.stockist.stock.get(stock_id)
+        previous = self.seen.get(stock_id)
+        if data is None:
+            if previous is None:
+                return
+            item, count = previous
+            placed = self.by_stock.pop(stock_id, {})
+            for location, amount in placed.items():
+                self._add(item, location, -amount)
+            self._add(item, DEFAULT_LOCATION, sum(placed.values()) - count)
+            del self.seen[stock_id]
+            return
+        if previous is None:
+            item, old = item_of(data['unique_name']), 0
+        else:
+            item, old = previous
+        new = data.get('count', 0)
+        self.seen[stock_id] = (item, new)
+        if new != old:
+            self._add(item, DEFAULT_LOCATION, new - old)
+            placed = self.by_stock.get(stock_id)
+            if new < old and placed and new < sum(placed.values()):
+                self._draw_down(stock_id, item, sum(placed.values()) - max(new, 0))
+
+    def _draw_down(self, stock_id, item, shortfall):
+        # units taken without a location come out of the explicit locations,
+        # in name order, once the default location is empty
+        moves = []
+        for location, placed in sorted(self.by_stock[stock_id].items()):
+            take = min(placed, shortfall)
+            if take > 0:
+                moves.append((location, take))
+                shortfall -= take
+            if not shortfall:
+                break
+        with self.stockist.location_cursor() as cur:
+            for location, take in moves:
+                self._move(stock_id, location, -take)
+                self._add(item, location, -take)
+                self._add(item, DEFAULT_LOCATION, take)
+                if cur is not None:
+                    self._write(cur, stock_id, location, -take)
+
+    def delete_rows(self, cur, stock_ids):
+        if self.persistent:
+            cur.executemany(self.sql(self.DELETE_SQL_STRING), [(stock_id,) for stock_id in stock_ids])
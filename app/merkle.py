@@ -0,0 +1,299 @@
+# consistency checks (range hash tree over stock ids, in memory and in the database)
+import zlib
+
+
+MODULUS = 2 ** 32
+
+
+class MerkleError(Exception):
+    pass
+
+
+def row_hash(stock_id, unique_name, count):
+    return zlib.crc32('{0}\x00{1}\x00{2}'.format(stock_id, unique_name, count).encode('utf-8')) & 0xffffffff
+
+
+class StockMerkle(object):
+
+    # leaves cover bucket_width consecutive stock ids; every level above groups
+    # fanout nodes, and depth levels reach a single root for any 32-bit id.
+    # Node hashes are sums of row hashes, so one row changes one path by a delta.
+    MERKLE_TABLE = "stock_merkle"
+    CREATE_SQL_STRING = "CREATE TABLE IF NOT EXISTS {table}(leaf BIGINT PRIMARY KEY, hash BIGINT)"
+    DROP_SQL_STRING = "DROP TABLE IF EXISTS {table}"
+    ADD_SQL_STRING = "UPDATE {table} SET hash = (hash + {p}) % 4294967296 WHERE leaf = {p}"
+    SET_SQL_STRING = "UPDATE {table} SET hash = {p} WHERE leaf = {p}"
+    INSERT_SQL_STRING = "INSERT INTO {table} VALUES({p}, {p})"
+    ROOT_SQL_STRING = "SELECT SUM(hash), MAX(leaf) FROM {table}"
+    CHILDREN_SQL_STRING = (
+        "SELECT leaf / {child}, SUM(hash) FROM {table} "
+        "WHERE leaf / {parent} IN ({nodes}) GROUP BY leaf / {child}"
+    )
+    COUNT_SQL_STRING = "SELECT COUNT(*) FROM {table}"
+    ROWS_SQL_STRING = "SELECT pk, name, count FROM {table}"
+    RANGE_ROWS_SQL_STRING = "SELECT pk, name, count FROM {table} WHERE pk >= {p} AND pk < {p}"
+    DELETE_RANGE_SQL_STRING = "DELETE FROM {table} WHERE pk >= {p} AND pk < {p}"
+
+    def __init__(self, stockist, bucket_width=64, fanout=16):
+        if stockist.PLACEHOLDER is None:
+            raise NotImplementedError
+        self.stockist = stockist
+        self.bucket_width = bucket_width
+        self.fanout = fanout
+        self.depth = 0
+        while bucket_width * fanout ** self.depth < MODULUS:
+            self.depth += 1
+        self.levels = [{} for _ in range(self.depth + 1)]
+        # row hashes as held in memory and as last written to the database
+        self.memory = {}
+        self.written = {}
+
+    def sql(self, template, table=None, **extra):
+        return template.format(table=table or self.MERKLE_TABLE, p=self.stockist.PLACEHOLDER, **extra)
+
+    @property
+    def connection(self):
+        return self.stockist.connection
+
+    def leaf(self, stock_id):
+        return stock_id // self.bucket_width
+
+    def leaf_range(self, leaf):
+        return leaf * self.bucket_width, (leaf + 1) * self.bucket_width
+
+    def current_hash(self, stock_id):
+        data = self.stockist.stock.get(stock_id)
+        if data is None:
+            return 0
+        return row_hash(stock_id, data['unique_name'], data.get('count', 0))
+
+    def _add(self, leaf, delta):
+        for level in self.levels:
+            level[leaf] = (level.get(leaf, 0) + delta) % MODULUS
+            leaf //= self.fanout
+
+    def touch(self, stock_id):
+        # called after every in-memory mutation of the row
+        new = self.current_hash(stock_id)
+        delta = new - self.memory.get(stock_id, 0)
+        if not delta:
+            return
+        if new:
+            self.memory[stock_id] = new
+        else:
+            self.memory.pop(stock_id, None)
+        self._add(self.leaf(stock_id), delta)
+
+    def record(self, cur, stock_ids, counts=None):
+        # called inside the write that stored these rows, so the side table
+        # commits or rolls back with them; counts gives the written count for
+        # rows whose memory copy is only updated after the write
+        deltas = {}
+        for stock_id in stock_ids:
+            if counts is not None and stock_id in counts:
+                data = self.stockist.stock[stock_id]
+                new = row_hash(stock_id, data['unique_name'], counts[stock_id])
+            else:
+                new = self.memory.get(stock_id, 0)
+            delta = new - self.written.get(stock_id, 0)
+            if not delta:
+                continue
+            if new:
+                self.written[stock_id] = new
+            else:
+                self.written.pop(stock_id, None)
+            leaf = self.leaf(stock_id)
+            deltas[leaf] = (deltas.get(leaf, 0) + delta) % MODULUS
+        for leaf, delta in sorted(deltas.items()):
+            cur.execute(self.sql(self.ADD_SQL_STRING), (delta, leaf))
+            if cur.rowcount < 1:
+                cur.execute(self.sql(self.INSERT_SQL_STRING), (leaf, delta))
+
+    def accept(self, stock_ids):
+        # rows the database is known to hold exactly as memory does
+        for stock_id in stock_ids:
+            value = self.memory.get(stock_id)
+            if value is None:
+                self.written.pop(stock_id, None)
+            else:
+                self.written[stock_id] = value
+
+    def rebuild_memory(self):
+        self.levels = [{} for _ in range(self.depth + 1)]
+        self.memory = {}
+        for stock_id in list(self.stockist.stock):
+            self.touch(stock_id)
+        self.written = dict(self.memory)
+
+    def create_tables(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.CREATE_SQL_STRING))
+            cur.execute(self.sql(self.COUNT_SQL_STRING))
+            empty = not cur.fetchone()[0]
+            connection.commit()
+        self.rebuild_memory()
+        if empty:
+            self.rebuild_table()
+
+    def rebuild_table(self):
+        # hashes the stock table itself, for a new side table or after outside edits
+        leaves = {}
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.ROWS_SQL_STRING, self.stockist.STOCK_TABLE))
+            self.written = {}
+            for stock_id, name, count in cur.fetchall():
+                value = row_hash(stock_id, name, count)
+                self.written[stock_id] = value
+                leaf = self.leaf(stock_id)
+                leaves[leaf] = (leaves.get(leaf, 0) + value) % MODULUS
+            cur.execute(self.sql(self.DROP_SQL_STRING))
+            cur.execute(self.sql(self.CREATE_SQL_STRING))
+            cur.executemany(self.sql(self.INSERT_SQL_STRING), sorted(leaves.items()))
+            connection.commit()
+
+    def reset(self):
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.DROP_SQL_STRING))
+            cur.execute(self.sql(self.CREATE_SQL_STRING))
+            connection.commit()
+        self.rebuild_memory()
+        self.written = {}
+
+    def _database_children(self, cur, level, nodes):
+        # sums for the children at `level` of the given nodes one level up
+        child = self.fanout ** level
+        cur.execute(
+            self.sql(
+                self.CHILDREN_SQL_STRING,
+                child=child,
+                parent=child * self.fanout,
+                nodes=', '.join([self.stockist.PLACEHOLDER] * len(nodes)),
+            ),
+            tuple(nodes),
+        )
+        return dict((int(node), int(total) % MODULUS) for node, total in cur.fetchall())
+
+    def _memory_children(self, level, nodes):
+        return dict(
+            (node, total)
+            for node, total in self.levels[level].items()
+            if node // self.fanout in nodes and total
+        )
+
+    def diverging_leaves(self):
+        # descends only into subtrees whose sums differ, one query per level
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.ROOT_SQL_STRING))
+            database_root, last_leaf = cur.fetchone()
+            memory_root = sum(self.levels[self.depth].values()) % MODULUS
+            if int(database_root or 0) % MODULUS == memory_root:
+                return []
+            # start from the lowest level that still has a single node, so the
+            # number of queries grows with the ids in use, not the id space
+            last_leaf = max([int(last_leaf or 0)] + list(self.levels[0]))
+            top = 0
+            while last_leaf // self.fanout ** top:
+                top += 1
+            nodes = set([0])
+            for level in range(top - 1, -1, -1):
+                database = self._database_children(cur, level, sorted(nodes))
+                memory = self._memory_children(level, nodes)
+                nodes = set(
+                    node for node in set(database) | set(memory)
+                    if database.get(node, 0) != memory.get(node, 0)
+                )
+                if not nodes:
+                    return []
+            return sorted(nodes)
+
+    def _database_rows(self, cur, leaf):
+        cur.execute(
+            self.sql(self.RANGE_ROWS_SQL_STRING, self.stockist.STOCK_TABLE),
+            self.leaf_range(leaf),
+        )
+        return dict(
+            (stock_id, {'stock_id': stock_id, 'unique_name': name, 'count': count})
+            for stock_id, name, count in cur.fetchall()
+        )
+
+    def _memory_rows(self, leaf):
+        low, high = self.leaf_range(leaf)
+        return dict(
+            (stock_id, data) for stock_id, data in self.stockist.stock.items()
+            if low <= stock_id < high
+        )
+
+    def verify(self):
+        # (low, high, stock ids that differ) for each diverging range
+        report = []
+        leaves = self.diverging_leaves()
+        with self.connection as connection:
+            cur = connection.cursor()
+            for leaf in leaves:
+                database = self._database_rows(cur, leaf)
+                memory = self._memory_rows(leaf)
+                differing = sorted(
+                    stock_id for stock_id in set(database) | set(memory)
+                    if database.get(stock_id) != memory.get(stock_id)
+                )
+                low, high = self.leaf_range(leaf)
+                report.append((low, high, differing))
+        return report
+
+    def _replace_memory_rows(self, memory, database):
+        stock = self.stockist
+        for stock_id, data in memory.items():
+            item_name = data['unique_name'].split('_#')[0]
+            stock.name_id_map.get(item_name, set()).discard((stock_id, data['unique_name']))
+            del stock.stock[stock_id]
+        for stock_id, data in sorted(database.items()):
+            item_name = stock.catalog.intern(data['unique_name'].split('_#')[0]).name
+            stock.name_id_map.setdefault(item_name, set()).add((stock_id, data['unique_name']))
+            stock.stock[stock_id] = dict(data)
+        for stock_id in set(memory) | set(database):
+            self.touch(stock_id)
+
+    def repair(self, source='database'):
+        # rewrites only the diverging ranges, from the database or from memory
+        if source not in ('database', 'memory'):
+            raise MerkleError('Unable to repair from {0}!'.format(source))
+        repaired = []
+        leaves = self.diverging_leaves()
+        with self.connection as connection:
+            cur = connection.cursor()
+            for leaf in leaves:
+                database = self._database_rows(cur, leaf)
+                memory = self._memory_rows(leaf)
+                if source == 'database':
+                    self._replace_memory_rows(memory, database)
+                    rows = database
+                else:
+                    cur.execute(
+                        self.sql(self.DELETE_RANGE_SQL_STRING, self.stockist.STOCK_TABLE),
+                        self.leaf_range(leaf),
+                    )
+                    cur.executemany(
+                        self.stockist.INSERT_SQL_STRING.format(table=self.stockist.STOCK_TABLE),
+                        [
+                            (stock_id, data['unique_name'], data.get('count', 0))
+                            for stock_id, data in sorted(memory.items())
+                        ],
+                    )
+                    rows = memory
+                total = 0
+                for stock_id in set(database) | set(memory):
+                    self.written.pop(stock_id, None)
+                for stock_id, data in rows.items():
+                    value = row_hash(stock_id, data['unique_name'], data.get('count', 0))
+                    self.written[stock_id] = value
+                    total += value
+                cur.execute(self.sql(self.SET_SQL_STRING), (total % MODULUS, leaf))
+                if cur.rowcount < 1:
+                    cur.execute(self.sql(self.INSERT_SQL_STRING), (leaf, total % MODULUS))
+                repaired.append(self.leaf_range(leaf))
+            connection.commit()
+        return repaired
@@ -0,0 +1,349 @@
+# operation metrics (counters, latency histograms, prometheus text, sinks)
+import bisect
+import collections
+import contextlib
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+
+
+# upper bounds in seconds, from 10us to 10s
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+TABLE_PATTERN = re.compile(
+    r'\b(?:FROM|INTO|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)',
+    re.IGNORECASE,
+)
+
+# prometheus label name for each histogram family
+LABEL_NAMES = {
+    'operation': 'operation',
+    'sql': 'statement',
+    'command': 'command',
+    'lock_wait': 'lock',
+}
+
+
+class MetricsError(Exception):
+    pass
+
+
+def default_metrics_path(database):
+    return os.path.abspath(database) + '.metrics.json'
+
+
+def statement_label(sql):
+    # one label per statement kind and table so parameters never leak into names
+    words = sql.split(None, 2)
+    if not words:
+        return 'other'
+    verb = words[0].lower()
+    if verb == 'update' and len(words) > 1:
+        return 'update {0}'.format(words[1])
+    match = TABLE_PATTERN.search(sql)
+    return verb if match is None else '{0} {1}'.format(verb, match.group(1))
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, counts, count, total):
+        if len(counts) != len(self.counts):
+            raise MetricsError('Histogram buckets do not match!')
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class Metrics(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, enabled=True):
+        self.buckets = tuple(buckets)
+        self.enabled = enabled
+        self.counters = collections.defaultdict(int)
+        self.histograms = {}
+        self.sinks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_sink(self, sink):
+        # sink(kind, name, label, value) is called for every observation
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def increment(self, name, amount=1, label=''):
+        with self._lock:
+            self.counters[(name, label)] += amount
+        for sink in self.sinks:
+            sink('counter', name, label, amount)
+
+    def observe(self, family, label, seconds):
+        with self._lock:
+            histogram = self.histograms.get((family, label))
+            if histogram is None:
+                histogram = self.histograms[(family, label)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        for sink in self.sinks:
+            sink('histogram', family, label, seconds)
+
+    @contextlib.contextmanager
+    def timer(self, family, label):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(family, label, time.perf_counter() - start)
+
+    def active(self, label):
+        # labels being timed on this thread, so overridden methods calling
+        # their base implementation are only counted once
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = set()
+        return label in active, active
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': [
+                    [name, label, value]
+                    for (name, label), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    [family, label, list(histogram.counts), histogram.count, histogram.sum]
+                    for (family, label), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def merge(self, snapshot):
+        if tuple(snapshot['buckets']) != self.buckets:
+            raise MetricsError('Histogram buckets do not match!')
+        with self._lock:
+            for name, label, value in snapshot['counters']:
+                self.counters[(name, label)] += value
+            for family, label, counts, count, total in snapshot['histograms']:
+                histogram = self.histograms.get((family, label))
+                if histogram is None:
+                    histogram = self.histograms[(family, label)] = Histogram(self.buckets)
+                histogram.merge(counts, count, total)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self, prefix='stockist'):
+        lines = []
+        snapshot = self.snapshot()
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        for name in sorted(set(name for name, _, _ in snapshot['counters'])):
+            metric = '{0}_{1}_total'.format(prefix, name)
+            lines.append('# TYPE {0} counter'.format(metric))
+            for counter, label, value in snapshot['counters']:
+                if counter == name:
+                    lines.append('{0}{1} {2}'.format(metric, prometheus_labels(label=label), value))
+        for family in sorted(set(family for family, _, _, _, _ in snapshot['histograms'])):
+            metric = '{0}_{1}_seconds'.format(prefix, family)
+            key = LABEL_NAMES.get(family, 'label')
+            lines.append('# TYPE {0} histogram'.format(metric))
+            for name, label, counts, count, total in snapshot['histograms']:
+                if name != family:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(bounds, counts):
+                    cumulative += bucket_count
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        metric, prometheus_labels(**{key: label, 'le': bound}), cumulative
+                    ))
+                lines.append('{0}_sum{1} {2!r}'.format(metric, prometheus_labels(**{key: label}), total))
+                lines.append('{0}_count{1} {2}'.format(metric, prometheus_labels(**{key: label}), count))
+        return '\n'.join(lines) + '\n'
+
+
+def prometheus_labels(**labels):
+    pairs = [
+        '{0}="{1}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items())
+        if value
+    ]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+@contextlib.contextmanager
+def timed_lock(lock, metrics, label):
+    if metrics is None or not metrics.enabled:
+        with lock:
+            yield
+        return
+    start = time.perf_counter()
+    with lock:
+        metrics.observe('lock_wait', label, time.perf_counter() - start)
+        yield
+
+
+class InstrumentedCursor(object):
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._metrics.increment('sql_rows_read')
+            yield row
+
+    def _execute(self, method, sql, *args):
+        label = statement_label(sql)
+        with self._metrics.timer('sql', label):
+            result = method(sql, *args)
+        if label.startswith(('insert', 'update', 'delete')) and self._cursor.rowcount > 0:
+            self._metrics.increment('sql_rows_written', self._cursor.rowcount)
+        return result
+
+    def execute(self, sql, *args):
+        self._execute(self._cursor.execute, sql, *args)
+        return self
+
+    def executemany(self, sql, *args):
+        self._execute(self._cursor.executemany, sql, *args)
+        return self
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._metrics.increment('sql_rows_read')
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._metrics.increment('sql_rows_read', len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._metrics.increment('sql_rows_read', len(rows))
+        return rows
+
+
+class InstrumentedConnection(object):
+
+    __slots__ = ('_connection', '_metrics')
+
+    def __init__(self, connection, metrics):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_metrics', metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.pending:
+            return self._connection.__exit__(*exc_info)
+        with self._metrics.timer('sql', 'commit' if exc_info[0] is None else 'rollback'):
+            result = self._connection.__exit__(*exc_info)
+        self._metrics.increment('commits' if exc_info[0] is None else 'rollbacks')
+        return result
+
+    @property
+    def pending(self):
+        # only count commits and rollbacks that end an open transaction
+        return getattr(self._connection, 'in_transaction', True)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs), self._metrics)
+
+    def commit(self):
+        if not self.pending:
+            return self._connection.commit()
+        with self._metrics.timer('sql', 'commit'):
+            self._connection.commit()
+        self._metrics.increment('commits')
+
+    def rollback(self):
+        if not self.pending:
+            return self._connection.rollback()
+        with self._metrics.timer('sql', 'rollback'):
+            self._connection.rollback()
+        self._metrics.increment('rollbacks')
+
+
+def load_snapshot(path):
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except (IOError, OSError):
+        return None
+    except ValueError:
+        raise MetricsError('Unreadable metrics file {0}!'.format(path))
+
+
+@contextlib.contextmanager
+def snapshot_lock(path):
+    # processes sharing a metrics file take turns at the read-merge-write
+    with open(path + '.lock', 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def save_snapshot(path, metrics):
+    # accumulate into whatever earlier processes left behind
+    combined = Metrics(metrics.buckets)
+    combined.merge(metrics.snapshot())
+    with snapshot_lock(path):
+        previous = load_snapshot(path)
+        if previous is not None:
+            combined.merge(previous)
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as fh:
+            json.dump(combined.snapshot(), fh)
+        os.rename(temporary, path)
+    return combined
@@ -1 +1,226 @@
-# TODO: payment collection (stripe)
+# payment collection (async jobs, worker pool, pluggable gateways)
+import collections
+import itertools
+import queue
+import random
+import threading
+import time
+
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+
+
+class PaymentError(Exception):
+    pass
+
+
+class PaymentDeclined(PaymentError):
+    pass
+
+
+class GatewayError(PaymentError):
+    pass
+
+
+class PaymentBackpressureError(PaymentError):
+    pass
+
+
+class PaymentGateway(object):
+
+    def charge(self, amount, idempotency_key):
+        raise NotImplementedError
+
+    def refund(self, amount, idempotency_key):
+        raise NotImplementedError
+
+
+class FakeGateway(PaymentGateway):
+
+    def __init__(self, latency=0.0, failure_rate=0.0, decline_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.charges = {}
+        self.refunds = {}
+
+    def charge(self, amount, idempotency_key):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            # a retried key returns the original outcome instead of charging twice
+            if idempotency_key in self.charges:
+                return self.charges[idempotency_key]
+            roll = self.random.random()
+            if roll < self.failure_rate:
+                raise GatewayError('Gateway unavailable!')
+            if roll < self.failure_rate + self.decline_rate:
+                raise PaymentDeclined('Card declined!')
+            self.charges[idempotency_key] = 'ch_{0}'.format(len(self.charges) + 1)
+            return self.charges[idempotency_key]
+
+    def refund(self, amount, idempotency_key):
+        with self.lock:
+            self.refunds[idempotency_key] = amount
+
+
+class PaymentJob(object):
+
+    def __init__(self, idempotency_key, amount, lines, hold_ids):
+        self.idempotency_key = idempotency_key
+        self.amount = amount
+        self.lines = lines
+        self.hold_ids = hold_ids
+        self.status = PENDING
+        self.charge_id = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.completed_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.completed_at = time.time()
+        self._done.set()
+
+
+class PaymentProcessor(object):
+
+    def __init__(self, stockist, gateway, workers=4, max_pending=1000, retries=2, retry_delay=0.05,
+                 keep_finished=1000):
+        self.stockist = stockist
+        self.gateway = gateway
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.jobs = {}
+        # finished jobs stay findable by key for retries, the oldest are dropped
+        self.keep_finished = keep_finished
+        self._finished = collections.deque()
+        self.jobs_lock = threading.Lock()
+        self.metrics_lock = threading.Lock()
+        self.submitted = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.started_at = time.time()
+        self._keys = itertools.count(1)
+        self._workers = [
+            threading.Thread(target=self._work, name='payment-worker-{0}'.format(i))
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, lines, hold_ids, amount, idempotency_key=None, block=True, timeout=None):
+        if idempotency_key is None:
+            idempotency_key = 'job_{0}'.format(next(self._keys))
+        with self.jobs_lock:
+            if idempotency_key in self.jobs:
+                return self.jobs[idempotency_key]
+            job = self.jobs[idempotency_key] = PaymentJob(idempotency_key, amount, dict(lines), list(hold_ids))
+        with self.metrics_lock:
+            self.submitted += 1
+        try:
+            self.queue.put(job, block=block, timeout=timeout)
+        except queue.Full:
+            with self.jobs_lock:
+                del self.jobs[idempotency_key]
+            with self.metrics_lock:
+                self.submitted -= 1
+            raise PaymentBackpressureError('Too many payments pending!')
+        return job
+
+    def _charge(self, job):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.gateway.charge(job.amount, job.idempotency_key)
+            except GatewayError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retry_delay * (2 ** attempt))
+
+    def _release(self, job):
+        for hold_id in job.hold_ids:
+            self.stockist.reservations.release(hold_id)
+
+    def _process(self, job):
+        job.status = PROCESSING
+        # the holds are pinned with no expiry, so every way out that is not a
+        # confirmed checkout has to release them
+        status = FAILED
+        try:
+            try:
+                job.charge_id = self._charge(job)
+            except Exception as error:
+                return FAILED, error
+            try:
+                self.stockist.checkout_engine.checkout(job.lines, hold_ids=job.hold_ids)
+            except Exception as error:
+                self.gateway.refund(job.amount, job.idempotency_key)
+                return FAILED, error
+            status = CONFIRMED
+            return CONFIRMED, None
+        finally:
+            if status != CONFIRMED:
+                self._release(job)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            try:
+                status, error = self._process(job)
+            except Exception as unexpected:
+                status, error = FAILED, unexpected
+            job.finish(status, error)
+            with self.jobs_lock:
+                self._finished.append(job.idempotency_key)
+                while len(self._finished) > self.keep_finished:
+                    self.jobs.pop(self._finished.popleft(), None)
+            with self.metrics_lock:
+                if status == CONFIRMED:
+                    self.confirmed += 1
+                else:
+                    self.failed += 1
+                self.total_latency += job.completed_at - job.submitted_at
+            self.queue.task_done()
+
+    def join(self):
+        self.queue.join()
+
+    def shutdown(self):
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    @property
+    def metrics(self):
+        with self.metrics_lock:
+            completed = self.confirmed + self.failed
+            elapsed = time.time() - self.started_at
+            return {
+                'submitted': self.submitted,
+                'confirmed': self.confirmed,
+                'failed': self.failed,
+                'pending': self.submitted - completed,
+                'throughput': completed / elapsed if elapsed else 0.0,
+                'mean_latency': self.total_latency / completed if completed else 0.0,
+            }
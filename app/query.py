@@ -0,0 +1,136 @@
+# stock queries (filter, order and paginate in memory or as sql)
+import itertools
+
+
+ORDER_COLUMNS = {
+    'pk': 'stock_id',
+    'count': 'count',
+    'name': 'unique_name',
+}
+
+
+class QueryError(Exception):
+    pass
+
+
+def parse_order_by(order_by):
+    descending = order_by.startswith('-')
+    column = order_by.lstrip('-')
+    if column not in ORDER_COLUMNS:
+        raise QueryError('Unable to order by {0}!'.format(order_by))
+    return column, descending
+
+
+def prefix_upper_bound(prefix):
+    # smallest string greater than every string starting with prefix, so the
+    # prefix match is an index-friendly range instead of a LIKE
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def compile_find(table, placeholder, count_lt=None, count_between=None, name_prefix=None,
+                 limit=None, offset=0, order_by='pk', after=None, item_name_expression=None):
+    column, descending = parse_order_by(order_by)
+    if column == 'name':
+        # names order by (item name, pk) so apple_#2 comes before apple_#10
+        if item_name_expression is None:
+            raise QueryError('Unable to order by name without an item name expression!')
+        column = item_name_expression
+    clauses, params = [], []
+    if count_lt is not None:
+        clauses.append('count < {p}')
+        params.append(count_lt)
+    if count_between is not None:
+        clauses.append('count BETWEEN {p} AND {p}')
+        params.extend(count_between)
+    if name_prefix:
+        clauses.append('name >= {p} AND name < {p}')
+        params.extend((name_prefix, prefix_upper_bound(name_prefix)))
+    if after is not None:
+        # keyset pagination from the (order key, pk) of the last row seen
+        last_key, last_pk = after
+        op = '<' if descending else '>'
+        if column == 'pk':
+            clauses.append('pk {0} {{p}}'.format(op))
+            params.append(last_pk)
+        else:
+            clauses.append('({0} {1} {{p}} OR ({0} = {{p}} AND pk {1} {{p}}))'.format(column, op))
+            params.extend((last_key, last_key, last_pk))
+    direction = ' DESC' if descending else ''
+    sql = 'SELECT pk, name, count FROM {table}'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    if column == 'pk':
+        sql += ' ORDER BY pk' + direction
+    else:
+        sql += ' ORDER BY {0}{1}, pk{1}'.format(column, direction)
+    if limit is not None:
+        sql += ' LIMIT {p}'
+        params.append(limit)
+    if offset:
+        if limit is None:
+            raise QueryError('An offset needs a limit!')
+        sql += ' OFFSET {p}'
+        params.append(offset)
+    return sql.format(table=table, p=placeholder), tuple(params)
+
+
+def compile_delete(table, placeholder, item_name=None, count_eq=None, ids=None, id_table=None):
+    # one set-based delete; long id lists are joined from id_table instead of inlined
+    clauses, params = [], []
+    if item_name is not None:
+        prefix = item_name + '_#'
+        clauses.append('name >= {p} AND name < {p}')
+        params.extend((prefix, prefix_upper_bound(prefix)))
+    if count_eq is not None:
+        clauses.append('count = {p}')
+        params.append(count_eq)
+    if id_table is not None:
+        clauses.append('pk IN (SELECT pk FROM {0})'.format(id_table))
+    elif ids is not None:
+        clauses.append('pk IN ({0})'.format(', '.join(['{p}'] * len(ids))))
+        params.extend(ids)
+    if not clauses:
+        raise QueryError('A delete needs a condition!')
+    sql = 'DELETE FROM {table} WHERE ' + ' AND '.join(clauses)
+    return sql.format(table=table, p=placeholder), tuple(params)
+
+
+def evaluate_find(entries, count_lt=None, count_between=None, name_prefix=None,
+                  limit=None, offset=0, order_by='pk', after=None):
+    column, descending = parse_order_by(order_by)
+    if offset and limit is None:
+        raise QueryError('An offset needs a limit!')
+
+    def matches(data):
+        count = data.get('count', 0)
+        if count_lt is not None and not count < count_lt:
+            return False
+        if count_between is not None and not count_between[0] <= count <= count_between[1]:
+            return False
+        if name_prefix and not data['unique_name'].startswith(name_prefix):
+            return False
+        if after is not None:
+            position = order_key(data, column)
+            last = (after[0] if column != 'pk' else after[1], after[1])
+            return position < last if descending else position > last
+        return True
+
+    results = sorted(
+        (data for data in entries if matches(data)),
+        key=lambda data: order_key(data, column),
+        reverse=descending,
+    )
+    stop = None if limit is None else offset + limit
+    return list(itertools.islice(results, offset, stop))
+
+
+def order_key(data, column):
+    if column == 'name':
+        item_name, _ = data['unique_name'].split('_#')
+        return item_name, data['stock_id']
+    return data.get(ORDER_COLUMNS[column], 0), data['stock_id']
+
+
+def page_key(data, order_by):
+    column, _ = parse_order_by(order_by)
+    return order_key(data, column)
@@ -0,0 +1,167 @@
+# stock reservations (time-limited holds, available-to-promise, heap expiry)
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+
+Hold = collections.namedtuple('Hold', ['hold_id', 'stock_id', 'quantity', 'expires_at'])
+
+
+class ReservationError(Exception):
+    pass
+
+
+class InsufficientStockError(ReservationError):
+    pass
+
+
+class HoldExpiredError(ReservationError):
+    pass
+
+
+class ReservationBook(object):
+
+    def __init__(self, stockist, default_ttl=900, clock=time.time):
+        self.stockist = stockist
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.lock = threading.RLock()
+        self._holds = {}
+        self._held = collections.defaultdict(int)
+        # (expires_at, hold_id) entries; released or extended holds are left
+        # behind and skipped when they surface
+        self._expiry = []
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        with self.lock:
+            self.expire()
+            return len(self._holds)
+
+    def expire(self, now=None):
+        now = self.clock() if now is None else now
+        expired = []
+        with self.lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, hold_id = heapq.heappop(self._expiry)
+                hold = self._holds.get(hold_id)
+                if hold is not None and hold.expires_at == expires_at:
+                    self._drop(hold)
+                    expired.append(hold)
+        return expired
+
+    def _drop(self, hold):
+        del self._holds[hold.hold_id]
+        self._held[hold.stock_id] -= hold.quantity
+        if not self._held[hold.stock_id]:
+            del self._held[hold.stock_id]
+
+    def _add(self, stock_id, quantity, ttl):
+        expires_at = self.clock() + (self.default_ttl if ttl is None else ttl)
+        hold = Hold(next(self._ids), stock_id, quantity, expires_at)
+        self._holds[hold.hold_id] = hold
+        self._held[stock_id] += quantity
+        heapq.heappush(self._expiry, (expires_at, hold.hold_id))
+        return hold
+
+    def held(self, stock_id):
+        with self.lock:
+            self.expire()
+            return self._held.get(stock_id, 0)
+
+    def _available(self, stock_id):
+        return self.stockist[stock_id]['count'] - self._held.get(stock_id, 0)
+
+    def available(self, stock_id):
+        with self.lock:
+            self.expire()
+            return self._available(stock_id)
+
+    def available_for_item(self, item):
+        with self.lock:
+            self.expire()
+            return sum(self._available(stock_id) for stock_id in self.stockist.stock_ids_for_item(item))
+
+    def get(self, hold_id):
+        with self.lock:
+            self.expire()
+            hold = self._holds.get(hold_id)
+            if hold is None:
+                raise HoldExpiredError('Hold {0} has expired or been released!'.format(hold_id))
+            return hold
+
+    def reserve(self, stock_id, quantity=1, ttl=None):
+        if quantity < 1:
+            raise ReservationError('Quantity must be positive!')
+        with self.lock:
+            self.expire()
+            if self._available(stock_id) < quantity:
+                raise InsufficientStockError('Not enough stock for {0}!'.format(stock_id))
+            return self._add(stock_id, quantity, ttl)
+
+    def reserve_item(self, item, quantity=1, ttl=None):
+        if quantity < 1:
+            raise ReservationError('Quantity must be positive!')
+        with self.lock:
+            self.expire()
+            plan, remaining = [], quantity
+            # oldest batches first so newer stock is left for later carts
+            for stock_id in sorted(self.stockist.stock_ids_for_item(item)):
+                take = min(self._available(stock_id), remaining)
+                if take > 0:
+                    plan.append((stock_id, take))
+                    remaining -= take
+                if not remaining:
+                    break
+            if remaining:
+                raise InsufficientStockError('Not enough stock for {0}!'.format(item))
+            return [self._add(stock_id, take, ttl) for stock_id, take in plan]
+
+    def extend(self, hold_id, ttl=None):
+        with self.lock:
+            hold = self.get(hold_id)
+            expires_at = self.clock() + (self.default_ttl if ttl is None else ttl)
+            hold = self._holds[hold_id] = hold._replace(expires_at=expires_at)
+            heapq.heappush(self._expiry, (expires_at, hold_id))
+            return hold
+
+    def pin(self, hold_ids):
+        # keep holds alive while a checkout is committing them
+        with self.lock:
+            holds = [self.get(hold_id) for hold_id in hold_ids]
+            return [self.extend(hold.hold_id, ttl=float('inf')) for hold in holds]
+
+    def reduce(self, hold_id, quantity):
+        with self.lock:
+            hold = self.get(hold_id)
+            if quantity >= hold.quantity:
+                self._drop(hold)
+                return None
+            self._held[hold.stock_id] -= quantity
+            hold = self._holds[hold_id] = hold._replace(quantity=hold.quantity - quantity)
+            return hold
+
+    def _compact(self):
+        if len(self._expiry) > 2 * len(self._holds) + 64:
+            self._expiry = [
+                (hold.expires_at, hold.hold_id) for hold in self._holds.values()
+            ]
+            heapq.heapify(self._expiry)
+
+    def release(self, hold_id):
+        with self.lock:
+            hold = self._holds.get(hold_id)
+            if hold is not None:
+                self._drop(hold)
+                self._compact()
+            return hold
+
+    def confirm(self, hold_id):
+        with self.lock:
+            hold = self.get(hold_id)
+            self._drop(hold)
+            self._compact()
+            self.stockist.increase_stock(hold.stock_id, -hold.quantity)
+            return hold
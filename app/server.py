@@ -0,0 +1,97 @@
+# server mode (one process holds the stock, clients talk over a unix socket)
+import json
+import os
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from app import batch
+from app import metrics as metrics_module
+
+
+def default_socket_path(database):
+    return os.path.abspath(database) + '.sock'
+
+
+def encode_response(output=(), error=None):
+    if error is None:
+        return json.dumps({'ok': True, 'output': list(output)}) + '\n'
+    return json.dumps({'ok': False, 'error': str(error)}) + '\n'
+
+
+class StockRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # one batch command per line, one json response per line; a client
+        # may send any number of requests over the same connection
+        for raw in self.rfile:
+            line = raw.decode('utf-8').strip()
+            if not line:
+                continue
+            with metrics_module.timed_lock(self.server.lock, self.server.runner.stock.metrics, 'server'):
+                try:
+                    response = encode_response(self.server.runner.execute(line))
+                except batch.BatchError as error:
+                    response = encode_response(error=error)
+            self.wfile.write(response.encode('utf-8'))
+            self.wfile.flush()
+
+
+class StockServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+    # clients connect in bursts; the default backlog of 5 refuses some of them
+    request_queue_size = 128
+
+    def __init__(self, stock, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.runner = batch.BatchRunner(stock)
+        if os.path.exists(path):
+            if connect(path) is not None:
+                raise batch.BatchError('A server is already running on {0}.'.format(path))
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, StockRequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class StockClient(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    def request(self, line):
+        self.sock.sendall((line.strip() + '\n').encode('utf-8'))
+        raw = self.rfile.readline()
+        if not raw:
+            raise batch.BatchError('Server closed the connection.')
+        response = json.loads(raw.decode('utf-8'))
+        if not response['ok']:
+            raise batch.BatchError(response['error'])
+        return response['output']
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def connect(path, timeout=5.0):
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except (IOError, OSError):
+        sock.close()
+        return None
+    return StockClient(sock)
@@ -0,0 +1,315 @@
+# shared-memory counts (one publishing process, zero-copy readers in others)
+import json
+import os
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+MAGIC = 0x53544f434b495354
+MISSING = -2 ** 63
+# directory: magic, counts generation, index generation
+DIRECTORY_SLOTS = 3
+# counts: magic, retired, capacity, then a (version, count) pair per stock id
+COUNTS_HEADER = 3
+# index: magic, retired, capacity in bytes, bytes used, then json lines of [id, name]
+INDEX_HEADER = 4
+
+
+class SharedStockError(Exception):
+    pass
+
+
+def require_shared_memory():
+    if shared_memory is None:
+        raise SharedStockError('Shared memory needs Python 3.8 or later!')
+    return shared_memory
+
+
+def segment_name(base, kind, generation):
+    return '{0}_{1}{2}'.format(base, kind, generation)
+
+
+def attach(name):
+    module = require_shared_memory()
+    try:
+        segment = module.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before 3.13 every attach is tracked, and the tracker unlinks the
+        # segment when the reader exits; readers must leave that to the publisher
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            segment = module.SharedMemory(name=name)
+        except (IOError, OSError):
+            raise SharedStockError('No shared stock segment {0}!'.format(name))
+        finally:
+            resource_tracker.register = register
+    except (IOError, OSError):
+        raise SharedStockError('No shared stock segment {0}!'.format(name))
+    return segment
+
+
+class Segment(object):
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.words = segment.buf.cast('q')
+
+    @classmethod
+    def create(cls, name, words):
+        return cls(require_shared_memory().SharedMemory(name=name, create=True, size=8 * words))
+
+    @classmethod
+    def open(cls, name):
+        return cls(attach(name))
+
+    def close(self, unlink=False):
+        self.words.release()
+        self.segment.close()
+        if unlink:
+            try:
+                self.segment.unlink()
+            except (IOError, OSError):
+                pass
+
+
+class SharedStockPublisher(object):
+
+    def __init__(self, stockist, name=None, capacity=None, index_bytes=None):
+        self.stockist = stockist
+        self.name = name or 'stockist_{0}'.format(os.getpid())
+        highest = max(list(stockist.stock) or [0])
+        self.capacity = capacity or max(1024, 2 * (highest + 1))
+        self.index_bytes = index_bytes or 64 * self.capacity
+        self.directory = Segment.create(self.name, DIRECTORY_SLOTS)
+        self.counts = None
+        self.index = None
+        self._published_names = {}
+        self._new_counts(0, self.capacity)
+        self._new_index(0, self.index_bytes)
+        self.directory.words[0] = MAGIC
+        self.publish_all()
+
+    def _new_counts(self, generation, capacity, values=()):
+        # a new generation is filled, then published, and only then is the old
+        # one retired, so a reader attaching at any point finds every count
+        counts = Segment.create(segment_name(self.name, 'counts', generation), COUNTS_HEADER + 2 * capacity)
+        words = counts.words
+        words[1] = 0
+        words[2] = capacity
+        for stock_id in range(capacity):
+            words[COUNTS_HEADER + 2 * stock_id + 1] = MISSING
+        for stock_id, value in enumerate(values):
+            words[COUNTS_HEADER + 2 * stock_id + 1] = value
+        words[0] = MAGIC
+        previous, self.counts, self.capacity = self.counts, counts, capacity
+        self.directory.words[1] = generation
+        if previous is not None:
+            previous.words[1] = 1
+            previous.close(unlink=True)
+
+    def _new_index(self, generation, size, data=b''):
+        words = INDEX_HEADER + (size + 7) // 8
+        index = Segment.create(segment_name(self.name, 'index', generation), words)
+        index.words[1] = 0
+        index.words[2] = size
+        index.segment.buf[INDEX_HEADER * 8:INDEX_HEADER * 8 + len(data)] = data
+        index.words[3] = len(data)
+        index.words[0] = MAGIC
+        previous, self.index, self.index_bytes = self.index, index, size
+        self.directory.words[2] = generation
+        if previous is not None:
+            previous.words[1] = 1
+            previous.close(unlink=True)
+
+    def _write_count(self, stock_id, value):
+        if stock_id < 0:
+            # a negative slot would land in the header
+            raise SharedStockError('Invalid stock id {0}!'.format(stock_id))
+        # seqlock: an odd version tells readers the pair is being written
+        words = self.counts.words
+        slot = COUNTS_HEADER + 2 * stock_id
+        version = words[slot]
+        words[slot] = version + 1
+        words[slot + 1] = value
+        words[slot] = version + 2
+
+    def _grow_counts(self, stock_id):
+        capacity = self.capacity
+        while stock_id >= capacity:
+            capacity *= 2
+        old = self.counts
+        values = [
+            old.words[COUNTS_HEADER + 2 * i + 1] for i in range(self.capacity)
+        ]
+        self._new_counts(self.directory.words[1] + 1, capacity, values)
+
+    def _append_names(self, records):
+        data = b''.join(
+            (json.dumps([stock_id, name]) + '\n').encode('utf-8') for stock_id, name in records
+        )
+        used = self.index.words[3]
+        if used + len(data) > self.index_bytes:
+            # start a fresh log holding only the live names, written before it is published
+            records = [
+                (stock_id, entry['unique_name'])
+                for stock_id, entry in sorted(self.stockist.stock.items())
+            ]
+            data = b''.join(
+                (json.dumps([stock_id, name]) + '\n').encode('utf-8') for stock_id, name in records
+            )
+            self._new_index(
+                self.directory.words[2] + 1, max(2 * self.index_bytes, 2 * (used + len(data))), data
+            )
+            self._published_names = dict(records)
+            return
+        offset = INDEX_HEADER * 8 + used
+        self.index.segment.buf[offset:offset + len(data)] = data
+        # readers only parse up to the published length, so bump it last
+        self.index.words[3] = used + len(data)
+        for stock_id, name in records:
+            self._published_names[stock_id] = name
+
+    def touch(self, stock_id):
+        if stock_id < 0:
+            # such ids have no slot; readers simply never find them
+            return
+        data = self.stockist.stock.get(stock_id)
+        if stock_id >= self.capacity:
+            if data is None:
+                return
+            self._grow_counts(stock_id)
+        if data is None:
+            self._write_count(stock_id, MISSING)
+            return
+        if self._published_names.get(stock_id) != data['unique_name']:
+            self._append_names([(stock_id, data['unique_name'])])
+        self._write_count(stock_id, data.get('count', 0))
+
+    def publish_all(self):
+        stock = self.stockist.stock
+        highest = max(list(stock) or [0])
+        if highest >= self.capacity:
+            self._grow_counts(highest)
+        for stock_id in range(self.capacity):
+            data = stock.get(stock_id)
+            self._write_count(stock_id, MISSING if data is None else data.get('count', 0))
+        self._append_names([
+            (stock_id, data['unique_name'])
+            for stock_id, data in sorted(stock.items())
+            if self._published_names.get(stock_id) != data['unique_name']
+        ])
+
+    def close(self):
+        for segment in (self.counts, self.index):
+            segment.words[1] = 1
+            segment.close(unlink=True)
+        self.directory.words[0] = 0
+        self.directory.close(unlink=True)
+
+
+class SharedStockReader(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.directory = Segment.open(name)
+        if self.directory.words[0] != MAGIC:
+            raise SharedStockError('{0} is not a shared stock segment!'.format(name))
+        self.counts = None
+        self.index = None
+        self._offset = 0
+        self._names = {}
+        self._ids = {}
+        self._attach_counts()
+        self._attach_index()
+
+    def _open(self, kind, slot):
+        # the publisher may replace a generation between reading and opening it
+        for _ in range(100):
+            try:
+                return Segment.open(segment_name(self.name, kind, self.directory.words[slot]))
+            except SharedStockError:
+                if not self.directory.words[0]:
+                    break
+        raise SharedStockError('Shared stock {0} has gone away!'.format(self.name))
+
+    def _attach_counts(self):
+        if self.counts is not None:
+            self.counts.close()
+        self.counts = self._open('counts', 1)
+        self.capacity = self.counts.words[2]
+
+    def _attach_index(self):
+        if self.index is not None:
+            self.index.close()
+        self.index = self._open('index', 2)
+        self._offset = 0
+        self._names = {}
+        self._ids = {}
+
+    def _read_count(self, stock_id):
+        while True:
+            words = self.counts.words
+            if words[1]:
+                self._attach_counts()
+                continue
+            if stock_id >= self.capacity:
+                return MISSING
+            slot = COUNTS_HEADER + 2 * stock_id
+            version = words[slot]
+            if version & 1:
+                continue
+            value = words[slot + 1]
+            if words[slot] == version:
+                return value
+
+    def count(self, stock_id):
+        value = self._read_count(stock_id)
+        if value == MISSING:
+            raise KeyError(stock_id)
+        return value
+
+    def get(self, stock_id, default=None):
+        value = self._read_count(stock_id)
+        return default if value == MISSING else value
+
+    def refresh_index(self):
+        # parses only the names appended since the last refresh
+        if self.index.words[1]:
+            self._attach_index()
+        used = self.index.words[3]
+        if used == self._offset:
+            return
+        start = INDEX_HEADER * 8
+        data = bytes(self.index.segment.buf[start + self._offset:start + used])
+        for line in data.decode('utf-8').splitlines():
+            stock_id, unique_name = json.loads(line)
+            previous = self._names.get(stock_id)
+            if previous is not None:
+                self._ids.get(previous.split('_#')[0], set()).discard(stock_id)
+            self._names[stock_id] = unique_name
+            self._ids.setdefault(unique_name.split('_#')[0], set()).add(stock_id)
+        self._offset = used
+
+    def stock_ids_for_item(self, item):
+        self.refresh_index()
+        return sorted(
+            stock_id for stock_id in self._ids.get(str(item), ())
+            if self._read_count(stock_id) != MISSING
+        )
+
+    def counts_for_item(self, item):
+        return [
+            (stock_id, count) for stock_id, count in (
+                (stock_id, self._read_count(stock_id)) for stock_id in self.stock_ids_for_item(item)
+            )
+            if count != MISSING
+        ]
+
+    def close(self):
+        for segment in (self.counts, self.index, self.directory):
+            segment.close()
@@ -1,7 +1,41 @@
 # stock management (items, count, database)
 import collections
-import sqlite3
-import psycopg2
+import contextlib
+import importlib
+import itertools
+
+from app import item as item_module
+from app import journal as journal_module
+
+
+class LazyModule(object):
+
+    # a module imported on first attribute access, so a backend only pays for
+    # the subsystems it enables; the import then replaces the stand-in, so
+    # later lookups are plain module attributes
+    def __init__(self, name, alias):
+        self.__name = name
+        self.__alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.__name)
+        globals()[self.__alias] = module
+        return getattr(module, attribute)
+
+
+sqlite3 = LazyModule('sqlite3', 'sqlite3')
+aggregate_module = LazyModule('app.aggregate', 'aggregate_module')
+changes_module = LazyModule('app.changes', 'changes_module')
+checkout_module = LazyModule('app.checkout', 'checkout_module')
+history_module = LazyModule('app.history', 'history_module')
+locations_module = LazyModule('app.locations', 'locations_module')
+merkle_module = LazyModule('app.merkle', 'merkle_module')
+metrics_module = LazyModule('app.metrics', 'metrics_module')
+query_module = LazyModule('app.query', 'query_module')
+reservation_module = LazyModule('app.reservation', 'reservation_module')
+storage_module = LazyModule('app.storage', 'storage_module')
+thresholds_module = LazyModule('app.thresholds', 'thresholds_module')
+vectorized_module = LazyModule('app.vectorized', 'vectorized_module')
 
 
 class StockError(Exception):
@@ -16,15 +50,65 @@ class StockConnectionError(StockError):
     pass
 
 
+def load_psycopg2():
+    # only the postgresql backend needs psycopg2, so import it on first use
+    psycopg2 = importlib.import_module('psycopg2')
+    importlib.import_module('psycopg2.extensions')
+    return psycopg2
+
+
 def locked_method(method):
     def wrapped(instance, *args, **kwargs):
         if instance.is_locked:
             raise StockLockedError
         else:
             return method(instance, *args, **kwargs)
+    wrapped.timed = getattr(method, 'timed', False)
     return wrapped
 
 
+def timed_method(method):
+    # only marks the method; timed_class wraps it for stockists with metrics,
+    # so a stockist without them calls the plain method
+    method.timed = True
+    return method
+
+
+def timer_for(label, method):
+    def wrapped(instance, *args, **kwargs):
+        metrics = instance._metrics
+        if metrics is None or not metrics.enabled:
+            return method(instance, *args, **kwargs)
+        running, active = metrics.active(label)
+        if running:
+            return method(instance, *args, **kwargs)
+        active.add(label)
+        try:
+            with metrics.timer('operation', label):
+                return method(instance, *args, **kwargs)
+        finally:
+            active.discard(label)
+    return wrapped
+
+
+TIMED_CLASSES = {}
+
+
+def timed_class(cls):
+    # subclass of cls with every timed method wrapped, which a stockist
+    # switches to when its metrics are enabled
+    if cls not in TIMED_CLASSES:
+        namespace = {'untimed_class': cls}
+        for name in set(name for klass in cls.__mro__ for name in vars(klass)):
+            attribute = getattr(cls, name, None)
+            if isinstance(attribute, property) and getattr(attribute.fget, 'timed', False):
+                namespace[name] = property(timer_for(name, attribute.fget), attribute.fset, attribute.fdel)
+            elif getattr(attribute, 'timed', False):
+                namespace[name] = timer_for(name, attribute)
+        TIMED_CLASSES[cls] = type(cls.__name__, (cls,), namespace)
+    return TIMED_CLASSES[cls]
+
+
 class Stockist(object):
 
     @property
@@ -49,6 +133,264 @@ class Stockist(object):
     def is_locked(self):
         return self.stock_locked
 
+    @property
+    def journal(self):
+        if not hasattr(self, '_journal'):
+            self._journal = None
+        return self._journal
+
+    @journal.setter
+    def journal(self, value):
+        self._journal = value
+
+    def open_journal(self, path, sync_every=64, checkpoint_every=10000):
+        self.journal = journal_module.Journal(
+            path,
+            sync_every=sync_every,
+            checkpoint_every=checkpoint_every,
+        )
+        return self.journal
+
+    @property
+    def shared(self):
+        if not hasattr(self, '_shared'):
+            self._shared = None
+        return self._shared
+
+    @shared.setter
+    def shared(self, value):
+        self._shared = value
+
+    def publish_shared(self, name=None, capacity=None):
+        # counts are mirrored into shared memory for SharedStockReader processes;
+        # imported here so plain commands never load multiprocessing
+        shared_module = importlib.import_module('app.shared')
+        self.shared = shared_module.SharedStockPublisher(self, name=name, capacity=capacity)
+        return self.shared
+
+    @property
+    def thresholds(self):
+        if not hasattr(self, '_thresholds'):
+            self._thresholds = None
+        return self._thresholds
+
+    @thresholds.setter
+    def thresholds(self, value):
+        self._thresholds = value
+
+    def enable_thresholds(self, dispatcher=None):
+        self.thresholds = thresholds_module.StockThresholds(self, dispatcher=dispatcher)
+        return self.thresholds
+
+    @property
+    def locations(self):
+        if not hasattr(self, '_locations'):
+            self._locations = None
+        return self._locations
+
+    @locations.setter
+    def locations(self, value):
+        self._locations = value
+
+    def enable_locations(self):
+        self.locations = locations_module.StockLocations(self)
+        self.locations.rebuild()
+        return self.locations
+
+    @property
+    def storage(self):
+        # only persistent stockists keep a copy of the rows outside memory
+        return None
+
+    @contextlib.contextmanager
+    def touching(self):
+        # collects the ids notify() sees, so a failed write can restore them
+        outer = getattr(self, '_touched', None)
+        self._touched = touched = set()
+        try:
+            yield touched
+        finally:
+            self._touched = outer
+            if outer is not None:
+                outer.update(touched)
+
+    def reload_rows(self, stock_ids):
+        # memory goes back to what storage holds for these rows
+        if self.storage is None or not stock_ids:
+            return []
+        rows = [(stock_id, self.storage.get(stock_id)) for stock_id in sorted(stock_ids)]
+        return self.apply_changes(
+            [{'stock_id': stock_id, 'unique_name': row[0], 'count': row[1]} for stock_id, row in rows if row],
+            [stock_id for stock_id, row in rows if row is None],
+        )
+
+    def notify(self, stock_id):
+        # keeps every derived view in step with one changed row
+        touched = getattr(self, '_touched', None)
+        if touched is not None:
+            touched.add(stock_id)
+        if self.locations is not None:
+            self.locations.touch(stock_id)
+        if self.shared is not None:
+            self.shared.touch(stock_id)
+        if self.thresholds is not None:
+            self.thresholds.touch(stock_id)
+
+    def log_mutation(self, op, stock_id, value=0, name=''):
+        self.notify(stock_id)
+        if self.journal is None:
+            return
+        if self.write_pending:
+            # held back until the write commits, so a rollback leaves nothing
+            # behind for recover() to replay
+            self.journal_pending.append((op, stock_id, value, name))
+            return
+        self.journal.append(op, stock_id, value, name)
+        if self.journal.needs_checkpoint:
+            self.checkpoint()
+
+    @property
+    def journal_pending(self):
+        if not hasattr(self, '_journal_pending'):
+            self._journal_pending = []
+        return self._journal_pending
+
+    @property
+    def write_pending(self):
+        return self.in_transaction or getattr(self, '_write_held', False)
+
+    @contextlib.contextmanager
+    def write_held(self, hold=True):
+        # for writes that change memory before their own transaction opens
+        if not hold or self.write_pending:
+            yield
+            return
+        self._write_held = True
+        try:
+            yield
+        except BaseException:
+            self.rolled_back()
+            raise
+        finally:
+            self._write_held = False
+        self.committed()
+
+    def committed(self):
+        # what a write held back until it was durable goes out now
+        self.commit_journal()
+        if self.thresholds is not None:
+            self.thresholds.flush()
+
+    def rolled_back(self):
+        self.discard_journal()
+        if self.thresholds is not None:
+            self.thresholds.discard()
+
+    def journal_loaded(self):
+        # rows loaded from elsewhere never went through log_mutation, so only
+        # a checkpoint gets them into the journal
+        if self.journal is None:
+            return
+        if self.write_pending:
+            self._journal_reloaded = True
+        else:
+            self.checkpoint()
+
+    def commit_journal(self):
+        pending, self._journal_pending = self.journal_pending, []
+        reloaded, self._journal_reloaded = getattr(self, '_journal_reloaded', False), False
+        if self.journal is None:
+            return
+        if reloaded:
+            # the checkpoint already holds what the pending records did
+            self.checkpoint()
+            return
+        for record in pending:
+            self.journal.append(*record)
+        if self.journal.needs_checkpoint:
+            self.checkpoint()
+
+    def discard_journal(self):
+        self._journal_pending = []
+        self._journal_reloaded = False
+
+    @timed_method
+    def checkpoint(self):
+        if self.journal is None:
+            raise StockError('No journal configured!')
+        self.journal.checkpoint(self.stock.values())
+
+    @locked_method
+    @timed_method
+    def recover(self):
+        if self.journal is None:
+            raise StockError('No journal configured!')
+        self._stock = collections.OrderedDict()
+        self._name_id_map = collections.OrderedDict()
+        for op, stock_id, value, name in self.journal.replay():
+            if op == journal_module.OP_ENTRY:
+                item_name, _ = name.split('_#')
+                item_data = {'stock_id': stock_id, 'unique_name': name, 'count': value}
+            elif op == journal_module.OP_NEW:
+                item_name = name
+                item_data = self.create_item_data(stock_id, name, value)
+            elif op == journal_module.OP_INCREASE:
+                self.stock[stock_id]['count'] += value
+                continue
+            elif op == journal_module.OP_DELETE:
+                data = self.stock.pop(stock_id)
+                item_name, _ = data['unique_name'].split('_#')
+                self.name_id_map[item_name].discard((stock_id, data['unique_name']))
+                continue
+            else:
+                raise journal_module.JournalError('Unknown journal op {0}!'.format(op))
+            existing_items = self.name_id_map.setdefault(self.catalog.intern(item_name).name, set())
+            existing_items.add((stock_id, item_data['unique_name']))
+            self.stock[stock_id] = item_data
+        if self.shared is not None:
+            self.shared.publish_all()
+        if self.locations is not None:
+            self.locations.rebuild()
+        if self.thresholds is not None:
+            self.thresholds.rebuild()
+        return len(self.stock)
+
+    @property
+    def catalog(self):
+        if not hasattr(self, '_catalog'):
+            self._catalog = item_module.ItemCatalog()
+        return self._catalog
+
+    def register_item(self, identifier, sku=None, price=None):
+        return self.catalog.intern(identifier, sku=sku, price=price)
+
+    @property
+    def reservations(self):
+        if not hasattr(self, '_reservations'):
+            self._reservations = reservation_module.ReservationBook(self)
+        return self._reservations
+
+    def available_to_promise(self, item_or_stock_id):
+        if isinstance(item_or_stock_id, int):
+            return self.reservations.available(item_or_stock_id)
+        return self.reservations.available_for_item(item_or_stock_id)
+
+    @property
+    def metrics(self):
+        if not hasattr(self, '_metrics'):
+            self._metrics = None
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self._metrics = value
+        untimed = getattr(type(self), 'untimed_class', type(self))
+        self.__class__ = untimed if value is None else timed_class(untimed)
+
+    def enable_metrics(self, metrics=None):
+        self.metrics = metrics if metrics is not None else metrics_module.Metrics()
+        return self.metrics
+
     @property 
     def stock(self):
         if not hasattr(self, '_stock'):
@@ -62,14 +404,19 @@ class Stockist(object):
         return self._name_id_map
     
     def stock_ids_for_item(self, item):
-        return [stock_id for stock_id, _ in self.name_id_map.get(str(item), set())]
+        return [
+            stock_id for stock_id, _ in
+            self.name_id_map.get(item_module.ItemCatalog.name_of(item), set())
+        ]
 
+    @timed_method
     def stock_for_item(self, item):
         return [
             self.stock[stock_id]
             for stock_id in self.stock_ids_for_item(item)
         ]
 
+    @timed_method
     def __getitem__(self, item_or_stock_id):
         if isinstance(item_or_stock_id, int):
             return self.stock[item_or_stock_id]
@@ -89,14 +436,13 @@ class Stockist(object):
         if isinstance(item_or_stock_id, int):
             self.delete_stock_entry(item_or_stock_id)
         else:
-            for stock_id in self.stock_ids_for_item(item_or_stock_id):
-                self.delete_stock_entry(stock_id)
+            self.delete_where(item=item_or_stock_id)
 
     def __contains__(self, item_or_stock_id):
         if isinstance(item_or_stock_id, int):
             return item_or_stock_id in self.stock
         else:
-            return str(item_or_stock_id) in self.name_id_map
+            return item_module.ItemCatalog.name_of(item_or_stock_id) in self.name_id_map
 
     @property
     def stock_ids(self):
@@ -140,14 +486,75 @@ class Stockist(object):
         return self._next_free_stock_id
 
     @locked_method
+    @timed_method
     def delete_stock_entry(self, old_id):
         data = self.stock[old_id]
         unique_name = data['unique_name']
         item_name, _ = unique_name.split('_#')
         self.name_id_map[item_name].discard((old_id, unique_name))
         del self.stock[old_id]
+        self.log_mutation(journal_module.OP_DELETE, old_id)
+
+    def matching_stock_ids(self, item=None, count_eq=None, ids=None):
+        if item is None and count_eq is None and ids is None:
+            raise StockError('Unable to delete without a condition!')
+        if item is not None:
+            candidates = self.stock_ids_for_item(item)
+            if ids is not None:
+                candidates = set(candidates).intersection(ids)
+        elif ids is not None:
+            candidates = [stock_id for stock_id in ids if stock_id in self.stock]
+        else:
+            candidates = self.stock
+        return sorted(set(
+            stock_id for stock_id in candidates
+            if count_eq is None or self.stock[stock_id].get('count', 0) == count_eq
+        ))
 
     @locked_method
+    @timed_method
+    def delete_where(self, item=None, count_eq=None, ids=None):
+        # every matching entry goes in one pass over the map, not one delete per id
+        deleted = self.matching_stock_ids(item, count_eq, ids)
+        for stock_id in deleted:
+            unique_name = self.stock.pop(stock_id)['unique_name']
+            item_name, _ = unique_name.split('_#')
+            self.name_id_map[item_name].discard((stock_id, unique_name))
+            self.log_mutation(journal_module.OP_DELETE, stock_id)
+        return deleted
+
+    @timed_method
+    def apply_changes(self, entries, deleted_ids):
+        # rows as another writer left them; unchanged rows are skipped
+        changed = []
+        for stock_id in deleted_ids:
+            data = self.stock.pop(stock_id, None)
+            if data is None:
+                continue
+            item_name, _ = data['unique_name'].split('_#')
+            self.name_id_map.get(item_name, set()).discard((stock_id, data['unique_name']))
+            changed.append(stock_id)
+        for data in entries:
+            stock_id = data['stock_id']
+            existing = self.stock.get(stock_id)
+            if existing == data:
+                continue
+            if existing is not None and existing['unique_name'] != data['unique_name']:
+                item_name, _ = existing['unique_name'].split('_#')
+                self.name_id_map.get(item_name, set()).discard((stock_id, existing['unique_name']))
+            item_name, _ = data['unique_name'].split('_#')
+            item_name = self.catalog.intern(item_name).name
+            self.name_id_map.setdefault(item_name, set()).add((stock_id, data['unique_name']))
+            self.stock[stock_id] = dict(data)
+            changed.append(stock_id)
+        for stock_id in changed:
+            self.notify(stock_id)
+        if changed:
+            self.journal_loaded()
+        return changed
+
+    @locked_method
+    @timed_method
     def new_stock_item(self, item, new_id=None, force=False):
         if item is None:
             raise StockError('Unable to process NoneType!')
@@ -158,12 +565,100 @@ class Stockist(object):
                 self.delete_stock_entry(new_id)
             else:
                 raise StockError('Stock ID already in use!')
-        item_data = self.create_item_data(new_id, item)
-        existing_items = self.name_id_map.setdefault(str(item), set())
+        # interning formats the item once; its cached name is the map key
+        item_name = self.catalog.intern(item).name
+        item_data = self.create_item_data(new_id, item_name)
+        existing_items = self.name_id_map.setdefault(item_name, set())
         existing_items.add((new_id, item_data['unique_name']))
         self.stock[new_id] = item_data
+        self.log_mutation(journal_module.OP_NEW, new_id, item_data['count'], item_name)
         return new_id
 
+    @timed_method
+    def find(self, count_lt=None, count_between=None, name_prefix=None,
+             limit=None, offset=0, order_by='pk', after=None):
+        return query_module.evaluate_find(
+            self.stock.values(),
+            count_lt=count_lt,
+            count_between=count_between,
+            name_prefix=name_prefix,
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            after=after,
+        )
+
+    def iter_find(self, page_size=500, limit=None, offset=0, order_by='pk', **filters):
+        # the stock is already in memory, so filter and sort it once and walk
+        # the result instead of re-sorting it for every page
+        results = self.find(order_by=order_by, **filters)
+        stop = None if limit is None else offset + limit
+        for data in itertools.islice(results, offset, stop):
+            yield data
+
+    @timed_method
+    def item_totals(self):
+        return aggregate_module.evaluate_item_totals(self.stock, self.name_id_map)
+
+    @timed_method
+    def count_histogram(self, edges=None):
+        edges = aggregate_module.check_edges(aggregate_module.DEFAULT_EDGES if edges is None else edges)
+        return aggregate_module.evaluate_histogram(
+            [data.get('count', 0) for data in self.stock.values()],
+            edges,
+        )
+
+    def count_arrays(self):
+        return vectorized_module.count_arrays(self.stock)
+
+    @timed_method
+    def count_statistics(self, percentiles=(50, 90, 99)):
+        _, counts = self.count_arrays()
+        return vectorized_module.count_statistics(counts, percentiles)
+
+    def zero_count_ids(self):
+        ids, counts = self.count_arrays()
+        return ids[counts == 0]
+
+    @timed_method
+    def apply_deltas(self, stock_ids, deltas, allow_negative=False):
+        ids, counts = self.count_arrays()
+        changed_ids, new_counts, applied = vectorized_module.plan_adjustment(
+            ids, counts, stock_ids, deltas, allow_negative=allow_negative
+        )
+        for stock_id, count, delta in zip(changed_ids.tolist(), new_counts.tolist(), applied.tolist()):
+            self.stock[stock_id]['count'] = count
+            self.log_mutation(journal_module.OP_INCREASE, stock_id, delta)
+        return changed_ids, new_counts, applied
+
+    def check_decrement(self, lines):
+        for stock_id, quantity in sorted(lines.items()):
+            if stock_id not in self.stock:
+                raise KeyError(stock_id)
+            if self.stock[stock_id].get('count', 0) < quantity:
+                raise StockError('Not enough stock for {0}!'.format(stock_id))
+
+    @timed_method
+    def decrement_stock(self, lines):
+        self.check_decrement(lines)
+        for stock_id, quantity in sorted(lines.items()):
+            self.stock[stock_id]['count'] -= quantity
+            self.log_mutation(journal_module.OP_INCREASE, stock_id, -quantity)
+
+    @property
+    def checkout_engine(self):
+        if not hasattr(self, '_checkout_engine'):
+            self._checkout_engine = checkout_module.CheckoutEngine(self)
+        return self._checkout_engine
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield self
+
+    @property
+    def in_transaction(self):
+        return getattr(self, '_transaction_depth', 0) > 0
+
     def list_stocked_item_ids(self):
         return [_id for _id, count in self.stock_count if count]
 
@@ -172,7 +667,7 @@ class Stockist(object):
             return item_or_stock_id in self.stock
         elif item_or_stock_id is None:
             raise StockError('Unable to process NoneType!')
-        return str(item_or_stock_id) in self.name_id_map
+        return item_module.ItemCatalog.name_of(item_or_stock_id) in self.name_id_map
 
     def item_in_stock(self, item_or_stock_id):
         if isinstance(item_or_stock_id, int):
@@ -190,6 +685,7 @@ class Stockist(object):
         except KeyError:
             return False
 
+    @timed_method
     def last_stock_id_for_item(self, item):
         try:
             return sorted(self.stock_ids_for_item(item))[-1]
@@ -199,18 +695,46 @@ class Stockist(object):
     def last_stock_entry_for_item(self, item):
         return self.stock.get(self.last_stock_id_for_item(item), None)
 
-    def stock_item(self, item=None, item_id=None, amount=1, create=False):
+    @timed_method
+    def stock_item(self, item=None, item_id=None, amount=1, create=False, location=None):
         if item is not None:
             if create or not self.item_stocked(item):
                 item_id = self.new_stock_item(item, item_id)
             elif item_id is None:
                 item_id = self.last_stock_id_for_item(item)
-        self.increase_stock(item_id, amount)
+        if location is None:
+            self.increase_stock(item_id, amount)
+        else:
+            self.increase_stock_at(item_id, location, amount)
         return item_id
 
+    @timed_method
     def increase_stock(self, stock_id, amount=1):
         if isinstance(amount, int) and isinstance(stock_id, int):
             self.stock[stock_id]['count'] += amount
+            self.log_mutation(journal_module.OP_INCREASE, stock_id, amount)
+
+    def location_cursor(self):
+        return contextlib.nullcontext()
+
+    @timed_method
+    def increase_stock_at(self, stock_id, location, amount=1):
+        # the location moves first, then the batch's own count by the same amount
+        if self.locations is None:
+            raise StockError('Locations not enabled!')
+        with self.transaction():
+            with self.location_cursor() as cur:
+                self.locations.adjust(cur, stock_id, location, amount)
+            self.increase_stock(stock_id, amount)
+
+    @timed_method
+    def transfer(self, stock_id, source, destination, amount):
+        # the batch's count is unchanged, only its split between locations
+        if self.locations is None:
+            raise StockError('Locations not enabled!')
+        with self.transaction():
+            with self.location_cursor() as cur:
+                self.locations.transfer(cur, stock_id, source, destination, amount)
 
 
 class DatabaseStockist(Stockist):
@@ -222,6 +746,20 @@ class DatabaseStockist(Stockist):
     INSERT_SQL_STRING = None
     DELETE_SQL_STRING = None
     UPDATE_SQL_STRING = None
+    PLACEHOLDER = None
+    ITEM_NAME_SQL_EXPRESSION = None
+    TABLE_EXISTS_SQL_STRING = None
+    DECREMENT_SQL_STRING = "UPDATE {table} SET count=count-{p} WHERE pk={p} AND count>={p}"
+    # id lists longer than this are deleted through a temporary table join
+    DELETE_INLINE_IDS = 500
+    DELETE_IDS_TABLE = "stock_delete_ids"
+    CREATE_DELETE_IDS_SQL_STRING = "CREATE TEMPORARY TABLE IF NOT EXISTS {table}(pk BIGINT PRIMARY KEY)"
+    INSERT_DELETE_IDS_SQL_STRING = "INSERT INTO {table} VALUES({p})"
+    CREATE_INDEX_SQL_STRINGS = (
+        "CREATE INDEX IF NOT EXISTS {table}_pk ON {table}(pk)",
+        "CREATE INDEX IF NOT EXISTS {table}_count ON {table}(count, pk)",
+        "CREATE INDEX IF NOT EXISTS {table}_name ON {table}(name)",
+    )
 
     StockEntry = collections.namedtuple('StockEntry', ['pk', 'name', 'count'])
 
@@ -232,26 +770,282 @@ class DatabaseStockist(Stockist):
     def connection(self):
         if self._connection is None:
             raise StockConnectionError('No database connection!')
+        metrics = getattr(self, '_metrics', None)
+        if metrics is not None and metrics.enabled:
+            return metrics_module.InstrumentedConnection(self._connection, metrics)
         return self._connection
 
     @connection.setter
     def connection(self, value):
         raise NotImplemented
 
+    @property
+    def storage(self):
+        if not hasattr(self, '_storage'):
+            self._storage = storage_module.SQLStorage(self)
+        return self._storage
+
+    @property
+    def history(self):
+        if not hasattr(self, '_history'):
+            self._history = None
+        return self._history
+
+    @history.setter
+    def history(self, value):
+        self._history = value
+
+    def enable_history(self, checkpoint_every=1000, create=True):
+        # without create, only attach when an earlier run started recording
+        exists = self.table_exists(history_module.StockHistory.HISTORY_TABLE)
+        if not create and not exists:
+            return None
+        self.history = history_module.StockHistory(self, checkpoint_every=checkpoint_every)
+        self.history.create_tables()
+        if not exists:
+            # deltas build on the counts the table already holds
+            totals = dict((stock_id, count) for stock_id, _, count in self.storage.scan() if count)
+            if totals:
+                self.history.checkpoint(totals=totals)
+        return self.history
+
+    @property
+    def merkle(self):
+        if not hasattr(self, '_merkle'):
+            self._merkle = None
+        return self._merkle
+
+    @merkle.setter
+    def merkle(self, value):
+        self._merkle = value
+
+    def enable_merkle(self, bucket_width=64, fanout=16, create=True):
+        # without create, only attach when an earlier run left the side table
+        if not create and not self.table_exists(merkle_module.StockMerkle.MERKLE_TABLE):
+            return None
+        self.merkle = merkle_module.StockMerkle(self, bucket_width=bucket_width, fanout=fanout)
+        self.merkle.create_tables()
+        return self.merkle
+
+    def enable_locations(self, create=True):
+        # without create, only attach when an earlier run placed stock
+        if not create and not self.table_exists(locations_module.StockLocations.LOCATION_TABLE):
+            return None
+        locations = super(DatabaseStockist, self).enable_locations()
+        locations.create_tables()
+        locations.load()
+        return locations
+
+    @contextlib.contextmanager
+    def location_cursor(self):
+        with self.writing() as connection:
+            yield connection.cursor()
+
+    def enable_thresholds(self, dispatcher=None, create=True):
+        # without create, only attach when an earlier run stored thresholds
+        if not create and not self.table_exists(thresholds_module.StockThresholds.THRESHOLD_TABLE):
+            return None
+        thresholds = super(DatabaseStockist, self).enable_thresholds(dispatcher)
+        thresholds.create_tables()
+        thresholds.load()
+        return thresholds
+
+    def table_exists(self, table):
+        if self.TABLE_EXISTS_SQL_STRING is None:
+            raise NotImplementedError
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.TABLE_EXISTS_SQL_STRING.format(p=self.PLACEHOLDER), (table,))
+            return cur.fetchone()[0] is not None
+
+    def verify(self):
+        if self.merkle is None:
+            raise StockError('Verification not enabled!')
+        return self.merkle.verify()
+
+    def repair(self, source='database'):
+        if self.merkle is None:
+            raise StockError('Verification not enabled!')
+        return self.merkle.repair(source)
+
+    def notify(self, stock_id):
+        if self.merkle is not None:
+            self.merkle.touch(stock_id)
+        super(DatabaseStockist, self).notify(stock_id)
+
+    def apply_changes(self, entries, deleted_ids):
+        changed = super(DatabaseStockist, self).apply_changes(entries, deleted_ids)
+        if self.merkle is not None:
+            # these rows came from the database, so that is what it holds now
+            self.merkle.accept(changed)
+        if self.history is not None and changed:
+            # the writer may not have kept history; fill in what it left out
+            with self.writing() as connection:
+                self.history.reconcile(connection.cursor(), dict(
+                    (stock_id, self.stock[stock_id]['count'] if stock_id in self.stock else 0)
+                    for stock_id in changed
+                ))
+        return changed
+
+    def sync_from_db(self):
+        # the whole table compared with memory; only differing rows change
+        stock_data = self.database_stock
+        return self.apply_changes(
+            stock_data.values(),
+            [stock_id for stock_id in self.stock if stock_id not in stock_data],
+        )
+
+    def count_at(self, stock_id, t):
+        if self.history is None:
+            raise StockError('History not enabled!')
+        return self.history.count_at(stock_id, t)
+
+    def totals_at(self, t):
+        if self.history is None:
+            raise StockError('History not enabled!')
+        return self.history.totals_at(t)
+
     @staticmethod
     def select(cur, table_name, what="*"):
         cur.execute(DatabaseStockist.SELECT_SQL_STRING.format(what=what, table=table_name))
         return cur.fetchall()
 
+    @contextlib.contextmanager
+    def transaction(self):
+        # writes inside share one commit instead of committing per call
+        depth = getattr(self, '_transaction_depth', 0)
+        self._transaction_depth = depth + 1
+        try:
+            with self.touching() as touched:
+                try:
+                    yield self
+                    if not depth:
+                        self.connection.commit()
+                except BaseException:
+                    if not depth:
+                        # the database drops the writes, so memory must too
+                        self.connection.rollback()
+                        self.reload_rows(touched)
+                        if self.locations is not None and self.locations.persistent:
+                            self.locations.load()
+                        self.rolled_back()
+                    raise
+        finally:
+            self._transaction_depth = depth
+        if not depth:
+            self.committed()
+            self.after_write()
+
+    @contextlib.contextmanager
+    def writing(self):
+        if self.in_transaction:
+            yield self.connection
+        else:
+            with self.connection as connection:
+                yield connection
+                connection.commit()
+
+    def after_write(self):
+        if self.history is not None and not self.in_transaction:
+            self.history.maybe_checkpoint()
+
+    def create_indexes(self, cur):
+        for index_sql in self.CREATE_INDEX_SQL_STRINGS:
+            cur.execute(index_sql.format(table=self.STOCK_TABLE))
+
+    @timed_method
+    def find(self, count_lt=None, count_between=None, name_prefix=None,
+             limit=None, offset=0, order_by='pk', after=None):
+        if self.PLACEHOLDER is None:
+            raise NotImplementedError
+        sql, params = query_module.compile_find(
+            self.STOCK_TABLE,
+            self.PLACEHOLDER,
+            count_lt=count_lt,
+            count_between=count_between,
+            name_prefix=name_prefix,
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            after=after,
+            item_name_expression=self.ITEM_NAME_SQL_EXPRESSION,
+        )
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(sql, params)
+            return [
+                {
+                    'stock_id': stock_id,
+                    'unique_name': name,
+                    'count': count,
+                }
+                for stock_id, name, count in cur.fetchall()
+            ]
+
+    def iter_find(self, page_size=500, limit=None, offset=0, order_by='pk', **filters):
+        after = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            # the offset only skips into the first page, later pages use the keyset
+            page = self.find(limit=size, offset=offset, order_by=order_by, after=after, **filters)
+            offset = 0
+            for data in page:
+                yield data
+            if len(page) < size:
+                return
+            after = query_module.page_key(page[-1], order_by)
+            if remaining is not None:
+                remaining -= len(page)
+
+    @timed_method
+    def item_totals(self):
+        if self.ITEM_NAME_SQL_EXPRESSION is None:
+            raise NotImplementedError
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(aggregate_module.compile_item_totals(
+                self.STOCK_TABLE,
+                self.ITEM_NAME_SQL_EXPRESSION,
+            ))
+            return [aggregate_module.ItemTotals(*row) for row in cur.fetchall()]
+
+    @timed_method
+    def count_histogram(self, edges=None):
+        if self.PLACEHOLDER is None:
+            raise NotImplementedError
+        edges = aggregate_module.check_edges(aggregate_module.DEFAULT_EDGES if edges is None else edges)
+        sql, params = aggregate_module.compile_histogram(self.STOCK_TABLE, self.PLACEHOLDER, edges)
+        with self.connection as connection:
+            cur = connection.cursor()
+            cur.execute(sql, params)
+            return aggregate_module.histogram_buckets(edges, dict(
+                (bucket, batches) for bucket, batches in cur.fetchall()
+            ))
+
     @locked_method
+    @timed_method
     def update_stock_from_db(self, force=False):
-        if force or self.is_missing_stock_from_database:
+        if force and self.stock:
+            # a forced update also applies changed counts and deletions
+            self.sync_from_db()
+        elif force or self.is_missing_stock_from_database:
             stock_data = self.database_stock
             for data in stock_data.values():
                 item_name, _ = data['unique_name'].split('_#')
+                item_name = self.catalog.intern(item_name).name
                 existing_items = self.name_id_map.setdefault(item_name, set())
                 existing_items.add((data['stock_id'], data['unique_name']))
             self.stock.update(stock_data)
+            if self.merkle is not None:
+                self.merkle.rebuild_memory()
+            if self.shared is not None:
+                self.shared.publish_all()
+            if self.locations is not None:
+                self.locations.rebuild()
+            if self.thresholds is not None:
+                self.thresholds.rebuild()
+            self.journal_loaded()
 
     @property
     def is_database_up_to_date(self):
@@ -267,30 +1061,45 @@ class DatabaseStockist(Stockist):
             return True
         return bool(set(stock_data) - set(self.stock))
 
+    @timed_method
     def dump_stock_to_database(self):
         with self.connection as connection:
             cur = connection.cursor()
             cur.execute(self.DROP_SQL_STRING.format(table=self.STOCK_TABLE))
             cur.execute(self.CREATE_SQL_STRING.format(table=self.STOCK_TABLE))
+            self.create_indexes(cur)
             cur.executemany(
                 self.INSERT_SQL_STRING.format(table=self.STOCK_TABLE),
                 self.create_stock_entries()
             )
             connection.commit()
+        if self.merkle is not None:
+            self.merkle.rebuild_table()
 
+    @timed_method
     def reset_database(self):
         with self.connection as connection:
             cur = connection.cursor()
             cur.execute(self.DROP_SQL_STRING.format(table=self.STOCK_TABLE))
             cur.execute(self.CREATE_SQL_STRING.format(table=self.STOCK_TABLE))
+            self.create_indexes(cur)
             connection.commit()
-
+        if self.history is not None:
+            self.history.reset()
+        if self.merkle is not None:
+            self.merkle.reset()
+        if self.locations is not None:
+            self.locations.reset()
+
+    @timed_method
     def create_database(self):
         with self.connection as connection:
             cur = connection.cursor()
             cur.execute(self.CREATE_SQL_STRING.format(table=self.STOCK_TABLE))
+            self.create_indexes(cur)
             connection.commit()
 
+    @timed_method
     def update_database(self, force=False):
         if force:
             entries = self.create_stock_entries()
@@ -308,6 +1117,8 @@ class DatabaseStockist(Stockist):
                 entries
             )
             connection.commit()
+        if self.merkle is not None:
+            self.merkle.rebuild_table()
 
     def create_stock_entry(self, stock_id):
         data = self.stock[stock_id]
@@ -326,58 +1137,169 @@ class DatabaseStockist(Stockist):
             ) for data in self.stock.values()
         ]
 
+    @timed_method
     def new_stock_item(self, item, new_id=None, force=False, update_db=True):
-        new_id = super(DatabaseStockist, self).new_stock_item(item, new_id, force)
-        if self.INSERT_SQL_STRING is None and update_db:
-            raise NotImplementedError
-        elif update_db:
-            with self.connection as connection:
-                cur = connection.cursor()
-                cur.execute(
-                    self.INSERT_SQL_STRING.format(table=self.STOCK_TABLE),
-                    self.create_stock_entry(new_id)
-                )
-                connection.commit()
-        return new_id
-
+        with self.write_held(update_db):
+            new_id = super(DatabaseStockist, self).new_stock_item(item, new_id, force)
+            if self.INSERT_SQL_STRING is None and update_db:
+                raise NotImplementedError
+            elif update_db:
+                with self.transaction():
+                    self.storage.insert(*self.create_stock_entry(new_id))
+                    if self.merkle is not None:
+                        self.merkle.record(self.connection.cursor(), [new_id])
+            return new_id
+
+    @timed_method
     def delete_stock_entry(self, old_id, update_db=True):
-        super(DatabaseStockist, self).delete_stock_entry(old_id)
-        if self.DELETE_SQL_STRING is None and update_db:
+        with self.write_held(update_db):
+            old_count = self.stock[old_id].get('count', 0) if old_id in self.stock else 0
+            super(DatabaseStockist, self).delete_stock_entry(old_id)
+            if self.DELETE_SQL_STRING is None and update_db:
+                raise NotImplementedError
+            elif update_db:
+                with self.transaction():
+                    self.storage.delete(old_id)
+                    cur = self.connection.cursor()
+                    if self.history is not None:
+                        self.history.record(cur, old_id, -old_count)
+                    if self.merkle is not None:
+                        self.merkle.record(cur, [old_id])
+                    if self.locations is not None:
+                        self.locations.delete_rows(cur, [old_id])
+
+    @timed_method
+    def delete_where(self, item=None, count_eq=None, ids=None, update_db=True):
+        if self.PLACEHOLDER is None and update_db:
             raise NotImplementedError
-        elif update_db:
-            with self.connection as connection:
-                cur = connection.cursor()
-                cur.execute(
-                    self.DELETE_SQL_STRING.format(table=self.STOCK_TABLE), 
-                    (old_id,)
+        if not update_db:
+            return super(DatabaseStockist, self).delete_where(item, count_eq, ids)
+        # memory is deleted inside the transaction, so a failed delete puts it back
+        with self.transaction():
+            old_counts = dict(
+                (stock_id, self.stock[stock_id].get('count', 0))
+                for stock_id in self.matching_stock_ids(item, count_eq, ids)
+            )
+            deleted = super(DatabaseStockist, self).delete_where(item, count_eq, ids)
+            if not deleted:
+                return deleted
+            if ids is not None:
+                # the database only holds what memory held, so matched ids are enough
+                ids = deleted
+            cur = self.connection.cursor()
+            id_table = None
+            if ids is not None and len(ids) > self.DELETE_INLINE_IDS:
+                id_table = self.DELETE_IDS_TABLE
+                cur.execute(self.CREATE_DELETE_IDS_SQL_STRING.format(table=id_table))
+                cur.executemany(
+                    self.INSERT_DELETE_IDS_SQL_STRING.format(table=id_table, p=self.PLACEHOLDER),
+                    [(stock_id,) for stock_id in ids]
                 )
-                connection.commit()
-
+            sql, params = query_module.compile_delete(
+                self.STOCK_TABLE,
+                self.PLACEHOLDER,
+                item_name=None if item is None else item_module.ItemCatalog.name_of(item),
+                count_eq=count_eq,
+                ids=ids,
+                id_table=id_table,
+            )
+            cur.execute(sql, params)
+            if id_table is not None:
+                cur.execute(self.DROP_SQL_STRING.format(table=id_table))
+            if self.history is not None:
+                self.history.record_many(cur, [
+                    (stock_id, -old_counts[stock_id]) for stock_id in deleted
+                ])
+            if self.merkle is not None:
+                self.merkle.record(cur, deleted)
+            if self.locations is not None:
+                self.locations.delete_rows(cur, deleted)
+        return deleted
+
+    @timed_method
     def increase_stock(self, stock_id, amount=1, update_db=True):
-        super(DatabaseStockist, self).increase_stock(stock_id, amount)
-        if self.UPDATE_SQL_STRING is None and update_db:
+        with self.write_held(update_db):
+            super(DatabaseStockist, self).increase_stock(stock_id, amount)
+            if self.UPDATE_SQL_STRING is None and update_db:
+                raise NotImplementedError
+            if update_db:
+                with self.transaction():
+                    self.storage.put(*self.create_stock_entry(stock_id))
+                    cur = self.connection.cursor()
+                    if self.history is not None and isinstance(amount, int):
+                        self.history.record(cur, stock_id, amount)
+                    if self.merkle is not None:
+                        self.merkle.record(cur, [stock_id])
+
+    @timed_method
+    def apply_deltas(self, stock_ids, deltas, allow_negative=False, update_db=True):
+        with self.write_held(update_db):
+            if self.UPDATE_SQL_STRING is None and update_db:
+                raise NotImplementedError
+            changed_ids, new_counts, applied = super(DatabaseStockist, self).apply_deltas(
+                stock_ids, deltas, allow_negative=allow_negative
+            )
+            if update_db and len(changed_ids):
+                ids = changed_ids.tolist()
+                with self.writing() as connection:
+                    cur = connection.cursor()
+                    cur.executemany(
+                        self.UPDATE_SQL_STRING.format(table=self.STOCK_TABLE),
+                        list(zip(new_counts.tolist(), ids))
+                    )
+                    if self.history is not None:
+                        self.history.record_many(cur, zip(ids, applied.tolist()))
+                    if self.merkle is not None:
+                        self.merkle.record(cur, ids)
+                self.after_write()
+            return changed_ids, new_counts, applied
+
+    @timed_method
+    def decrement_stock(self, lines, update_db=True):
+        if self.PLACEHOLDER is None and update_db:
             raise NotImplementedError
+        self.check_decrement(lines)
         if update_db:
-            with self.connection as connection:
+            decrement = self.DECREMENT_SQL_STRING.format(table=self.STOCK_TABLE, p=self.PLACEHOLDER)
+            connection = self.connection
+            try:
                 cur = connection.cursor()
-                cur.execute(
-                    self.UPDATE_SQL_STRING.format(table=self.STOCK_TABLE),
-                    (self.stock[stock_id]['count'], stock_id)
-                )
-                connection.commit()
+                # rows are always taken in pk order so concurrent checkouts
+                # cannot lock each other out
+                for stock_id, quantity in sorted(lines.items()):
+                    cur.execute(decrement, (quantity, stock_id, quantity))
+                    if cur.rowcount != 1:
+                        raise StockError('Not enough stock for {0}!'.format(stock_id))
+                if self.history is not None:
+                    self.history.record_many(cur, [
+                        (stock_id, -quantity) for stock_id, quantity in sorted(lines.items())
+                    ])
+                if self.merkle is not None:
+                    self.merkle.record(cur, sorted(lines), counts=dict(
+                        (stock_id, self.stock[stock_id]['count'] - quantity)
+                        for stock_id, quantity in lines.items()
+                    ))
+                if not self.in_transaction:
+                    connection.commit()
+            except Exception:
+                # inside a transaction() the caller owns the rollback
+                if not self.in_transaction:
+                    connection.rollback()
+                raise
+            self.after_write()
+        super(DatabaseStockist, self).decrement_stock(lines)
 
     @property
+    @timed_method
     def database_stock(self):
-        with self.connection:
-            cur = self.connection.cursor()
-            return {
-                stock_id: {
-                    'stock_id': stock_id,
-                    'unique_name': name,
-                    'count': count,
-                }
-                for stock_id, name, count in self.select(cur, self.STOCK_TABLE)
+        return {
+            stock_id: {
+                'stock_id': stock_id,
+                'unique_name': name,
+                'count': count,
             }
+            for stock_id, (name, count) in self.storage.snapshot().items()
+        }
 
 
 class SQLiteStockist(DatabaseStockist):
@@ -385,6 +1307,9 @@ class SQLiteStockist(DatabaseStockist):
     INSERT_SQL_STRING = "INSERT INTO {table} VALUES(?, ?, ?)"
     UPDATE_SQL_STRING = "UPDATE {table} SET count=? where pk=?"
     DELETE_SQL_STRING = "DELETE FROM {table} WHERE pk=?"
+    PLACEHOLDER = "?"
+    ITEM_NAME_SQL_EXPRESSION = "substr(name, 1, instr(name, '_#') - 1)"
+    TABLE_EXISTS_SQL_STRING = "SELECT MAX(name) FROM sqlite_master WHERE type='table' AND name={p}"
 
     def __init__(self, database=None):
         super(SQLiteStockist, self).__init__()
@@ -404,7 +1329,11 @@ class SQLiteStockist(DatabaseStockist):
         if isinstance(value, sqlite3.Connection):
             self._connection = value
         else:
-            self._connection = sqlite3.connect(value) if value is not None else None
+            # callers such as the checkout engine serialise access themselves
+            self._connection = (
+                sqlite3.connect(value, check_same_thread=False)
+                if value is not None else None
+            )
     
     @property 
     def memcon(self):
@@ -419,6 +1348,48 @@ class SQLiteStockist(DatabaseStockist):
         else:
             self._memcon = sqlite3.connect(value) if value is not None else None
 
+    @property
+    def changes(self):
+        if not hasattr(self, '_changes'):
+            self._changes = None
+        return self._changes
+
+    @changes.setter
+    def changes(self, value):
+        self._changes = value
+
+    def enable_change_tracking(self, keep=10000):
+        # other processes writing the same file become visible through refresh()
+        self.changes = changes_module.StockChangeLog(self, keep=keep)
+        self.changes.install()
+        return self.changes
+
+    def disable_change_tracking(self):
+        if self.changes is not None:
+            self.changes.uninstall()
+            self.changes = None
+
+    def refresh(self):
+        if self.changes is None:
+            raise StockError('Change tracking not enabled!')
+        return self.changes.poll()
+
+    def start_polling(self, interval=1.0, lock=None):
+        if self.changes is None:
+            self.enable_change_tracking()
+        return changes_module.ChangePoller(self.changes, interval=interval, lock=lock).start()
+
+    def dump_stock_to_database(self):
+        super(SQLiteStockist, self).dump_stock_to_database()
+        if self.changes is not None:
+            # the triggers went with the old table; readers must reload in full
+            self.changes.install(reset=True)
+
+    def reset_database(self):
+        super(SQLiteStockist, self).reset_database()
+        if self.changes is not None:
+            self.changes.install(reset=True)
+
     def export_stock_to_sql(self):
         with self.memcon:
             cur = self.memcon.cursor()
@@ -436,11 +1407,14 @@ class PostgreSQLStockist(DatabaseStockist):
     INSERT_SQL_STRING = "INSERT INTO {table} VALUES (%s, %s, %s)"
     UPDATE_SQL_STRING = "UPDATE {table} set count=%s where pk=%s"
     DELETE_SQL_STRING = "DELETE FROM {table} WHERE pk=%s"
+    PLACEHOLDER = "%s"
+    ITEM_NAME_SQL_EXPRESSION = "split_part(name, '_#', 1)"
+    TABLE_EXISTS_SQL_STRING = "SELECT to_regclass({p})"
 
     def __init__(self, database=None, username=None, password=None):
         super(PostgreSQLStockist, self).__init__()
         if database is not None:
-            self.connection = psycopg2.connect(
+            self.connection = load_psycopg2().connect(
                 database=database,
                 user=username,
                 password=password,
@@ -452,18 +1426,152 @@ class PostgreSQLStockist(DatabaseStockist):
 
     @connection.setter
     def connection(self, value):
-        if isinstance(value, psycopg2.extensions.connection):
-            self._connection = value
-        elif value is None:
+        if value is None:
             self._connection = None
+        elif isinstance(value, load_psycopg2().extensions.connection):
+            self._connection = value
         else: 
             raise ValueError
 
     def new_connection(self, database, username=None, password=None):
         if self.connection is not None:
             self.connection.close()
-        self.connection = psycopg2.connect(
+        self.connection = load_psycopg2().connect(
             database=database,
-            username=username,
+            user=username,
             password=password
         )
+
+
+class StorageStockist(Stockist):
+
+    # every row change reaches the storage backend through notify(), so the
+    # base class mutations persist without per-method overrides
+    def __init__(self, storage=None):
+        self._storage = storage
+        self._applying = False
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            raise StockConnectionError('No storage backend!')
+        return self._storage
+
+    def notify(self, stock_id):
+        if not self._applying:
+            data = self.stock.get(stock_id)
+            if data is None:
+                self.storage.delete(stock_id)
+            else:
+                self.storage.put(stock_id, data['unique_name'], data.get('count', 0))
+        super(StorageStockist, self).notify(stock_id)
+
+    def apply_changes(self, entries, deleted_ids):
+        # these rows came from storage, so nothing is written back
+        self._applying = True
+        try:
+            return super(StorageStockist, self).apply_changes(entries, deleted_ids)
+        finally:
+            self._applying = False
+
+    @contextlib.contextmanager
+    def transaction(self):
+        depth = getattr(self, '_transaction_depth', 0)
+        self._transaction_depth = depth + 1
+        try:
+            with self.touching() as touched:
+                try:
+                    with self.storage.batch():
+                        yield self
+                except BaseException:
+                    if not depth:
+                        self.reload_rows(touched)
+                        self.rolled_back()
+                    raise
+        finally:
+            self._transaction_depth = depth
+        if not depth:
+            self.committed()
+
+    def delete_where(self, item=None, count_eq=None, ids=None):
+        with self.transaction():
+            return super(StorageStockist, self).delete_where(item, count_eq, ids)
+
+    def apply_deltas(self, stock_ids, deltas, allow_negative=False):
+        with self.transaction():
+            return super(StorageStockist, self).apply_deltas(stock_ids, deltas, allow_negative=allow_negative)
+
+    def decrement_stock(self, lines):
+        with self.transaction():
+            super(StorageStockist, self).decrement_stock(lines)
+
+    def enable_merkle(self, bucket_width=64, fanout=16, create=True):
+        if create:
+            raise StockError('Verification needs an SQL database!')
+        return None
+
+    def enable_locations(self, create=True):
+        # locations and thresholds are kept in memory only with this backend
+        if not create:
+            return None
+        return super(StorageStockist, self).enable_locations()
+
+    def enable_thresholds(self, dispatcher=None, create=True):
+        if not create:
+            return None
+        return super(StorageStockist, self).enable_thresholds(dispatcher)
+
+    def enable_history(self, checkpoint_every=1000, create=True):
+        if create:
+            raise StockError('History needs an SQL database!')
+        return None
+
+    @property
+    @timed_method
+    def database_stock(self):
+        return {
+            stock_id: {
+                'stock_id': stock_id,
+                'unique_name': name,
+                'count': count,
+            }
+            for stock_id, (name, count) in self.storage.snapshot().items()
+        }
+
+    def create_database(self):
+        # the backend creates its files on open; this only checks there is one
+        if self._storage is None:
+            raise StockConnectionError('No storage backend!')
+
+    @locked_method
+    @timed_method
+    def update_stock_from_db(self, force=False):
+        stock_data = self.database_stock
+        self.apply_changes(
+            stock_data.values(),
+            [stock_id for stock_id in self.stock if stock_id not in stock_data] if force else [],
+        )
+
+    @timed_method
+    def dump_stock_to_database(self):
+        self.storage.clear()
+        with self.storage.batch():
+            for data in self.stock.values():
+                self.storage.put(data['stock_id'], data['unique_name'], data.get('count', 0))
+
+    @timed_method
+    def reset_database(self):
+        self.storage.clear()
+
+    def close(self):
+        if self._storage is not None:
+            self._storage.close()
+
+
+class DBMStockist(StorageStockist):
+
+    # the standard library dbm family; no SQL engine between a change and disk
+    def __init__(self, database=None, sync_every=64):
+        super(DBMStockist, self).__init__(
+            storage_module.DBMStorage(database, sync_every=sync_every) if database is not None else None
+        )
@@ -0,0 +1,292 @@
+# storage backends (a small key-value protocol over stock rows)
+import contextlib
+import importlib
+import struct
+
+
+# dbm keys are big-endian pks; values are <count><flags> then a utf-8 name
+KEY = struct.Struct('>Q')
+VALUE = struct.Struct('<qB')
+# the name is stored without its '_#<pk>' suffix when it can be rebuilt
+FLAG_SUFFIX = 1
+
+
+class StorageError(Exception):
+    pass
+
+
+def load_dbm():
+    # only the dbm backend needs it, so other backends never import it
+    return importlib.import_module('dbm')
+
+
+def encode_key(stock_id):
+    if stock_id < 0:
+        raise StorageError('Invalid stock id {0}!'.format(stock_id))
+    return KEY.pack(stock_id)
+
+
+def decode_key(key):
+    return KEY.unpack(key)[0]
+
+
+def encode_value(stock_id, name, count):
+    suffix = '_#%d' % stock_id
+    if name.endswith(suffix):
+        return VALUE.pack(count, FLAG_SUFFIX) + name[:-len(suffix)].encode('utf-8')
+    return VALUE.pack(count, 0) + name.encode('utf-8')
+
+
+def decode_value(stock_id, value):
+    count, flags = VALUE.unpack_from(value)
+    name = value[VALUE.size:].decode('utf-8')
+    if flags & FLAG_SUFFIX:
+        name = '%s_#%d' % (name, stock_id)
+    return name, count
+
+
+class StorageBackend(object):
+
+    # rows are (pk, name, count); writes inside batch() land together or not
+    # at all, and snapshot() is a consistent copy as {pk: (name, count)}
+    def get(self, stock_id):
+        raise NotImplementedError
+
+    def put(self, stock_id, name, count):
+        raise NotImplementedError
+
+    def insert(self, stock_id, name, count):
+        # for rows known to be new; backends without a cheaper path just put
+        self.put(stock_id, name, count)
+
+    def delete(self, stock_id):
+        raise NotImplementedError
+
+    def scan(self, start=None, stop=None):
+        raise NotImplementedError
+
+    def batch(self):
+        raise NotImplementedError
+
+    def snapshot(self):
+        return dict((stock_id, (name, count)) for stock_id, name, count in self.scan())
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def in_range(stock_id, start, stop):
+    return (start is None or stock_id >= start) and (stop is None or stock_id < stop)
+
+
+class MemoryStorage(StorageBackend):
+
+    def __init__(self):
+        self.rows = {}
+        # rows as they were before the running batch first wrote them
+        self._undo = None
+
+    def get(self, stock_id):
+        return self.rows.get(stock_id)
+
+    def _set(self, stock_id, row):
+        if self._undo is not None and stock_id not in self._undo:
+            self._undo[stock_id] = self.rows.get(stock_id)
+        if row is None:
+            self.rows.pop(stock_id, None)
+        else:
+            self.rows[stock_id] = row
+
+    def put(self, stock_id, name, count):
+        self._set(stock_id, (name, count))
+
+    def delete(self, stock_id):
+        self._set(stock_id, None)
+
+    def scan(self, start=None, stop=None):
+        rows = self.rows
+        return [(stock_id,) + rows[stock_id] for stock_id in sorted(rows) if in_range(stock_id, start, stop)]
+
+    @contextlib.contextmanager
+    def batch(self):
+        if self._undo is not None:
+            yield self
+            return
+        self._undo = {}
+        try:
+            yield self
+        except BaseException:
+            undo, self._undo = self._undo, None
+            for stock_id, row in undo.items():
+                self._set(stock_id, row)
+            raise
+        self._undo = None
+
+    def clear(self):
+        for stock_id in list(self.rows):
+            self._set(stock_id, None)
+
+
+class DBMStorage(StorageBackend):
+
+    # the dbm family has no transactions and no key order: batches are
+    # buffered and written on success, scans sort the decoded keys
+    def __init__(self, path, sync_every=64):
+        self.path = path
+        self.sync_every = sync_every
+        self._db = self.open('c')
+        self._pending = None
+        self._unsynced = 0
+
+    def open(self, flag):
+        dbm = load_dbm()
+        try:
+            return dbm.open(self.path, flag)
+        except dbm.error as error:
+            raise StorageError('Unable to open {0}: {1}'.format(self.path, error))
+
+    @property
+    def db(self):
+        if self._db is None:
+            raise StorageError('Storage closed!')
+        return self._db
+
+    def get(self, stock_id):
+        key = encode_key(stock_id)
+        if self._pending is not None and key in self._pending:
+            value = self._pending[key]
+        else:
+            value = self.db.get(key)
+        return None if value is None else decode_value(stock_id, value)
+
+    def put(self, stock_id, name, count):
+        self._write(encode_key(stock_id), encode_value(stock_id, name, count))
+
+    def delete(self, stock_id):
+        self._write(encode_key(stock_id), None)
+
+    def _write(self, key, value):
+        if self._pending is not None:
+            self._pending[key] = value
+            return
+        self._apply(key, value)
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def _apply(self, key, value):
+        if value is not None:
+            self.db[key] = value
+        elif key in self.db:
+            del self.db[key]
+
+    def scan(self, start=None, stop=None):
+        rows = dict((key, self.db[key]) for key in self.db.keys())
+        if self._pending is not None:
+            rows.update(self._pending)
+        found = []
+        for key, value in rows.items():
+            stock_id = decode_key(key)
+            if value is not None and in_range(stock_id, start, stop):
+                found.append((stock_id,) + decode_value(stock_id, value))
+        found.sort()
+        return found
+
+    @contextlib.contextmanager
+    def batch(self):
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = {}
+        try:
+            yield self
+        except BaseException:
+            self._pending = None
+            raise
+        pending, self._pending = self._pending, None
+        for key, value in pending.items():
+            self._apply(key, value)
+        self.sync()
+
+    def sync(self):
+        if hasattr(self.db, 'sync'):
+            self.db.sync()
+        self._unsynced = 0
+
+    def clear(self):
+        if self._pending is not None:
+            raise StorageError('Unable to clear inside a batch!')
+        # reopening empty beats a delete per key (dbm.dumb rewrites its index on each)
+        self.db.close()
+        self._db = self.open('n')
+        self._unsynced = 0
+
+    def close(self):
+        if self._db is not None:
+            self.sync()
+            self._db.close()
+            self._db = None
+
+
+class SQLStorage(StorageBackend):
+
+    # the protocol over a DatabaseStockist's own connection and stock table
+    GET_SQL_STRING = "SELECT name, count FROM {table} WHERE pk = {p}"
+    PUT_SQL_STRING = "UPDATE {table} SET name = {p}, count = {p} WHERE pk = {p}"
+    INSERT_SQL_STRING = "INSERT INTO {table} VALUES({p}, {p}, {p})"
+    DELETE_SQL_STRING = "DELETE FROM {table} WHERE pk = {p}"
+    SCAN_SQL_STRING = "SELECT pk, name, count FROM {table}{where} ORDER BY pk"
+    CLEAR_SQL_STRING = "DELETE FROM {table}"
+
+    def __init__(self, stockist):
+        if stockist.PLACEHOLDER is None:
+            raise NotImplementedError
+        self.stockist = stockist
+
+    def sql(self, template, **extra):
+        return template.format(table=self.stockist.STOCK_TABLE, p=self.stockist.PLACEHOLDER, **extra)
+
+    def get(self, stock_id):
+        # plain cursors, so a read inside a transaction does not commit it
+        cur = self.stockist.connection.cursor()
+        cur.execute(self.sql(self.GET_SQL_STRING), (stock_id,))
+        row = cur.fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def put(self, stock_id, name, count):
+        with self.stockist.writing() as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.PUT_SQL_STRING), (name, count, stock_id))
+            if cur.rowcount < 1:
+                cur.execute(self.sql(self.INSERT_SQL_STRING), (stock_id, name, count))
+
+    def insert(self, stock_id, name, count):
+        with self.stockist.writing() as connection:
+            connection.cursor().execute(self.sql(self.INSERT_SQL_STRING), (stock_id, name, count))
+
+    def delete(self, stock_id):
+        with self.stockist.writing() as connection:
+            connection.cursor().execute(self.sql(self.DELETE_SQL_STRING), (stock_id,))
+
+    def scan(self, start=None, stop=None):
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('pk >= {p}')
+            params.append(start)
+        if stop is not None:
+            conditions.append('pk < {p}')
+            params.append(stop)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        cur = self.stockist.connection.cursor()
+        cur.execute(self.sql(self.SCAN_SQL_STRING, where=where.format(p=self.stockist.PLACEHOLDER)), params)
+        return [(stock_id, name, count) for stock_id, name, count in cur.fetchall()]
+
+    def batch(self):
+        return self.stockist.transaction()
+
+    def clear(self):
+        with self.stockist.writing() as connection:
+            connection.cursor().execute(self.sql(self.CLEAR_SQL_STRING))
@@ -0,0 +1,194 @@
+# reorder thresholds (per item or per batch, checked on the changed row only)
+import collections
+import time
+
+from app import events as events_module
+
+
+KIND_ITEM = 'item'
+KIND_BATCH = 'batch'
+EVENT_BELOW = 'below'
+EVENT_RESTORED = 'restored'
+
+ThresholdEvent = collections.namedtuple(
+    'ThresholdEvent', ['event', 'kind', 'target', 'stock_id', 'count', 'threshold', 'ts']
+)
+
+
+class ThresholdError(Exception):
+    pass
+
+
+def item_of(unique_name):
+    return unique_name.split('_#')[0]
+
+
+class StockThresholds(object):
+
+    # item thresholds compare the item's total over all batches, batch
+    # thresholds one batch; events fire only when a count crosses the level
+    THRESHOLD_TABLE = "stock_thresholds"
+    CREATE_SQL_STRING = (
+        "CREATE TABLE IF NOT EXISTS {table}(kind TEXT, target TEXT, level BIGINT, "
+        "PRIMARY KEY(kind, target))"
+    )
+    SELECT_SQL_STRING = "SELECT kind, target, level FROM {table}"
+    INSERT_SQL_STRING = "INSERT INTO {table} VALUES({p}, {p}, {p})"
+    DELETE_SQL_STRING = "DELETE FROM {table} WHERE kind = {p} AND target = {p}"
+
+    def __init__(self, stockist, dispatcher=None, clock=time.time):
+        self.stockist = stockist
+        self.dispatcher = dispatcher if dispatcher is not None else events_module.EventDispatcher()
+        self.clock = clock
+        self.persistent = False
+        self.item_levels = {}
+        self.batch_levels = {}
+        # (item, count) for every watched batch, and totals for watched items
+        self.seen = {}
+        self.totals = {}
+        # events of a write that has not committed yet
+        self.pending = []
+
+    def sql(self, template):
+        return template.format(table=self.THRESHOLD_TABLE, p=self.stockist.PLACEHOLDER)
+
+    def subscribe(self, subscriber):
+        return self.dispatcher.subscribe(subscriber)
+
+    def create_tables(self):
+        with self.stockist.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.CREATE_SQL_STRING))
+            connection.commit()
+        self.persistent = True
+
+    def load(self):
+        with self.stockist.connection as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.SELECT_SQL_STRING))
+            rows = cur.fetchall()
+        self.item_levels = dict((target, level) for kind, target, level in rows if kind == KIND_ITEM)
+        self.batch_levels = dict((int(target), level) for kind, target, level in rows if kind == KIND_BATCH)
+        self.rebuild()
+
+    def rebuild(self):
+        # one pass over the watched rows; afterwards only touched rows are read
+        self.seen = {}
+        self.totals = dict((item, 0) for item in self.item_levels)
+        stock = self.stockist.stock
+        for item in self.item_levels:
+            for stock_id in self.stockist.stock_ids_for_item(item):
+                self._watch(stock_id, item, stock[stock_id].get('count', 0))
+        for stock_id in self.batch_levels:
+            data = stock.get(stock_id)
+            if data is not None and stock_id not in self.seen:
+                self._watch(stock_id, item_of(data['unique_name']), data.get('count', 0))
+
+    def _watch(self, stock_id, item, count):
+        self.seen[stock_id] = (item, count)
+        if item in self.totals:
+            self.totals[item] += count
+
+    def _store(self, kind, target, level):
+        if not self.persistent:
+            return
+        with self.stockist.writing() as connection:
+            cur = connection.cursor()
+            cur.execute(self.sql(self.DELETE_SQL_STRING), (kind, str(target)))
+            if level is not None:
+                cur.execute(self.sql(self.INSERT_SQL_STRING), (kind, str(target), level))
+
+    def set_threshold(self, item_or_stock_id, level):
+        if not isinstance(level, int) or level < 0:
+            raise ThresholdError('Invalid threshold {0}!'.format(level))
+        if isinstance(item_or_stock_id, int):
+            self._store(KIND_BATCH, item_or_stock_id, level)
+            self.batch_levels[item_or_stock_id] = level
+        else:
+            item = self.stockist.catalog.name_of(item_or_stock_id)
+            self._store(KIND_ITEM, item, level)
+            self.item_levels[item] = level
+        self.rebuild()
+
+    def clear_threshold(self, item_or_stock_id):
+        if isinstance(item_or_stock_id, int):
+            kind, target, levels = KIND_BATCH, item_or_stock_id, self.batch_levels
+        else:
+            kind, target, levels = KIND_ITEM, self.stockist.catalog.name_of(item_or_stock_id), self.item_levels
+        if target not in levels:
+            raise ThresholdError('No threshold for {0}!'.format(target))
+        self._store(kind, target, None)
+        del levels[target]
+        self.rebuild()
+
+    def thresholds(self):
+        return sorted(
+            [(KIND_ITEM, item, level) for item, level in self.item_levels.items()] +
+            [(KIND_BATCH, stock_id, level) for stock_id, level in self.batch_levels.items()],
+            key=lambda row: (row[0], str(row[1])),
+        )
+
+    def below(self):
+        # (kind, target, count, level) for every threshold currently undercut
+        rows = []
+        for item, level in sorted(self.item_levels.items()):
+            if self.totals.get(item, 0) < level:
+                rows.append((KIND_ITEM, item, self.totals.get(item, 0), level))
+        for stock_id, level in sorted(self.batch_levels.items()):
+            watched = self.seen.get(stock_id)
+            if watched is not None and watched[1] < level:
+                rows.append((KIND_BATCH, stock_id, watched[1], level))
+        return rows
+
+    def _emit(self, old, new, kind, target, stock_id, count, level):
+        if (old < level) == (new < level):
+            return
+        event = ThresholdEvent(
+            EVENT_BELOW if new < level else EVENT_RESTORED,
+            kind, target, stock_id, count, level, self.clock(),
+        )
+        if self.stockist.write_pending:
+            # a rollback must not have published anything
+            self.pending.append(event)
+        else:
+            self.dispatcher.publish(event)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for event in pending:
+            self.dispatcher.publish(event)
+
+    def discard(self):
+        self.pending = []
+
+    def touch(self, stock_id):
+        # called after every in-memory mutation of the row
+        if not self.item_levels and not self.batch_levels:
+            return
+        data = self.stockist.stock.get(stock_id)
+        previous = self.seen.get(stock_id)
+        if previous is None:
+            if data is None:
+                return
+            item, old = item_of(data['unique_name']), None
+            if item not in self.item_levels and stock_id not in self.batch_levels:
+                return
+        else:
+            item, old = previous
+        new = None if data is None else data.get('count', 0)
+        if new is None:
+            del self.seen[stock_id]
+        else:
+            self.seen[stock_id] = (item, new)
+        level = self.batch_levels.get(stock_id)
+        if level is not None and old is not None and new is not None:
+            self._emit(old, new, KIND_BATCH, stock_id, stock_id, new, level)
+        level = self.item_levels.get(item)
+        if level is not None:
+            old_total = self.totals[item]
+            new_total = old_total - (old or 0) + (new or 0)
+            self.totals[item] = new_total
+            self._emit(old_total, new_total, KIND_ITEM, item, stock_id, new_total, level)
+
+    def close(self, timeout=5.0):
+        self.dispatcher.close(timeout)
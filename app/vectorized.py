@@ -0,0 +1,85 @@
+# optional numpy path for bulk adjustments and count statistics
+import importlib
+
+# numpy is imported on first use so plain commands do not pay for it
+numpy = None
+
+
+class VectorizedError(Exception):
+    pass
+
+
+def numpy_available():
+    try:
+        require_numpy()
+    except VectorizedError:
+        return False
+    return True
+
+
+def require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            numpy = importlib.import_module('numpy')
+        except ImportError:
+            raise VectorizedError('NumPy is required for vectorized operations!')
+    return numpy
+
+
+def count_arrays(stock):
+    numpy = require_numpy()
+    ids = numpy.fromiter(stock.keys(), dtype=numpy.int64, count=len(stock))
+    counts = numpy.fromiter(
+        (data.get('count', 0) for data in stock.values()),
+        dtype=numpy.int64,
+        count=len(stock),
+    )
+    order = numpy.argsort(ids, kind='stable')
+    return ids[order], counts[order]
+
+
+def plan_adjustment(ids, counts, delta_ids, deltas, allow_negative=False):
+    # returns (changed ids, new counts, applied deltas) without touching state
+    numpy = require_numpy()
+    delta_ids = numpy.asarray(delta_ids, dtype=numpy.int64)
+    deltas = numpy.asarray(deltas, dtype=numpy.int64)
+    if delta_ids.shape != deltas.shape or delta_ids.ndim != 1:
+        raise VectorizedError('Stock IDs and deltas must be aligned 1-d arrays!')
+    # repeated ids accumulate into one delta per row
+    unique_ids, inverse = numpy.unique(delta_ids, return_inverse=True)
+    summed = numpy.zeros(len(unique_ids), dtype=numpy.int64)
+    numpy.add.at(summed, inverse, deltas)
+    positions = numpy.searchsorted(ids, unique_ids)
+    missing = positions >= len(ids)
+    missing[~missing] = ids[positions[~missing]] != unique_ids[~missing]
+    if missing.any():
+        raise VectorizedError('Unknown stock IDs: {0}'.format(unique_ids[missing][:10].tolist()))
+    new_counts = counts[positions] + summed
+    if not allow_negative and (new_counts < 0).any():
+        negative = unique_ids[new_counts < 0]
+        raise VectorizedError('Adjustment makes stock negative: {0}'.format(negative[:10].tolist()))
+    changed = summed != 0
+    return unique_ids[changed], new_counts[changed], summed[changed]
+
+
+def count_statistics(counts, percentiles=(50, 90, 99)):
+    numpy = require_numpy()
+    if not len(counts):
+        return {
+            'entries': 0,
+            'total': 0,
+            'mean': 0.0,
+            'zero': 0,
+            'percentiles': dict((p, 0.0) for p in percentiles),
+        }
+    return {
+        'entries': int(len(counts)),
+        'total': int(counts.sum()),
+        'mean': float(counts.mean()),
+        'zero': int(numpy.count_nonzero(counts == 0)),
+        'percentiles': dict(zip(
+            percentiles,
+            (float(value) for value in numpy.percentile(counts, percentiles)),
+        )),
+    }
@@ -0,0 +1,61 @@
+# picking up another writer's changes: change log refresh versus a full reload
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+
+
+def populate(path, entries):
+    stock = stockist.SQLiteStockist(path)
+    for i in range(entries):
+        stock.new_stock_item('item-{0}'.format(i % 100), update_db=False)
+    stock.create_database()
+    stock.dump_stock_to_database()
+    return stock
+
+
+def main(entries=200000, changed=100, rounds=20):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'stock.db')
+        stock = populate(path, entries)
+        stock.enable_change_tracking()
+        other = sqlite3.connect(path)
+        rng = random.Random(0)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            stock.refresh()
+        idle = (time.perf_counter() - start) / rounds
+
+        elapsed = {'refresh': 0.0, 'full reload': 0.0}
+        for _ in range(rounds):
+            for label in elapsed:
+                other.executemany("UPDATE stock SET count = count + 1 WHERE pk = ?",
+                                  [(rng.randrange(entries),) for _ in range(changed)])
+                other.commit()
+                start = time.perf_counter()
+                if label == 'refresh':
+                    stock.refresh()
+                else:
+                    stock.update_stock_from_db(force=True)
+                elapsed[label] += time.perf_counter() - start
+        other.close()
+
+        print('{0} rows, {1} changed per round'.format(entries, changed))
+        print('{0:<12} {1:10.3f}ms'.format('idle poll', idle * 1000))
+        for label, total in elapsed.items():
+            print('{0:<12} {1:10.3f}ms'.format(label, total / rounds * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,72 @@
+# checkout latency under concurrent load, with and without group commit
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import checkout, stockist
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def run(path, threads, checkouts, items, max_batch):
+    stock = stockist.SQLiteStockist(path)
+    stock.reset_database()
+    for i in range(items):
+        stock.new_stock_item('item{0}'.format(i), new_id=i)
+    stock.apply_deltas(list(range(items)), [10 ** 6] * items)
+    stock._checkout_engine = checkout.CheckoutEngine(stock, max_batch=max_batch)
+    latencies = []
+    latency_lock = threading.Lock()
+
+    def shopper(worker):
+        rng = random.Random(worker)
+        mine = []
+        for _ in range(checkouts // threads):
+            lines = dict(
+                (rng.randrange(items), rng.randint(1, 3))
+                for _ in range(rng.randint(1, 5))
+            )
+            start = time.perf_counter()
+            stock.checkout_engine.checkout(lines)
+            mine.append(time.perf_counter() - start)
+        with latency_lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=shopper, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    engine = stock.checkout_engine
+    print('max_batch={0:<4} {1} checkouts {2:.0f}/s in {3} commits  p50 {4:.2f}ms p95 {5:.2f}ms p99 {6:.2f}ms'.format(
+        max_batch, engine.checkouts, engine.checkouts / elapsed, engine.commits,
+        percentile(latencies, 50) * 1000,
+        percentile(latencies, 95) * 1000,
+        percentile(latencies, 99) * 1000,
+    ))
+
+
+def main(threads=16, checkouts=4000, items=1000):
+    directory = tempfile.mkdtemp()
+    try:
+        for max_batch in (1, 256):
+            run(os.path.join(directory, 'stock{0}.db'.format(max_batch)), threads, checkouts, items, max_batch)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
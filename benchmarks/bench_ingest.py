@@ -0,0 +1,47 @@
+# feed parsing speedup with worker count, and the single-writer apply
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ingest
+from app import stockist
+
+
+def write_feed(path, rows, items):
+    rng = random.Random(0)
+    with open(path, 'w') as fh:
+        fh.write('item,amount\n')
+        for _ in range(rows):
+            fh.write('item-{0},{1}\n'.format(rng.randrange(items), rng.randrange(1, 20)))
+
+
+def main(rows=2000000, items=100000):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'feed.csv')
+        write_feed(path, rows, items)
+        print('{0} rows, {1:.1f} MB, {2} items, {3} cpus'.format(
+            rows, os.path.getsize(path) / 1e6, items, os.cpu_count()))
+        workers, baseline = 1, None
+        while workers <= (os.cpu_count() or 1):
+            runner = ingest.FeedIngest(None, workers=workers)
+            runner.parse(path)
+            baseline = baseline or runner.parse_elapsed
+            print('{0:>3} workers  parse {1:8.3f}s  {2:10.0f} rows/s  speedup {3:5.2f}x'.format(
+                workers, runner.parse_elapsed, rows / runner.parse_elapsed, baseline / runner.parse_elapsed))
+            workers *= 2
+        stock = stockist.SQLiteStockist(os.path.join(directory, 'stock.db'))
+        stock.create_database()
+        runner = ingest.FeedIngest(stock, workers=os.cpu_count())
+        changed = runner.run(path)
+        print('apply {0} entries in {1:.3f}s'.format(changed, runner.apply_elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
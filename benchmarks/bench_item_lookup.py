@@ -0,0 +1,39 @@
+# item lookup throughput: formatted objects versus interned catalog items
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import item, stockist
+
+
+class Product(object):
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+    def __str__(self):
+        return 'product-{0}'.format(self.identifier)
+
+
+def main(items=10000, lookups=200000):
+    stock = stockist.Stockist()
+    for i in range(items):
+        stock.stock_item(Product(i), amount=1)
+    plain = [Product(i % items) for i in range(lookups)]
+    names = [str(product) for product in plain]
+    interned = [stock.catalog.get(name) for name in names]
+    assert all(isinstance(entry, item.Item) for entry in interned)
+
+    for label, keys in (('formatted object', plain), ('string', names), ('interned item', interned)):
+        elapsed = min(timeit.repeat(
+            lambda: [stock.stock_ids_for_item(key) for key in keys],
+            number=1,
+            repeat=3,
+        ))
+        print('{0:<18} {1:>12.0f} lookups/s'.format(label, lookups / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+# journal replay versus a full sqlite reload
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+
+
+def populate(stock, entries, items=100):
+    for i in range(entries):
+        stock.new_stock_item('item{0}'.format(i % items), new_id=i)
+        stock.increase_stock(i, i % 50)
+
+
+def main(entries=100000, repeat=3):
+    directory = tempfile.mkdtemp()
+    try:
+        journal_path = os.path.join(directory, 'stock.journal')
+        database_path = os.path.join(directory, 'stock.db')
+
+        source = stockist.Stockist()
+        source.open_journal(journal_path, sync_every=4096, checkpoint_every=0)
+        populate(source, entries)
+        source.journal.close()
+
+        database = stockist.SQLiteStockist(database_path)
+        database.create_database()
+        database._stock = source.stock
+        database.dump_stock_to_database()
+
+        def replay():
+            recovered = stockist.Stockist()
+            recovered.open_journal(journal_path, checkpoint_every=0)
+            recovered.recover()
+            recovered.journal.close()
+
+        def checkpointed():
+            recovered = stockist.Stockist()
+            recovered.open_journal(journal_path + '.compact', checkpoint_every=0)
+            recovered.recover()
+            recovered.journal.close()
+
+        def reload():
+            stockist.SQLiteStockist(database_path).update_stock_from_db()
+
+        compact = stockist.Stockist()
+        compact.open_journal(journal_path + '.compact', checkpoint_every=0)
+        compact._stock = source.stock
+        compact.checkpoint()
+        compact.journal.close()
+
+        for name, func in (('journal replay', replay),
+                           ('checkpoint replay', checkpointed),
+                           ('sqlite reload', reload)):
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            print('{0:<20} {1:>8} entries {2:8.3f}s'.format(name, entries, best))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
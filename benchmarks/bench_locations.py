@@ -0,0 +1,57 @@
+# single-location operations as the number of locations grows
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+
+
+def populate(stock, entries, locations, rng):
+    database = isinstance(stock, stockist.DatabaseStockist)
+    for i in range(entries):
+        if database:
+            stock.new_stock_item('item-{0}'.format(i % 100), update_db=False)
+        else:
+            stock.new_stock_item('item-{0}'.format(i % 100))
+    if database:
+        stock.create_database()
+        stock.dump_stock_to_database()
+    located = stock.enable_locations()
+    with stock.transaction():
+        for i in range(entries):
+            stock.increase_stock_at(i, 'site-{0}'.format(rng.randrange(locations)), 10)
+    return located
+
+
+def measure(stock, entries, locations, operations, rng):
+    ids = [(rng.randrange(entries), 'site-{0}'.format(rng.randrange(locations))) for _ in range(operations)]
+    start = time.perf_counter()
+    with stock.transaction():
+        for stock_id, location in ids:
+            stock.increase_stock_at(stock_id, location, 1)
+    adjust = (time.perf_counter() - start) / operations
+    start = time.perf_counter()
+    for stock_id, location in ids:
+        stock.locations.count_at(stock_id, location)
+        stock.locations.location_totals[location]
+    read = (time.perf_counter() - start) / operations
+    return adjust, read
+
+
+def main(entries=20000, operations=5000):
+    for backend in ('memory', 'sqlite'):
+        for locations in (1, 10, 100, 500):
+            rng = random.Random(0)
+            stock = stockist.Stockist() if backend == 'memory' else stockist.SQLiteStockist(':memory:')
+            populate(stock, entries, locations, rng)
+            adjust, read = measure(stock, entries, locations, operations, rng)
+            print('{0:<7} {1:>4} locations  adjust {2:8.2f}us/op  read {3:6.2f}us/op'.format(
+                backend, locations, adjust * 1e6, read * 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,35 @@
+# instrumentation overhead: increase_stock with metrics off, on, and with a sink
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+
+
+def main(items=1000, operations=100000):
+    for label in ('memory off', 'memory on', 'memory on + sink', 'sqlite off', 'sqlite on'):
+        if label.startswith('sqlite'):
+            stock = stockist.SQLiteStockist(':memory:')
+            stock.create_database()
+            count = operations // 10
+        else:
+            stock = stockist.Stockist()
+            count = operations
+        ids = [stock.stock_item('item-{0}'.format(i), amount=1) for i in range(items)]
+        if ' on' in label:
+            stock.enable_metrics()
+        if 'sink' in label:
+            stock.metrics.add_sink(lambda kind, name, key, value: None)
+
+        def run():
+            with stock.transaction():
+                for i in range(count):
+                    stock.increase_stock(ids[i % items], 1)
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print('{0:<18} {1:>12.0f} ops/s'.format(label, count / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,53 @@
+# concurrent carts placing, releasing and confirming holds
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import cart, reservation, stockist
+
+
+def main(carts=2000, threads=16, items=200, operations=20):
+    stock = stockist.Stockist()
+    for i in range(items):
+        stock.stock_item('item{0}'.format(i), amount=10 ** 6)
+    stock.reservations.default_ttl = 5
+    failures = [0]
+    failure_lock = threading.Lock()
+
+    def shopper(worker):
+        rng = random.Random(worker)
+        for _ in range(carts // threads):
+            basket = cart.ShoppingCart(stock)
+            try:
+                for _ in range(operations):
+                    name = 'item{0}'.format(int(rng.paretovariate(1.2)) % items)
+                    basket.add_item(name, rng.randint(1, 3))
+                    if rng.random() < 0.2:
+                        basket.remove_item(name, 1)
+                if rng.random() < 0.5:
+                    basket.checkout()
+                else:
+                    basket.clear()
+            except reservation.ReservationError:
+                with failure_lock:
+                    failures[0] += 1
+
+    workers = [threading.Thread(target=shopper, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    total = carts * (operations + 1)
+    print('{0} carts on {1} threads: {2:.3f}s, {3:.0f} ops/s, {4} failures, {5} open holds'.format(
+        carts, threads, elapsed, total / elapsed, failures[0], len(stock.reservations)
+    ))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
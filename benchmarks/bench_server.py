@@ -0,0 +1,58 @@
+# server round trips versus cold cli invocations
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import server
+
+CLI = [sys.executable, '-c', 'from app.cli import cli; cli()']
+
+
+def main(round_trips=2000, cold=20):
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+    database = os.path.join(directory, 'stock.db')
+    try:
+        subprocess.check_call(CLI + ['--database', database, '--no-server', 'stock', 'apple', '1'], env=environment)
+        start = time.perf_counter()
+        for _ in range(cold):
+            subprocess.check_call(CLI + ['--database', database, '--no-server', 'count', 'apple'],
+                                  env=environment, stdout=subprocess.DEVNULL)
+        cold_latency = (time.perf_counter() - start) / cold
+
+        process = subprocess.Popen(CLI + ['--database', database, 'serve'], env=environment)
+        try:
+            path = server.default_socket_path(database)
+            client = None
+            while client is None:
+                time.sleep(0.05)
+                client = server.connect(path)
+            start = time.perf_counter()
+            for _ in range(round_trips):
+                client.request('count apple')
+            warm_latency = (time.perf_counter() - start) / round_trips
+            client.close()
+
+            start = time.perf_counter()
+            for _ in range(cold):
+                subprocess.check_call(CLI + ['--database', database, 'count', 'apple'],
+                                      env=environment, stdout=subprocess.DEVNULL)
+            client_latency = (time.perf_counter() - start) / cold
+        finally:
+            process.terminate()
+            process.wait()
+        print('cold cli          {0:9.3f}ms'.format(cold_latency * 1000))
+        print('cli via server    {0:9.3f}ms'.format(client_latency * 1000))
+        print('server round trip {0:9.3f}ms'.format(warm_latency * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
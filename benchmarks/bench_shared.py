@@ -0,0 +1,93 @@
+# shared-memory readers versus each reader loading its own SQLiteStockist
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import shared, stockist
+
+
+def shared_reader(name, ids, queue):
+    start = time.perf_counter()
+    reader = shared.SharedStockReader(name)
+    for stock_id in ids:
+        reader.get(stock_id)
+    reader.close()
+    queue.put(time.perf_counter() - start)
+
+
+def sqlite_reader(database, ids, queue):
+    start = time.perf_counter()
+    stock = stockist.SQLiteStockist(database)
+    stock.update_stock_from_db()
+    for stock_id in ids:
+        stock.stock.get(stock_id)
+    queue.put(time.perf_counter() - start)
+
+
+def run_readers(target, argument, readers, ids):
+    # spawned, so no reader inherits locks held by the writer thread
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    processes = [
+        context.Process(target=target, args=(argument, ids, queue))
+        for _ in range(readers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    timings = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return time.perf_counter() - start, max(timings)
+
+
+def main(entries=100000, readers=4, reads=200000):
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'stock.db')
+    rng = random.Random(0)
+    ids = [rng.randrange(entries) for _ in range(reads)]
+    try:
+        stock = stockist.SQLiteStockist(database)
+        stock.create_database()
+        for i in range(entries):
+            stock.new_stock_item('item-{0}'.format(i % 1000), update_db=False)
+            stock.stock[i]['count'] = 1
+        stock.dump_stock_to_database()
+        publisher = stock.publish_shared('stockist_bench_{0}'.format(os.getpid()))
+
+        # the publisher keeps writing while the readers run
+        stop = threading.Event()
+
+        def write():
+            while not stop.is_set():
+                with stock.transaction():
+                    for _ in range(100):
+                        stock.increase_stock(rng.randrange(entries), 1)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            shared_wall, shared_slowest = run_readers(shared_reader, publisher.name, readers, ids)
+            sqlite_wall, sqlite_slowest = run_readers(sqlite_reader, database, readers, ids)
+        finally:
+            stop.set()
+            writer.join()
+            publisher.close()
+        total = readers * reads
+        print('{0} readers x {1} reads over {2} entries'.format(readers, reads, entries))
+        print('shared memory  {0:8.3f}s wall {1:12.0f} reads/s'.format(shared_wall, total / shared_wall))
+        print('sqlite load    {0:8.3f}s wall {1:12.0f} reads/s'.format(sqlite_wall, total / sqlite_wall))
+        print('slowest reader {0:8.3f}s vs {1:.3f}s'.format(shared_slowest, sqlite_slowest))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
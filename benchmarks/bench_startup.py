@@ -0,0 +1,56 @@
+# cold start of `stockist count`: import profile and wall-clock time
+#
+# startup work is kept to the imports a command needs: backends and their
+# subsystems load on first use. The click command tree is still built eagerly
+# (under 1ms, well inside the run-to-run noise) and the config file is read on
+# every run (a few short lines; any cross-process cache costs the same stat
+# and read it would save), so neither is made lazy.
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = [sys.executable, '-c', 'from app.cli import cli; cli()']
+
+
+def import_profile(environment, top=10):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app.cli'],
+        env=environment, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    total = max(rows)[0] if rows else 0
+    return total, sorted((row for row in rows if not row[1].startswith('app.cli')), reverse=True)[:top]
+
+
+def main(runs=10):
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, PYTHONPATH=ROOT, HOME=directory)
+    database = os.path.join(directory, 'stock.db')
+    try:
+        subprocess.check_call(CLI + ['--database', database, 'stock', 'apple', '1'], env=environment)
+        total, heaviest = import_profile(environment)
+        print('import app.cli       {0:8.1f}ms'.format(total / 1000.0))
+        for cumulative, name in heaviest:
+            print('  {0:<18} {1:8.1f}ms'.format(name, cumulative / 1000.0))
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call(CLI + ['--database', database, 'count', 'apple'],
+                                  env=environment, stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        print('stockist count       {0:8.1f}ms (best of {1})'.format(min(timings) * 1000, runs))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+# per-operation cost of each storage backend, raw and behind a stockist
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+from app import storage
+
+
+def backends(directory):
+    yield 'memory', storage.MemoryStorage(), stockist.StorageStockist(storage.MemoryStorage())
+    path = os.path.join(directory, 'stock')
+    yield 'dbm', storage.DBMStorage(path), stockist.DBMStockist(path + '-stockist')
+    sqlite = stockist.SQLiteStockist(os.path.join(directory, 'raw.db'))
+    sqlite.create_database()
+    stock = stockist.SQLiteStockist(os.path.join(directory, 'stock.db'))
+    stock.create_database()
+    yield 'sqlite', sqlite.storage, stock
+
+
+def timed(operation, operations):
+    start = time.perf_counter()
+    operation()
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def main(entries=20000, operations=5000):
+    directory = tempfile.mkdtemp()
+    try:
+        print('{0:<8} {1:>10} {2:>10} {3:>10} {4:>12} {5:>12}'.format(
+            'backend', 'put us', 'get us', 'scan ms', 'increase us', 'batched us'))
+        for label, raw, stock in backends(directory):
+            rng = random.Random(0)
+            ids = [rng.randrange(entries) for _ in range(operations)]
+            with raw.batch():
+                for stock_id in range(entries):
+                    raw.put(stock_id, 'item-{0}_#{1}'.format(stock_id % 100, stock_id), 10)
+            put = timed(lambda: [raw.put(stock_id, 'item_#{0}'.format(stock_id), 1) for stock_id in ids], operations)
+            get = timed(lambda: [raw.get(stock_id) for stock_id in ids], operations)
+            scan = timed(raw.scan, 1) / 1000
+
+            with stock.transaction():
+                for stock_id in range(entries):
+                    stock.new_stock_item('item-{0}'.format(stock_id % 100))
+            increase = timed(lambda: [stock.increase_stock(stock_id, 1) for stock_id in ids], operations)
+
+            def batched():
+                with stock.transaction():
+                    for stock_id in ids:
+                        stock.increase_stock(stock_id, 1)
+            batch = timed(batched, operations)
+            print('{0:<8} {1:10.2f} {2:10.2f} {3:10.2f} {4:12.2f} {5:12.2f}'.format(
+                label, put, get, scan, increase, batch))
+            raw.close()
+            if hasattr(stock, 'close'):
+                stock.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
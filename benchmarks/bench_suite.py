@@ -0,0 +1,300 @@
+# scaling suite: core stock operations on each backend from 10^3 to 10^7 entries
+#
+#   python benchmarks/bench_suite.py --scales 3,4,5 --output results.json
+#   python benchmarks/bench_suite.py --baseline results.json
+#   STOCKIST_PG_DATABASE=stockist_bench python benchmarks/bench_suite.py --backends memory,sqlite,postgresql
+#
+# timings only compare on the same machine, so no baseline is kept in the
+# repository: write one with --output from the commit to compare against
+# (git stash or a worktree of it), then run the change with --baseline.
+# the suite runs --runs times and reports the median run of each operation,
+# operations that can repeat do so for at least MIN_SECONDS, and the collector
+# is paused while timing, so two runs of the same build stay inside the
+# default --tolerance.
+import argparse
+import collections
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+
+BENCH_TABLE = 'stock_bench'
+BATCHES_PER_ITEM = 4
+REPEAT = 5
+MIN_SECONDS = 0.2
+
+
+def item_name(i):
+    return 'item-{0}'.format(i // BATCHES_PER_ITEM)
+
+
+def timed(function, operations=1, repeat=1):
+    # best of the runs; only operations that leave the store comparable repeat,
+    # and those keep going until they have run for MIN_SECONDS
+    timings = []
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        while len(timings) < repeat or (repeat > 1 and sum(timings) < MIN_SECONDS):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    elapsed = min(timings)
+    return {'ops': operations, 'seconds': elapsed, 'per_op_us': elapsed / operations * 1e6}
+
+
+class Backend(object):
+
+    name = None
+    database = False
+
+    def __init__(self, options):
+        self.options = options
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def populate(self, stock, entries):
+        # in-memory first, then one bulk write, so large scales are feasible
+        for i in range(entries):
+            if self.database:
+                stock.new_stock_item(item_name(i), update_db=False)
+            else:
+                stock.new_stock_item(item_name(i))
+            stock.stock[i]['count'] = 1
+
+
+class MemoryBackend(Backend):
+
+    name = 'memory'
+
+    def open(self):
+        return stockist.Stockist()
+
+
+class SQLiteBackend(Backend):
+
+    name = 'sqlite'
+    database = True
+
+    def open(self):
+        self.directory = tempfile.mkdtemp()
+        return self.connect()
+
+    def connect(self):
+        stock = stockist.SQLiteStockist(os.path.join(self.directory, 'bench.db'))
+        stock.STOCK_TABLE = BENCH_TABLE
+        return stock
+
+    def close(self):
+        shutil.rmtree(self.directory)
+
+
+class PostgreSQLBackend(Backend):
+
+    name = 'postgresql'
+    database = True
+
+    def open(self):
+        return self.connect()
+
+    def connect(self):
+        stock = stockist.PostgreSQLStockist(
+            self.options.pg_database,
+            username=self.options.pg_user,
+            password=self.options.pg_password,
+        )
+        stock.STOCK_TABLE = BENCH_TABLE
+        return stock
+
+    def close(self):
+        stock = self.connect()
+        with stock.connection as connection:
+            connection.cursor().execute(stock.DROP_SQL_STRING.format(table=BENCH_TABLE))
+            connection.commit()
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def available(backend, options):
+    if backend.name != 'postgresql':
+        return True, None
+    if not options.pg_database:
+        return False, 'set STOCKIST_PG_DATABASE or --pg-database'
+    try:
+        stockist.load_psycopg2()
+    except ImportError:
+        return False, 'psycopg2 is not installed'
+    return True, None
+
+
+def run_scale(backend, entries, samples, rng):
+    results = {}
+    stock = backend.open()
+    try:
+        if backend.database:
+            stock.create_database()
+        results['populate'] = timed(lambda: backend.populate(stock, entries), entries)
+        if backend.database:
+            results['dump_stock_to_database'] = timed(stock.dump_stock_to_database, entries)
+        ids = [rng.randrange(entries) for _ in range(samples)]
+        names = [item_name(i) for i in ids]
+
+        def increase():
+            with stock.transaction():
+                for stock_id in ids:
+                    stock.increase_stock(stock_id, 1)
+        results['increase_stock'] = timed(increase, samples, REPEAT)
+        results['stock_for_item'] = timed(lambda: [stock.stock_for_item(name) for name in names], samples, REPEAT)
+        results['last_stock_id_for_item'] = timed(
+            lambda: [stock.last_stock_id_for_item(name) for name in names], samples, REPEAT
+        )
+
+        batches = itertools.count()
+
+        def new_items():
+            # committed one at a time, as the cli does; every repeat adds a
+            # fresh batch, since an insert barely depends on the store's size
+            batch = next(batches)
+            for i in range(samples):
+                stock.new_stock_item('new-{0}-{1}'.format(batch, i))
+        results['new_stock_item'] = timed(new_items, samples, REPEAT)
+        if backend.database:
+            results['update_stock_from_db'] = timed(
+                lambda: backend.connect().update_stock_from_db(), entries, REPEAT
+            )
+        if isinstance(stock, stockist.SQLiteStockist):
+            results['export_stock_to_sql'] = timed(stock.export_stock_to_sql, entries, REPEAT)
+    finally:
+        backend.close()
+    return results
+
+
+def median_results(runs):
+    # per operation, the run with the median time
+    results = {}
+    for operation in runs[0]:
+        timings = sorted((run[operation] for run in runs), key=lambda result: result['per_op_us'])
+        results[operation] = dict(timings[len(timings) // 2], runs=len(runs))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    previous = dict(
+        ((row['backend'], row['entries'], row['operation']), row)
+        for row in baseline['results']
+    )
+    regressions = []
+    for row in results:
+        old = previous.get((row['backend'], row['entries'], row['operation']))
+        if old is None or not old['per_op_us']:
+            continue
+        ratio = row['per_op_us'] / old['per_op_us']
+        row['baseline_per_op_us'] = old['per_op_us']
+        row['ratio'] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(row)
+    return regressions
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', default='memory,sqlite,postgresql')
+    parser.add_argument('--scales', default='3,4,5', help='powers of ten, 3 to 7')
+    parser.add_argument('--samples', type=int, default=1000, help='operations timed per scale')
+    parser.add_argument('--runs', type=int, default=5, help='runs per scale, the median is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write results as json')
+    parser.add_argument('--baseline', default=None, help='json results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before flagging')
+    parser.add_argument('--pg-database', default=os.environ.get('STOCKIST_PG_DATABASE'))
+    parser.add_argument('--pg-user', default=os.environ.get('STOCKIST_PG_USER'))
+    parser.add_argument('--pg-password', default=os.environ.get('STOCKIST_PG_PASSWORD'))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    scales = [int(scale) for scale in options.scales.split(',')]
+    if any(not 3 <= scale <= 7 for scale in scales):
+        raise SystemExit('Scales are powers of ten from 3 to 7.')
+    backends = []
+    for name in options.backends.split(','):
+        backend = BACKENDS[name](options)
+        ok, reason = available(backend, options)
+        if not ok:
+            print('{0:<11} skipped: {1}'.format(name, reason))
+            continue
+        backends.append(backend)
+    # the whole suite repeats, so a slow spell on the machine lands in one run
+    # of many operations rather than in every run of one
+    runs = collections.defaultdict(list)
+    for _ in range(options.runs):
+        for backend in backends:
+            for scale in scales:
+                entries = 10 ** scale
+                samples = min(options.samples, entries)
+                # same seed per scale, so every backend and build sees the same keys
+                runs[(backend.name, scale)].append(
+                    run_scale(backend, entries, samples, random.Random(options.seed + scale))
+                )
+    rows = []
+    for backend in backends:
+        for scale in scales:
+            for operation, result in sorted(median_results(runs[(backend.name, scale)]).items()):
+                result.update(backend=backend.name, entries=10 ** scale, operation=operation)
+                rows.append(result)
+                print('{0:<11} 10^{1} {2:<24} {3:>12.2f}us/op'.format(
+                    backend.name, scale, operation, result['per_op_us']
+                ))
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.time(),
+            'samples': options.samples,
+            'runs': options.runs,
+            'seed': options.seed,
+        },
+        'results': rows,
+    }
+    status = 0
+    if options.baseline:
+        with open(options.baseline) as fh:
+            regressions = compare(rows, json.load(fh), options.tolerance)
+        for row in regressions:
+            print('REGRESSION {0} 10^{1} {2}: {3:.2f}us/op vs {4:.2f}us/op ({5:.0%})'.format(
+                row['backend'], len(str(row['entries'])) - 1, row['operation'],
+                row['per_op_us'], row['baseline_per_op_us'], row['ratio'] - 1,
+            ))
+        status = 1 if regressions else 0
+    if options.output:
+        with open(options.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
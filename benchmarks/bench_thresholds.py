@@ -0,0 +1,66 @@
+# incremental threshold checks versus polling stock_count after every change
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import stockist
+
+
+def populate(entries, items):
+    stock = stockist.Stockist()
+    for i in range(entries):
+        stock.new_stock_item('item-{0}'.format(i % items))
+        stock.stock[i]['count'] = 10
+    return stock
+
+
+def changes(entries, operations):
+    rng = random.Random(0)
+    return [(rng.randrange(entries), rng.choice((-1, 1))) for _ in range(operations)]
+
+
+def main(entries=100000, items=1000, operations=2000):
+    levels = dict(('item-{0}'.format(i), 10 * (entries // items)) for i in range(items))
+    updates = changes(entries, operations)
+
+    stock = populate(entries, items)
+    start = time.perf_counter()
+    for stock_id, amount in updates:
+        stock.increase_stock(stock_id, amount)
+    plain = time.perf_counter() - start
+
+    stock = populate(entries, items)
+    start = time.perf_counter()
+    for stock_id, amount in updates:
+        stock.increase_stock(stock_id, amount)
+        # the polling alternative: total every item, compare with its level
+        totals = {}
+        for _id, count in stock.stock_count:
+            name = stock.stock[_id]['unique_name'].split('_#')[0]
+            totals[name] = totals.get(name, 0) + count
+        [name for name, total in totals.items() if total < levels[name]]
+    polling = time.perf_counter() - start
+
+    stock = populate(entries, items)
+    thresholds = stock.enable_thresholds()
+    received = []
+    thresholds.subscribe(received.extend)
+    for name, level in levels.items():
+        thresholds.item_levels[name] = level
+    thresholds.rebuild()
+    start = time.perf_counter()
+    for stock_id, amount in updates:
+        stock.increase_stock(stock_id, amount)
+    incremental = time.perf_counter() - start
+    thresholds.close()
+
+    for label, elapsed in (('no thresholds', plain), ('full scan', polling), ('incremental', incremental)):
+        print('{0:<14} {1:10.2f}us/op'.format(label, elapsed / operations * 1e6))
+    print('{0} events delivered, {1} dropped'.format(thresholds.dispatcher.delivered, thresholds.dispatcher.dropped))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -4,10 +4,40 @@ from setuptools import setup
 setup(
     name="stockist",
     version='1.0',
-    py_modules=['app.cli', 'app.stockist'],
+    py_modules=[
+        'app.cli',
+        'app.stockist',
+        'app.journal',
+        'app.history',
+        'app.query',
+        'app.aggregate',
+        'app.vectorized',
+        'app.reservation',
+        'app.cart',
+        'app.checkout',
+        'app.pay',
+        'app.item',
+        'app.batch',
+        'app.server',
+        'app.backends',
+        'app.listing',
+        'app.metrics',
+        'app.loadgen',
+        'app.merkle',
+        'app.shared',
+        'app.events',
+        'app.thresholds',
+        'app.locations',
+        'app.changes',
+        'app.storage',
+        'app.ingest',
+    ],
     install_requires=[
         'Click',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     entry_points='''
         [console_scripts]
         stockist=app.cli:cli
@@ -0,0 +1,48 @@
+import unittest
+
+import app.aggregate as aggregate_module
+import app.stockist as stockist_module
+
+
+class TestStockistAggregate(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.populate()
+
+    def populate(self):
+        for name, count in [('apple', 3), ('pear', 0), ('apple', 9), ('plum', 150), ('apple', 1)]:
+            self.stockist.stock_item(name, amount=count, create=True)
+
+    def test_item_totals(self):
+        self.assertEqual(self.stockist.item_totals(), [
+            aggregate_module.ItemTotals('apple', 3, 13, 1, 9),
+            aggregate_module.ItemTotals('pear', 1, 0, 0, 0),
+            aggregate_module.ItemTotals('plum', 1, 150, 150, 150),
+        ])
+
+    def test_count_histogram(self):
+        self.assertEqual(self.stockist.count_histogram((1, 10, 100)), [
+            aggregate_module.HistogramBucket(None, 1, 1),
+            aggregate_module.HistogramBucket(1, 10, 3),
+            aggregate_module.HistogramBucket(10, 100, 0),
+            aggregate_module.HistogramBucket(100, None, 1),
+        ])
+
+    def test_invalid_edges(self):
+        self.assertRaises(aggregate_module.AggregateError, self.stockist.count_histogram, ())
+        self.assertRaises(aggregate_module.AggregateError, self.stockist.count_histogram, (10, 1))
+
+
+class TestSQLiteStockistAggregate(TestStockistAggregate):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.populate()
+        self.stockist._stock.clear()
+        self.stockist._name_id_map.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
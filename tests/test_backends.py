@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import subprocess
+import tempfile
+import unittest
+
+import app.backends as backends_module
+import app.stockist as stockist_module
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_backend(self):
+        self.assertIs(backends_module.get_backend('sqlite'), stockist_module.SQLiteStockist)
+        self.assertIs(backends_module.get_backend('postgresql'), stockist_module.PostgreSQLStockist)
+        self.assertIs(backends_module.get_backend('dbm'), stockist_module.DBMStockist)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(backends_module.BackendError):
+            backends_module.get_backend('oracle')
+
+    def test_register_backend(self):
+        backends_module.register_backend('memory', 'app.stockist', 'Stockist')
+        try:
+            self.assertIs(backends_module.get_backend('memory'), stockist_module.Stockist)
+        finally:
+            del backends_module.BACKENDS['memory']
+
+    def test_create_stockist(self):
+        database = os.path.join(self.directory, 'stock.db')
+        stock = backends_module.create_stockist('sqlite', database)
+        self.assertIsInstance(stock, stockist_module.SQLiteStockist)
+        stock.create_database()
+        stock.stock_item(item='apple', amount=2, create=True)
+        self.assertEqual(stock['apple'][0]['count'], 2)
+        self.assertTrue(os.path.exists(database))
+
+    def test_cli_import_is_lazy(self):
+        # plain commands should not pay for numpy, psycopg2, dbm, shared memory or the server
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, app.cli; print(" ".join(sorted(sys.modules)))',
+        ], universal_newlines=True).split()
+        for name in ('numpy', 'psycopg2', 'multiprocessing', 'dbm', 'sqlite3', 'app.server', 'app.batch',
+                     'app.checkout', 'app.changes', 'app.reservation', 'app.merkle', 'app.storage'):
+            self.assertNotIn(name, modules)
+
+    def test_backend_import_is_lazy(self):
+        # a dbm stockist never loads sqlite3 or the subsystems it does not enable
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import os, sys, app.backends; '
+            'stock = app.backends.create_stockist("dbm", os.path.join(sys.argv[1], "stock")); '
+            'stock.create_database(); stock.stock_item("apple", amount=1, create=True); stock.close(); '
+            'print(" ".join(sorted(sys.modules)))',
+            self.directory,
+        ], universal_newlines=True).split()
+        self.assertIn('dbm', modules)
+        for name in ('sqlite3', 'app.checkout', 'app.changes', 'app.history', 'app.merkle'):
+            self.assertNotIn(name, modules)
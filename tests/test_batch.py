@@ -0,0 +1,134 @@
+import unittest
+
+import mock
+
+import app.batch as batch_module
+import app.stockist as stockist_module
+
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.runner = batch_module.BatchRunner(self.stockist)
+
+    def run_lines(self, *lines, **kwargs):
+        return list(self.runner.run(lines, **kwargs))
+
+    def test_commands(self):
+        results = self.run_lines(
+            'stock apple 5',
+            'stock "big pear" --create',
+            'remove apple 2',
+            'count apple',
+            'count 1',
+            'delete 1',
+        )
+        self.assertEqual([error for _, _, error in results], [None] * 6)
+        self.assertEqual(results[3][1], ['> apple_#0: 3'])
+        self.assertEqual(results[4][1], ['1'])
+        self.assertNotIn(1, self.stockist)
+        self.assertEqual(self.runner.lines, 6)
+
+    def test_remove_delete_if_zero(self):
+        self.run_lines('stock apple 1', 'remove apple --delete-if-zero')
+        self.assertNotIn(0, self.stockist)
+
+    def test_errors_are_per_line(self):
+        results = self.run_lines('bogus', 'stock apple x', 'count 7', 'stock apple --force', 'remove plum', 'stock apple')
+        self.assertEqual(
+            [str(error) for _, _, error in results[:5]],
+            ['Unknown command bogus.', 'Invalid amount.', 'Not found.', 'Unknown option --force.', 'Not present.']
+        )
+        self.assertIsNone(results[5][2])
+        self.assertEqual(self.runner.errors, 5)
+        self.assertEqual(self.stockist[0]['count'], 1)
+
+    def test_locations(self):
+        results = self.run_lines(
+            'stock apple 5',
+            'stock apple 2 --location=north',
+            'remove apple 3 --location=north',
+            'count apple --location=north',
+            'count 0 --location=default',
+            'count apple --location',
+        )
+        self.assertEqual(
+            [str(error) if error else None for _, _, error in results],
+            [None, None, 'Not enough stock for 0 at north!', None, None, 'Missing location.']
+        )
+        self.assertEqual(results[3][1], ['> apple_#0: 2'])
+        self.assertEqual(results[4][1], ['5'])
+
+    def test_blank_and_comment_lines(self):
+        self.assertEqual(self.run_lines('', '# nothing')[1][1:], ([], None))
+
+    def test_locked(self):
+        self.stockist.lock_stock_list()
+        self.assertEqual(str(self.run_lines('stock apple')[0][2]), 'Locked.')
+
+    def test_lock_flag(self):
+        results = self.run_lines('stock apple 2', 'stock pear --create --lock', 'delete 0 --lock', 'stock pear --create')
+        self.assertEqual([str(error) if error else None for _, _, error in results], [None, 'Locked.', 'Locked.', None])
+        self.assertFalse(self.stockist.is_locked)
+        self.assertEqual(self.stockist[0]['count'], 2)
+
+    def test_verbose_flag(self):
+        results = self.run_lines(
+            'stock apple 2 --verbose',
+            'stock apple 3 --location=north --verbose',
+            'remove apple 1 --verbose',
+            'remove apple 4 --delete-if-zero --verbose',
+            'stock pear --create',
+        )
+        self.assertEqual([output for _, output, _ in results], [
+            ['apple_#0: 2'], ['apple_#0: 3'], ['apple_#0: 4'], ['Deleted.'], [],
+        ])
+
+
+class TestSQLiteBatchRunner(TestBatchRunner):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.runner = batch_module.BatchRunner(self.stockist)
+
+    def test_commits_per_batch(self):
+        connection = self.stockist.connection
+        self.stockist._connection = mock.MagicMock(wraps=connection, row_factory=connection.row_factory)
+        self.run_lines('stock apple', 'stock apple', 'stock apple', batch_size=2)
+        self.assertEqual(self.stockist._connection.commit.call_count, 2)
+        self.stockist._connection = connection
+        self.assertEqual(self.stockist.database_stock[0]['count'], 3)
+
+    def test_refused_write_is_a_line_error(self):
+        results = self.run_lines('stock apple 5 --create', 'stock pear 3 --create', 'stock apple 99999999999999999999')
+        self.assertEqual([error for _, _, error in results[:2]], [None, None])
+        self.assertTrue(str(results[2][2]).startswith('OverflowError'))
+        self.assertEqual(self.stockist.stock_count, [(0, 5), (1, 3)])
+        self.assertEqual(
+            sorted((data['stock_id'], data['count']) for data in self.stockist.database_stock.values()),
+            [(0, 5), (1, 3)],
+        )
+
+    def test_rollback_restores_memory(self):
+        self.run_lines('stock apple 2 --create')
+        connection = self.stockist.connection
+        self.stockist._connection = mock.MagicMock(wraps=connection, row_factory=connection.row_factory)
+        self.stockist._connection.commit.side_effect = RuntimeError
+        self.assertRaises(RuntimeError, self.run_lines, 'stock apple 4', 'stock pear --create')
+        self.stockist._connection = connection
+        self.assertEqual(self.stockist.stock_count, [(0, 2)])
+        self.assertEqual(self.stockist.stock_ids_for_item('pear'), [])
+
+    def test_closed_early(self):
+        results = self.runner.run(['stock apple', 'stock apple', 'stock apple'], batch_size=2)
+        next(results)
+        results.close()
+        self.assertFalse(self.stockist.in_transaction)
+        self.run_lines('stock apple')
+        self.assertEqual(self.stockist.database_stock[0]['count'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import app.cart as cart_module
+import app.reservation as reservation_module
+import app.stockist as stockist_module
+
+
+class FakeClock(object):
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestReservationBook(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stockist = stockist_module.Stockist()
+        self.stockist._reservations = reservation_module.ReservationBook(
+            self.stockist, default_ttl=60, clock=self.clock
+        )
+        self.book = self.stockist.reservations
+        self.apple = self.stockist.stock_item('apple', amount=5)
+
+    def test_reserve_and_available(self):
+        self.book.reserve(self.apple, 3)
+        self.assertEqual(self.stockist.available_to_promise(self.apple), 2)
+        self.assertEqual(self.stockist.available_to_promise('apple'), 2)
+        self.assertRaises(reservation_module.InsufficientStockError, self.book.reserve, self.apple, 3)
+        self.assertRaises(reservation_module.ReservationError, self.book.reserve, self.apple, 0)
+
+    def test_expiry(self):
+        hold = self.book.reserve(self.apple, 5, ttl=10)
+        self.clock.now = 9
+        self.assertEqual(self.book.available(self.apple), 0)
+        self.clock.now = 10
+        self.assertEqual(self.book.available(self.apple), 5)
+        self.assertRaises(reservation_module.HoldExpiredError, self.book.confirm, hold.hold_id)
+
+    def test_extend(self):
+        hold = self.book.reserve(self.apple, 5, ttl=10)
+        self.clock.now = 5
+        self.book.extend(hold.hold_id, ttl=10)
+        self.clock.now = 12
+        self.assertEqual(self.book.held(self.apple), 5)
+        self.clock.now = 15
+        self.assertEqual(self.book.held(self.apple), 0)
+
+    def test_confirm_decrements_stock(self):
+        hold = self.book.reserve(self.apple, 2)
+        self.book.confirm(hold.hold_id)
+        self.assertEqual(self.stockist[self.apple]['count'], 3)
+        self.assertEqual(self.book.available(self.apple), 3)
+        self.assertEqual(len(self.book), 0)
+
+    def test_reserve_item_spans_batches(self):
+        pear_old = self.stockist.stock_item('pear', amount=2)
+        pear_new = self.stockist.stock_item('pear', amount=4, create=True)
+        holds = self.book.reserve_item('pear', 3)
+        self.assertEqual([(h.stock_id, h.quantity) for h in holds], [(pear_old, 2), (pear_new, 1)])
+        self.assertRaises(reservation_module.InsufficientStockError, self.book.reserve_item, 'pear', 4)
+        self.assertEqual(self.book.available_for_item('pear'), 3)
+
+
+class TestShoppingCart(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.apple = self.stockist.stock_item('apple', amount=5)
+        self.pear = self.stockist.stock_item('pear', amount=2)
+        self.cart = cart_module.ShoppingCart(self.stockist)
+
+    def test_add_and_remove(self):
+        self.cart.add_item('apple', 3)
+        self.cart.add_item(self.pear)
+        self.assertEqual(dict(self.cart.lines), {self.apple: 3, self.pear: 1})
+        self.assertEqual(self.stockist.available_to_promise('apple'), 2)
+        self.assertEqual(self.cart.remove_item('apple', 1), 1)
+        self.assertEqual(self.cart.lines[self.apple], 2)
+        self.assertEqual(self.stockist.available_to_promise('apple'), 3)
+        self.cart.remove_item(self.pear)
+        self.assertNotIn(self.pear, self.cart.lines)
+        self.assertEqual(self.stockist.available_to_promise(self.pear), 2)
+
+    def test_other_cart_cannot_oversell(self):
+        self.cart.add_item('apple', 4)
+        other = cart_module.ShoppingCart(self.stockist)
+        self.assertRaises(reservation_module.InsufficientStockError, other.add_item, 'apple', 2)
+        self.cart.clear()
+        other.add_item('apple', 2)
+
+    def test_checkout(self):
+        self.cart.add_item('apple', 3)
+        self.cart.checkout()
+        self.assertEqual(self.stockist[self.apple]['count'], 2)
+        self.assertEqual(len(self.cart.lines), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
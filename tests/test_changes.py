@@ -0,0 +1,119 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import mock
+
+import app.changes as changes_module
+import app.stockist as stockist_module
+
+
+class TestStockChangeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stock.db')
+        self.stockist = stockist_module.SQLiteStockist(self.path)
+        self.stockist.create_database()
+        for i in range(4):
+            self.stockist.stock_item('apple' if i % 2 else 'pear', amount=5, create=True)
+        self.changes = self.stockist.enable_change_tracking(keep=2)
+        # another process writing the same file
+        self.other = sqlite3.connect(self.path)
+
+    def tearDown(self):
+        self.other.close()
+        self.stockist.connection.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, *statements):
+        for statement in statements:
+            self.other.execute(*statement)
+        self.other.commit()
+
+    def test_idle(self):
+        self.assertIsNone(self.stockist.refresh())
+        self.stockist.increase_stock(0, 1)
+        self.assertIsNone(self.stockist.refresh())
+        self.assertEqual(self.changes.refreshes, 0)
+
+    def test_updates_and_deletions(self):
+        self.write(
+            ("UPDATE stock SET count = 9 WHERE pk = 1",),
+            ("DELETE FROM stock WHERE pk = 2",),
+            ("INSERT INTO stock VALUES(7, 'plum_#7', 3)",),
+            ("UPDATE stock SET name = 'plum_#3' WHERE pk = 3",),
+        )
+        self.assertEqual(sorted(self.stockist.refresh()), [1, 2, 3, 7])
+        self.assertEqual(self.stockist.stock[1]['count'], 9)
+        self.assertNotIn(2, self.stockist.stock)
+        self.assertEqual(self.stockist.stock[7], {'stock_id': 7, 'unique_name': 'plum_#7', 'count': 3})
+        self.assertEqual(self.stockist.name_id_map['plum'], {(7, 'plum_#7'), (3, 'plum_#3')})
+        self.assertEqual(self.stockist.name_id_map['apple'], {(1, 'apple_#1')})
+        self.assertEqual(self.stockist.name_id_map['pear'], {(0, 'pear_#0')})
+        self.assertEqual(self.changes.reloads, 0)
+
+    def test_only_changed_rows_touch_views(self):
+        merkle = self.stockist.enable_merkle()
+        self.write(("UPDATE stock SET count = 1 WHERE pk = 0",), ("UPDATE stock SET count = 5 WHERE pk = 1",))
+        self.assertEqual(self.stockist.refresh(), [0])
+        self.assertEqual(merkle.written, merkle.memory)
+        self.assertEqual(self.stockist.verify(), [(0, 64, [])])
+
+    def test_table_replaced(self):
+        other = stockist_module.SQLiteStockist(self.other)
+        other.new_stock_item('fig', update_db=False)
+        other.dump_stock_to_database()
+        self.stockist.refresh()
+        self.assertEqual(list(self.stockist.stock), [0])
+        self.assertEqual(self.stockist.stock[0]['unique_name'], 'fig_#0')
+        self.assertEqual(self.changes.reloads, 1)
+        self.write(("UPDATE stock SET count = 4 WHERE pk = 0",))
+        self.assertEqual(self.stockist.refresh(), [0])
+        self.assertEqual(self.changes.reloads, 1)
+
+    def test_trimmed(self):
+        for count in range(6):
+            self.write(("UPDATE stock SET count = ? WHERE pk = 0", (count,)))
+            self.stockist.refresh()
+        self.assertEqual(self.stockist.stock[0]['count'], 5)
+        first, last = self.other.execute("SELECT MIN(seq), MAX(seq) FROM stock_changes").fetchone()
+        self.assertLessEqual(last - first, 4)
+        self.changes.last_seq = 0
+        self.write(("UPDATE stock SET count = 2 WHERE pk = 3",))
+        self.stockist.refresh()
+        self.assertEqual(self.changes.reloads, 1)
+        self.assertEqual(self.stockist.stock[3]['count'], 2)
+
+    def test_capped_without_reader(self):
+        self.stockist.disable_change_tracking()
+        with mock.patch.object(changes_module.StockChangeLog, 'CAP', 3):
+            self.changes = self.stockist.enable_change_tracking()
+        for count in range(10):
+            self.write(("UPDATE stock SET count = ? WHERE pk = 0", (count,)))
+        self.assertEqual(self.other.execute("SELECT COUNT(*) FROM stock_changes").fetchone()[0], 3)
+        self.stockist.refresh()
+        self.assertEqual(self.changes.reloads, 1)
+        self.assertEqual(self.stockist.stock[0]['count'], 9)
+
+    def test_poller(self):
+        lock = threading.Lock()
+        poller = self.stockist.start_polling(0.01, lock=lock)
+        self.assertRaises(changes_module.ChangeError, poller.start)
+        self.write(("UPDATE stock SET count = 0 WHERE pk = 2",))
+        for _ in range(500):
+            if self.stockist.stock[2]['count'] == 0:
+                break
+            threading.Event().wait(0.01)
+        poller.stop()
+        self.assertEqual(self.stockist.stock[2]['count'], 0)
+        self.assertEqual(poller.errors, 0)
+        # nobody reads the log once polling stops, so it goes with the triggers
+        self.assertIsNone(self.stockist.changes)
+        self.assertEqual(self.other.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'stock_changes%'"
+        ).fetchall(), [])
+        self.assertRaises(changes_module.ChangeError, changes_module.ChangePoller, self.changes, 0)
@@ -0,0 +1,133 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+import app.cart as cart_module
+import app.checkout as checkout_module
+import app.reservation as reservation_module
+import app.stockist as stockist_module
+
+
+class TestCheckoutEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.populate()
+
+    def populate(self):
+        self.apple = self.stockist.stock_item('apple', amount=5)
+        self.pear = self.stockist.stock_item('pear', amount=2)
+
+    def count(self, stock_id):
+        return self.stockist[stock_id]['count']
+
+    def test_all_or_nothing(self):
+        engine = self.stockist.checkout_engine
+        self.assertRaises(checkout_module.CheckoutError, engine.checkout, {self.apple: 1, self.pear: 3})
+        self.assertEqual(self.count(self.apple), 5)
+        self.assertEqual(self.count(self.pear), 2)
+        engine.checkout({self.apple: 1, self.pear: 2})
+        self.assertEqual(self.count(self.apple), 4)
+        self.assertEqual(self.count(self.pear), 0)
+
+    def test_invalid_lines(self):
+        engine = self.stockist.checkout_engine
+        self.assertRaises(checkout_module.CheckoutError, engine.checkout, {self.apple: -1})
+        self.assertRaises(KeyError, engine.checkout, {99: 1})
+
+    def test_respects_other_holds(self):
+        cart = cart_module.ShoppingCart(self.stockist)
+        cart.add_item('apple', 4)
+        engine = self.stockist.checkout_engine
+        self.assertRaises(checkout_module.CheckoutError, engine.checkout, {self.apple: 2})
+        cart.checkout()
+        self.assertEqual(self.count(self.apple), 1)
+        self.assertEqual(self.stockist.available_to_promise(self.apple), 1)
+
+    def test_failed_cart_checkout_keeps_holds(self):
+        cart = cart_module.ShoppingCart(self.stockist)
+        cart.add_item('pear', 2)
+        self.stockist.stock[self.pear]['count'] = 1
+        self.assertRaises(checkout_module.CheckoutError, cart.checkout)
+        self.assertEqual(cart.lines[self.pear], 2)
+        self.assertEqual(self.stockist.reservations.held(self.pear), 2)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        self.stockist.increase_stock(self.apple, 195)
+        failures = []
+
+        def buy():
+            for _ in range(30):
+                try:
+                    self.stockist.checkout_engine.checkout({self.apple: 1})
+                except checkout_module.CheckoutError:
+                    failures.append(1)
+
+        threads = [threading.Thread(target=buy) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.count(self.apple), 0)
+        self.assertEqual(len(failures), 40)
+        self.assertEqual(self.stockist.checkout_engine.checkouts, 200)
+
+    def test_concurrent_reserves_never_overpromise(self):
+        self.stockist.increase_stock(self.apple, 95)
+
+        def buy():
+            for _ in range(30):
+                try:
+                    self.stockist.checkout_engine.checkout({self.apple: 1})
+                except checkout_module.CheckoutError:
+                    pass
+
+        def hold():
+            for _ in range(30):
+                try:
+                    self.stockist.reservations.reserve(self.apple)
+                except reservation_module.InsufficientStockError:
+                    pass
+
+        threads = [threading.Thread(target=target) for target in (buy, hold) * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(self.stockist.available_to_promise(self.apple), 0)
+        self.assertEqual(self.count(self.apple) + self.stockist.checkout_engine.checkouts, 100)
+
+
+class TestSQLiteCheckoutEngine(TestCheckoutEngine):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stockist = stockist_module.SQLiteStockist(os.path.join(self.directory, 'stock.db'))
+        self.stockist.create_database()
+        self.populate()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_database_is_decremented(self):
+        self.stockist.checkout_engine.checkout({self.apple: 2, self.pear: 1})
+        self.assertEqual(self.stockist.database_stock[self.apple]['count'], 3)
+        self.assertEqual(self.stockist.database_stock[self.pear]['count'], 1)
+
+    def test_database_disagreement_rolls_back(self):
+        cur = self.stockist.connection.cursor()
+        cur.execute("UPDATE stock SET count=0 WHERE pk=?", (self.pear,))
+        self.stockist.connection.commit()
+        self.assertRaises(
+            stockist_module.StockError,
+            self.stockist.checkout_engine.checkout,
+            {self.apple: 1, self.pear: 1},
+        )
+        self.assertEqual(self.stockist.database_stock[self.apple]['count'], 5)
+        self.assertEqual(self.count(self.apple), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import app.events as events_module
+
+
+class TestEventDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = events_module.EventDispatcher(batch_size=4)
+
+    def tearDown(self):
+        self.dispatcher.close()
+
+    def test_batches_in_order(self):
+        batches = []
+        self.dispatcher.subscribe(batches.append)
+        for number in range(10):
+            self.assertTrue(self.dispatcher.publish({'number': number}))
+        self.assertTrue(self.dispatcher.flush(5))
+        self.assertTrue(all(1 <= len(batch) <= 4 for batch in batches))
+        self.assertEqual([event['number'] for batch in batches for event in batch], list(range(10)))
+        self.assertEqual(self.dispatcher.delivered, 10)
+
+    def test_no_subscribers(self):
+        self.assertFalse(self.dispatcher.publish({'number': 1}))
+        self.assertEqual(self.dispatcher.published, 0)
+
+    def test_slow_subscriber_drops_instead_of_blocking(self):
+        self.dispatcher = events_module.EventDispatcher(batch_size=4, max_pending=8)
+        release = threading.Event()
+        self.dispatcher.subscribe(lambda events: release.wait(5))
+        results = [self.dispatcher.publish({'number': number}) for number in range(20)]
+        self.assertIn(False, results)
+        self.assertGreater(self.dispatcher.dropped, 0)
+        release.set()
+        self.assertTrue(self.dispatcher.flush(5))
+
+    def test_failing_subscriber(self):
+        seen = []
+
+        def broken(events):
+            raise ValueError
+
+        self.dispatcher.subscribe(broken)
+        self.dispatcher.subscribe(seen.extend)
+        self.dispatcher.publish({'number': 1})
+        self.dispatcher.flush(5)
+        self.assertEqual(seen, [{'number': 1}])
+        self.assertEqual(self.dispatcher.failures, 1)
+
+    def test_closed(self):
+        self.dispatcher.close()
+        self.assertRaises(events_module.EventError, self.dispatcher.publish, {})
+
+
+class TestJSONLSink(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'events.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_appends(self):
+        sink = events_module.JSONLSink(self.path)
+        sink([{'a': 1}, {'a': 2}])
+        sink.close()
+        sink([{'a': 3}])
+        sink.close()
+        self.assertEqual(events_module.read_events(self.path), [{'a': 1}, {'a': 2}, {'a': 3}])
+
+    def test_unreadable(self):
+        with open(self.path, 'w') as fh:
+            fh.write('{\n')
+        self.assertRaises(events_module.EventError, events_module.read_events, self.path)
@@ -0,0 +1,124 @@
+import unittest
+
+import app.history as history_module
+import app.stockist as stockist_module
+
+
+class FakeClock(object):
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestStockHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(100.0)
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.history = self.stockist.enable_history(checkpoint_every=0)
+        self.history.clock = self.clock
+        self.apple = self.stockist.new_stock_item('apple')
+        self.pear = self.stockist.new_stock_item('pear')
+
+    def advance(self, stock_id, amount, step=10.0):
+        self.clock.now += step
+        self.stockist.increase_stock(stock_id, amount)
+
+    def test_requires_history(self):
+        stockist = stockist_module.SQLiteStockist(':memory:')
+        self.assertRaises(stockist_module.StockError, stockist.count_at, 0, 0)
+        self.assertRaises(stockist_module.StockError, stockist.totals_at, 0)
+        self.assertRaises(NotImplementedError, history_module.StockHistory, stockist_module.DatabaseStockist())
+
+    def test_count_at(self):
+        self.advance(self.apple, 5)   # 110
+        self.advance(self.apple, -2)  # 120
+        self.advance(self.pear, 7)    # 130
+        self.assertEqual(self.stockist.count_at(self.apple, 105), 0)
+        self.assertEqual(self.stockist.count_at(self.apple, 110), 5)
+        self.assertEqual(self.stockist.count_at(self.apple, 125), 3)
+        self.assertEqual(self.stockist.totals_at(125), {self.apple: 3})
+        self.assertEqual(self.stockist.totals_at(130), {self.apple: 3, self.pear: 7})
+
+    def test_queries_through_checkpoints(self):
+        self.advance(self.apple, 5)   # 110
+        self.history.checkpoint()     # 110
+        self.advance(self.apple, 4)   # 120
+        self.history.checkpoint()     # 120
+        self.advance(self.apple, -1)  # 130
+        self.assertEqual(self.stockist.count_at(self.apple, 115), 5)
+        self.assertEqual(self.stockist.count_at(self.apple, 120), 9)
+        self.assertEqual(self.stockist.count_at(self.apple, 130), 8)
+        self.assertEqual(self.stockist.totals_at(130), {self.apple: 8})
+
+    def test_automatic_checkpoint(self):
+        self.history.checkpoint_every = 2
+        self.advance(self.apple, 1)
+        self.advance(self.apple, 1)
+        cur = self.stockist.connection.cursor()
+        cur.execute("SELECT COUNT(*) FROM stock_history_checkpoint WHERE pk IS NULL")
+        self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_delete_records_removal(self):
+        self.advance(self.apple, 5)
+        self.clock.now += 10
+        del self.stockist[self.apple]
+        self.assertEqual(self.stockist.count_at(self.apple, 110), 5)
+        self.assertEqual(self.stockist.count_at(self.apple, 120), 0)
+        self.assertEqual(self.stockist.totals_at(120), {})
+
+    def test_downsampling(self):
+        for _ in range(10):
+            self.advance(self.apple, 1, step=1.0)  # 101..110
+        self.history.checkpoint()
+        self.history.apply_retention(raw_for=5, bucket=100, now=210)
+        cur = self.stockist.connection.cursor()
+        cur.execute("SELECT COUNT(*) FROM stock_history")
+        self.assertEqual(cur.fetchone()[0], 1)
+        self.assertEqual(self.stockist.count_at(self.apple, 199), 0)
+        self.assertEqual(self.stockist.count_at(self.apple, 200), 10)
+        self.assertEqual(self.stockist.count_at(self.apple, 210), 10)
+
+    def test_retention_horizon(self):
+        self.advance(self.apple, 3)  # 110
+        self.advance(self.pear, 2)   # 120
+        self.advance(self.apple, 1)  # 130
+        self.history.apply_retention(raw_for=0, bucket=1, keep_for=15, now=140)
+        self.assertRaises(history_module.HistoryError, self.stockist.count_at, self.apple, 110)
+        self.assertEqual(self.stockist.count_at(self.apple, 125), 3)
+        self.assertEqual(self.stockist.totals_at(140), {self.apple: 4, self.pear: 2})
+
+    def test_baseline_when_enabled(self):
+        stockist = stockist_module.SQLiteStockist(':memory:')
+        stockist.create_database()
+        apple = stockist.stock_item('apple', amount=10, create=True)
+        self.assertIsNone(stockist.enable_history(create=False))
+        history = stockist.enable_history(checkpoint_every=0)
+        history.clock = FakeClock(history.clock() + 10)
+        stockist.increase_stock(apple, 1)
+        self.assertEqual(stockist.count_at(apple, history.clock()), 11)
+        self.assertEqual(stockist.totals_at(history.clock()), {apple: 11})
+        self.assertIsNotNone(stockist.enable_history(create=False))
+
+    def test_external_changes_are_recorded(self):
+        self.advance(self.apple, 5)   # 110
+        self.clock.now += 10          # 120
+        with self.stockist.connection as connection:
+            connection.execute('UPDATE stock SET count = 8 WHERE pk = ?', (self.apple,))
+            connection.execute('DELETE FROM stock WHERE pk = ?', (self.pear,))
+        self.stockist.update_stock_from_db(force=True)
+        self.assertEqual(self.stockist.count_at(self.apple, 115), 5)
+        self.assertEqual(self.stockist.totals_at(120), {self.apple: 8})
+
+    def test_reset(self):
+        self.advance(self.apple, 3)
+        self.stockist.reset_database()
+        self.assertEqual(self.stockist.totals_at(200), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
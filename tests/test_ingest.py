@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import app.ingest as ingest_module
+import app.stockist as stockist_module
+
+
+class TestFeedIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'feed.csv')
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.stockist.stock_item('apple', amount=5, create=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, lines):
+        with open(self.path, 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+
+    def test_split_ranges(self):
+        self.write(['item-{0},{0}'.format(i) for i in range(100)])
+        with open(self.path, 'rb') as fh:
+            data = fh.read()
+        for parts in (1, 3, 7, 500):
+            ranges = ingest_module.split_ranges(self.path, parts)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(data))
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+                self.assertEqual(data[start - 1:start], b'\n')
+            self.assertLessEqual(len(ranges), min(parts, 100))
+
+    def test_parse(self):
+        self.write(['item,amount', 'apple, 3', '# comment', '', ' pear ,2', 'pear,-1',
+                    'plum', 'plum_#1,2', 'fig,many'] + ['kiwi,1'] * 50)
+        runner = ingest_module.FeedIngest(self.stockist, workers=1, chunks_per_worker=5)
+        totals = runner.parse(self.path)
+        self.assertEqual(totals, {'apple': 3, 'pear': 1, 'kiwi': 50})
+        self.assertEqual((runner.rows, runner.rejected), (53, 3))
+        self.assertEqual([error for _, error in runner.errors], [
+            'Expected item,amount.', "Invalid item name 'plum_#1'.", "Invalid amount 'many'.",
+        ])
+
+    def test_workers_agree(self):
+        self.write(['item-{0},{1}'.format(i % 7, i % 5 - 1) for i in range(2000)])
+        serial = ingest_module.FeedIngest(self.stockist, workers=1).parse(self.path)
+        parallel = ingest_module.FeedIngest(self.stockist, workers=2)
+        self.assertEqual(parallel.parse(self.path), serial)
+        self.assertEqual(parallel.rows, 2000)
+
+    def test_apply(self):
+        self.write(['apple,4', 'pear,6', 'apple,-2', 'fig,0'])
+        runner = ingest_module.FeedIngest(self.stockist, workers=1, batch_size=1)
+        self.assertEqual(runner.run(self.path), 2)
+        self.assertEqual(self.stockist['apple'][0]['count'], 7)
+        self.assertEqual(self.stockist['pear'][0]['count'], 6)
+        self.assertNotIn('fig', self.stockist)
+        self.assertEqual(
+            sorted((data['unique_name'], data['count']) for data in self.stockist.database_stock.values()),
+            [('apple_#0', 7), ('pear_#1', 6)],
+        )
+
+    def test_apply_without_numpy(self):
+        self.write(['apple,4', 'pear,6'])
+        runner = ingest_module.FeedIngest(self.stockist, workers=1)
+        with mock.patch.object(ingest_module.vectorized, 'numpy_available', return_value=False):
+            self.assertEqual(runner.run(self.path), 2)
+        self.assertEqual(
+            sorted((data['unique_name'], data['count']) for data in self.stockist.database_stock.values()),
+            [('apple_#0', 9), ('pear_#1', 6)],
+        )
+
+    def test_negative_changes_nothing(self):
+        self.write(['pear,3', 'apple,-6'])
+        runner = ingest_module.FeedIngest(self.stockist, workers=1)
+        self.assertRaises(ingest_module.IngestError, runner.run, self.path)
+        self.assertNotIn('pear', self.stockist)
+        self.assertEqual(self.stockist['apple'][0]['count'], 5)
+
+    def test_locked(self):
+        self.write(['apple,1'])
+        self.stockist.lock_stock_list()
+        runner = ingest_module.FeedIngest(self.stockist, workers=1)
+        self.assertRaises(stockist_module.StockLockedError, runner.run, self.path)
@@ -0,0 +1,65 @@
+import unittest
+
+import mock
+
+import app.item as item_module
+import app.stockist as stockist_module
+
+
+class TestItem(unittest.TestCase):
+
+    def test_identity(self):
+        item = item_module.Item(42)
+        self.assertEqual(str(item), '42')
+        self.assertEqual(item.identifier, 42)
+        self.assertEqual(item, item_module.Item('42'))
+        self.assertEqual(item, '42')
+        self.assertNotEqual(item, '43')
+        self.assertEqual(hash(item), hash('42'))
+        self.assertEqual({'42': 1}[item], 1)
+        self.assertFalse(hasattr(item, '__dict__'))
+        self.assertRaises(AttributeError, setattr, item, 'colour', 'red')
+
+
+class TestItemCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = item_module.ItemCatalog()
+
+    def test_intern(self):
+        apple = self.catalog.intern('apple', sku='A-1', price=120)
+        self.assertIs(self.catalog.intern('apple'), apple)
+        self.assertIs(self.catalog.intern(item_module.Item('apple')), apple)
+        self.assertIs(self.catalog.intern(mock.Mock(__str__=lambda _: 'apple')), apple)
+        self.assertIs(self.catalog[apple.key], apple)
+        self.assertIs(self.catalog.by_sku('A-1'), apple)
+        self.assertEqual(apple.price, 120)
+        pear = self.catalog.intern(item_module.Item('pear', sku='P-1'))
+        self.assertEqual((apple.key, pear.key), (0, 1))
+        self.assertEqual(pear.sku, 'P-1')
+        self.assertEqual(len(self.catalog), 2)
+        self.assertIn('pear', self.catalog)
+
+    def test_sku_change(self):
+        apple = self.catalog.intern('apple', sku='A-1')
+        self.catalog.intern('apple', sku='A-2')
+        self.assertIsNone(self.catalog.by_sku('A-1'))
+        self.assertIs(self.catalog.by_sku('A-2'), apple)
+
+
+class TestStockistCatalog(unittest.TestCase):
+
+    def test_stockist_interns_items(self):
+        stockist = stockist_module.Stockist()
+        apple = stockist.register_item('apple', sku='A-1', price=120)
+        stockist.stock_item(apple, amount=3)
+        stockist.stock_item('apple', amount=2, create=True)
+        self.assertEqual(len(stockist.catalog), 1)
+        self.assertEqual(sorted(stockist.stock_ids_for_item(apple)), [0, 1])
+        self.assertTrue(apple in stockist)
+        self.assertTrue(stockist.item_stocked(apple))
+        self.assertIs(list(stockist.name_id_map)[0], apple.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
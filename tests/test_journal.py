@@ -0,0 +1,160 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import mock
+
+import app.journal as journal_module
+import app.stockist as stockist_module
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stock.journal')
+        self.journal = journal_module.Journal(self.path, sync_every=2, checkpoint_every=0)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+
+    def test_append_and_replay(self):
+        self.journal.append(journal_module.OP_NEW, 0, 0, 'test')
+        self.journal.append(journal_module.OP_INCREASE, 0, 5)
+        self.journal.append(journal_module.OP_DELETE, 0)
+        self.assertEqual(list(self.journal.replay()), [
+            (journal_module.OP_NEW, 0, 0, 'test'),
+            (journal_module.OP_INCREASE, 0, 5, ''),
+            (journal_module.OP_DELETE, 0, 0, ''),
+        ])
+
+    def test_sequence_survives_reopen(self):
+        self.journal.append(journal_module.OP_NEW, 0, 0, 'test')
+        self.journal.close()
+        self.journal = journal_module.Journal(self.path)
+        self.assertEqual(self.journal.append(journal_module.OP_INCREASE, 0, 1), 2)
+
+    def test_torn_tail_is_dropped(self):
+        self.journal.append(journal_module.OP_NEW, 0, 0, 'test')
+        self.journal.close()
+        with open(self.path, 'ab') as fh:
+            fh.write(b'\x00\x00\x00\x30garbage')
+        self.journal = journal_module.Journal(self.path)
+        self.journal.append(journal_module.OP_INCREASE, 0, 3)
+        self.assertEqual(len(list(self.journal.replay())), 2)
+
+    def test_checkpoint_compacts_journal(self):
+        self.journal.append(journal_module.OP_NEW, 0, 0, 'test')
+        self.journal.checkpoint([{'stock_id': 0, 'unique_name': 'test_#0', 'count': 4}])
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.journal.append(journal_module.OP_INCREASE, 0, 1)
+        self.assertEqual(list(self.journal.replay()), [
+            (journal_module.OP_ENTRY, 0, 4, 'test_#0'),
+            (journal_module.OP_INCREASE, 0, 1, ''),
+        ])
+
+    def test_replay_skips_records_already_in_snapshot(self):
+        self.journal.append(journal_module.OP_NEW, 0, 0, 'test')
+        self.journal.append(journal_module.OP_INCREASE, 0, 2)
+        with open(self.path, 'rb') as fh:
+            uncompacted = fh.read()
+        self.journal.checkpoint([{'stock_id': 0, 'unique_name': 'test_#0', 'count': 2}])
+        # simulate a crash between writing the snapshot and truncating
+        with open(self.path, 'wb') as fh:
+            fh.write(uncompacted)
+        self.assertEqual(list(self.journal.replay()), [
+            (journal_module.OP_ENTRY, 0, 2, 'test_#0'),
+        ])
+
+
+class TestStockistRecovery(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stock.journal')
+        self.stockist = stockist_module.Stockist()
+        self.stockist.open_journal(self.path, checkpoint_every=3)
+
+    def tearDown(self):
+        self.stockist.journal.close()
+        shutil.rmtree(self.directory)
+
+    def test_recover(self):
+        self.stockist.stock_item('apple', amount=5)
+        self.stockist.stock_item('pear', amount=2)
+        self.stockist.stock_item('apple', amount=1, create=True)
+        self.stockist.increase_stock(0, -3)
+        del self.stockist[1]
+        expected_stock = dict(self.stockist.stock)
+        expected_map = dict(self.stockist.name_id_map)
+        self.stockist.journal.close()
+
+        recovered = stockist_module.Stockist()
+        recovered.open_journal(self.path)
+        self.assertEqual(recovered.recover(), 2)
+        self.assertEqual(dict(recovered.stock), expected_stock)
+        self.assertEqual(dict(recovered.name_id_map), expected_map)
+        recovered.journal.close()
+
+    def test_recover_without_journal(self):
+        self.assertRaises(stockist_module.StockError, stockist_module.Stockist().recover)
+        self.assertRaises(stockist_module.StockError, stockist_module.Stockist().checkpoint)
+
+    def test_recover_locked(self):
+        self.stockist.lock_stock_list()
+        self.assertRaises(stockist_module.StockLockedError, self.stockist.recover)
+
+
+class TestDatabaseStockistJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stock.journal')
+        self.database = os.path.join(self.directory, 'stock.db')
+        self.stockist = stockist_module.SQLiteStockist(self.database)
+        self.stockist.create_database()
+        self.stockist.open_journal(self.path, checkpoint_every=0)
+
+    def tearDown(self):
+        self.stockist.journal.close()
+        shutil.rmtree(self.directory)
+
+    def recovered(self):
+        self.stockist.journal.sync()
+        recovered = stockist_module.Stockist()
+        recovered.open_journal(self.path)
+        recovered.recover()
+        recovered.journal.close()
+        return dict((stock_id, data['count']) for stock_id, data in recovered.stock.items())
+
+    def test_rollback_leaves_no_records(self):
+        stock_id = self.stockist.stock_item('apple', amount=2)
+        with self.assertRaises(RuntimeError):
+            with self.stockist.transaction():
+                self.stockist.increase_stock(stock_id, 5)
+                self.stockist.stock_item('pear', create=True)
+                raise RuntimeError
+        self.assertEqual(self.recovered(), {stock_id: 2})
+
+    def test_failed_write_leaves_no_records(self):
+        stock_id = self.stockist.stock_item('apple', amount=2)
+        with mock.patch.object(self.stockist.storage, 'put', side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, self.stockist.increase_stock, stock_id, 5)
+        self.assertEqual(self.recovered(), {stock_id: 2})
+
+    def test_loaded_rows_are_checkpointed(self):
+        writer = stockist_module.SQLiteStockist(self.database)
+        first = writer.stock_item('apple', amount=3)
+        self.stockist.update_stock_from_db()
+        self.assertEqual(self.recovered(), {first: 3})
+        second = writer.stock_item('pear', amount=4, create=True)
+        writer.increase_stock(first, 1)
+        self.stockist.sync_from_db()
+        self.stockist.increase_stock(second, 1)
+        self.assertEqual(self.recovered(), {first: 4, second: 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import csv
+import json
+import unittest
+
+import app.listing as listing_module
+import app.stockist as stockist_module
+
+
+class TestListing(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        for name, count in [('apple', 3), ('pear', 0), ('apple', 9), ('big pear', 1)]:
+            self.stockist.stock_item(name, amount=count, create=True)
+        self.stockist._stock.clear()
+        self.chunks = []
+
+    def write(self, output_format, **kwargs):
+        entries = self.stockist.iter_find(page_size=2, order_by='name', **kwargs)
+        listing_module.write_listing(entries, self.chunks.append, output_format, buffer_lines=3)
+        return '\n'.join(self.chunks)
+
+    def test_table(self):
+        lines = self.write('table').split('\n')
+        self.assertEqual(lines[:6], ['', '=' * 20, 'apple', '=' * 20, '> apple_#0: 3', '> apple_#2: 9'])
+        self.assertEqual(lines.count('=' * 20), 9)
+        self.assertGreater(len(self.chunks), 1)
+
+    def test_json(self):
+        rows = json.loads(self.write('json'))
+        self.assertEqual([row['stock_id'] for row in rows], [0, 2, 3, 1])
+        self.assertEqual(rows[2], {'stock_id': 3, 'item': 'big pear', 'unique_name': 'big pear_#3', 'count': 1})
+
+    def test_json_empty(self):
+        self.assertEqual(json.loads(self.write('json', count_lt=0)), [])
+
+    def test_csv(self):
+        rows = list(csv.DictReader(self.write('csv', limit=2, offset=1).split('\n')))
+        self.assertEqual([row['unique_name'] for row in rows], ['apple_#2', 'big pear_#3'])
+        self.assertEqual(rows[0]['item'], 'apple')
+
+    def test_item_name(self):
+        self.assertEqual(listing_module.item_name('big pear_#12'), 'big pear')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.loadgen as loadgen_module
+import app.stockist as stockist_module
+
+
+class TestWorkload(unittest.TestCase):
+
+    def setUp(self):
+        self.workload = loadgen_module.Workload(items=50, clients=3, seed=7)
+
+    def test_deterministic(self):
+        first = list(self.workload.generate(500))
+        second = list(loadgen_module.Workload(items=50, clients=3, seed=7).generate(500))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, list(loadgen_module.Workload(items=50, clients=3, seed=8).generate(500)))
+        self.assertEqual(set(entry['client'] for entry in first), set([0, 1, 2]))
+
+    def test_popularity_is_skewed(self):
+        picks = collections.Counter(
+            entry['item'] for entry in self.workload.generate(5000) if 'item' in entry
+        )
+        self.assertEqual(picks.most_common(1)[0][0], 'sku-0')
+        self.assertGreater(picks['sku-0'], 5 * picks['sku-20'])
+
+    def test_mix(self):
+        mix = loadgen_module.parse_mix('count=1,checkout=0')
+        self.assertEqual(mix, (('count', 1.0), ('checkout', 0.0)))
+        workload = loadgen_module.Workload(items=10, mix=mix)
+        self.assertEqual(set(entry['op'] for entry in workload.generate(100)), set(['count']))
+        for text in ('count=x', 'sell=1', 'count=0'):
+            with self.assertRaises(loadgen_module.LoadError):
+                loadgen_module.parse_mix(text)
+
+    def test_trace_round_trip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trace.jsonl')
+            entries = list(self.workload.generate(100))
+            loadgen_module.save_trace(path, self.workload, entries)
+            workload, replayed = loadgen_module.load_trace(path)
+            self.assertEqual(replayed, entries)
+            self.assertEqual(workload.header, self.workload.header)
+            with open(path, 'w') as fh:
+                fh.write('not json\n')
+            with self.assertRaises(loadgen_module.LoadError):
+                loadgen_module.load_trace(path)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestRunLoad(unittest.TestCase):
+
+    def run_against(self, stock):
+        workload = loadgen_module.Workload(items=20, clients=4, initial=10 ** 6, seed=1)
+        driver = loadgen_module.StockistDriver(stock)
+        driver.prepare(workload)
+        entries = list(workload.generate(400))
+        entries.append({'client': 0, 'op': 'count', 'item': 'missing'})
+        report = loadgen_module.run_load(driver, entries, workload.clients)
+        self.assertEqual(report['total']['operations'], 401)
+        self.assertEqual(report['total']['errors'], 1)
+        self.assertEqual(report['operations']['count']['errors'], 1)
+        self.assertLessEqual(report['total']['p50'], report['total']['p99'])
+        return report
+
+    def test_stockist(self):
+        self.run_against(stockist_module.Stockist())
+
+    def test_sqlite_stockist(self):
+        stock = stockist_module.SQLiteStockist(':memory:')
+        stock.create_database()
+        self.run_against(stock)
+        self.assertEqual(
+            dict((data['stock_id'], data['count']) for data in stock.database_stock.values()),
+            dict((stock_id, data['count']) for stock_id, data in stock.stock.items()),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+
+import mock
+
+import app.locations as locations_module
+import app.stockist as stockist_module
+
+
+class TestStockLocations(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = self.create_stockist()
+        for i in range(4):
+            self.stockist.stock_item('apple' if i % 2 else 'pear', amount=5, create=True)
+        self.locations = self.stockist.enable_locations()
+
+    def create_stockist(self):
+        return stockist_module.Stockist()
+
+    def assertRollups(self):
+        # the incremental rollups always match a recount from scratch
+        located = self.locations
+        expected = locations_module.StockLocations(self.stockist)
+        expected.by_stock = dict((stock_id, dict(counts)) for stock_id, counts in located.by_stock.items())
+        expected.rebuild()
+        self.assertEqual(located.total, sum(data['count'] for data in self.stockist.stock.values()))
+        for name in ('location_totals', 'item_totals', 'items'):
+            self.assertEqual(
+                dict((key, value) for key, value in getattr(located, name).items() if value),
+                dict((key, value) for key, value in getattr(expected, name).items() if value),
+            )
+
+    def test_stock_at_location(self):
+        self.stockist.stock_item('apple', amount=3, location='north')
+        self.stockist.increase_stock_at(1, 'south', 2)
+        self.stockist.increase_stock_at(3, 'north', -1)
+        self.assertEqual(self.locations.counts(3), {'north': 2, 'default': 5})
+        self.assertEqual(self.stockist[3]['count'], 7)
+        self.assertEqual(self.locations.item_total('apple', 'north'), 2)
+        self.assertEqual(self.locations.item_total('apple'), 14)
+        self.assertRollups()
+
+    def test_unlocated_changes_use_default(self):
+        self.stockist.increase_stock_at(0, 'north', 4)
+        self.stockist.increase_stock(0, -2)
+        self.stockist.checkout_engine.checkout({2: 1})
+        self.assertEqual(self.locations.counts(0), {'north': 4, 'default': 3})
+        self.assertEqual(self.locations.location_totals['default'], 17)
+        self.assertRollups()
+
+    def test_unlocated_removal_draws_down_locations(self):
+        self.stockist.transfer(0, 'default', 'south', 3)
+        self.stockist.transfer(0, 'default', 'north', 2)
+        self.stockist.increase_stock(0, -3)
+        self.assertEqual(self.locations.counts(0), {'south': 2, 'default': 0})
+        self.assertEqual(self.stockist[0]['count'], 2)
+        self.assertRollups()
+
+    def test_not_enough_at_location(self):
+        self.stockist.increase_stock_at(0, 'north', 1)
+        self.assertRaises(locations_module.LocationError, self.stockist.increase_stock_at, 0, 'north', -2)
+        self.assertRaises(locations_module.LocationError, self.stockist.transfer, 0, 'north', 'south', 2)
+        self.assertRaises(locations_module.LocationError, self.stockist.transfer, 0, 'north', 'north', 1)
+        self.assertRaises(locations_module.LocationError, self.stockist.increase_stock_at, 0, '', 1)
+        self.assertEqual(self.stockist[0]['count'], 6)
+        self.assertEqual(self.locations.counts(0), {'north': 1, 'default': 5})
+        self.assertRollups()
+
+    def test_transfer(self):
+        self.stockist.transfer(1, 'default', 'north', 4)
+        self.stockist.transfer(1, 'north', 'south', 4)
+        self.assertEqual(self.locations.counts(1), {'south': 4, 'default': 1})
+        self.assertEqual(self.stockist[1]['count'], 5)
+        self.assertEqual(self.locations.locations(), ['default', 'north', 'south'])
+        self.assertRollups()
+
+    def test_delete(self):
+        self.stockist.increase_stock_at(1, 'north', 2)
+        del self.stockist['apple']
+        self.assertNotIn(1, self.locations.by_stock)
+        self.assertEqual(self.locations.location_totals['north'], 0)
+        self.assertEqual(self.locations.items['apple'], 0)
+        self.assertRollups()
+
+    def test_not_enabled(self):
+        other = self.create_stockist()
+        self.assertRaises(stockist_module.StockError, other.increase_stock_at, 0, 'north', 1)
+
+
+class TestSQLiteStockLocations(TestStockLocations):
+
+    def create_stockist(self):
+        stockist = stockist_module.SQLiteStockist(':memory:')
+        stockist.create_database()
+        return stockist
+
+    def reload(self):
+        reloaded = stockist_module.SQLiteStockist(self.stockist._connection)
+        reloaded.update_stock_from_db()
+        return reloaded, reloaded.enable_locations(create=False)
+
+    def test_persisted(self):
+        self.stockist.increase_stock_at(0, 'north', 3)
+        self.stockist.transfer(0, 'north', 'south', 1)
+        self.stockist.transfer(2, 'default', 'south', 5)
+        self.stockist.transfer(2, 'south', 'default', 5)
+        del self.stockist[1]
+        reloaded, located = self.reload()
+        self.assertEqual(located.by_stock, {0: {'north': 2, 'south': 1}})
+        self.assertEqual(reloaded[0]['count'], 8)
+        self.assertEqual(dict(located.location_totals), dict(
+            (key, value) for key, value in self.locations.location_totals.items() if value or key == 'default'
+        ))
+
+    def test_one_transaction(self):
+        self.stockist.increase_stock_at(0, 'north', 3)
+        connection = self.stockist.connection
+        wrapped = mock.MagicMock(wraps=connection, row_factory=connection.row_factory)
+        wrapped.__enter__.return_value = wrapped
+        wrapped.__exit__.side_effect = connection.__exit__
+        self.stockist._connection = wrapped
+        self.stockist.transfer(0, 'north', 'south', 2)
+        self.stockist.increase_stock_at(0, 'south', 1)
+        self.assertEqual(self.stockist._connection.commit.call_count, 2)
+        self.stockist._connection = connection
+        _, located = self.reload()
+        self.assertEqual(located.by_stock, {0: {'north': 1, 'south': 3}})
+
+    def test_failed_transfer_restores_memory(self):
+        self.stockist.increase_stock_at(0, 'north', 3)
+        with mock.patch.object(self.locations, '_write', side_effect=RuntimeError('disk full')):
+            self.assertRaises(RuntimeError, self.stockist.transfer, 0, 'north', 'south', 2)
+        self.assertEqual(self.locations.counts(0), {'north': 3, 'default': 5})
+        self.assertRollups()
+
+    def test_drawn_down_locations_are_persisted(self):
+        self.stockist.transfer(0, 'default', 'north', 4)
+        self.stockist.increase_stock(0, -3)
+        _, located = self.reload()
+        self.assertEqual(located.by_stock, {0: {'north': 2}})
+
+    def test_reset(self):
+        self.stockist.increase_stock_at(0, 'north', 3)
+        self.stockist.reset_database()
+        self.assertEqual(self.locations.by_stock, {})
+        _, located = self.reload()
+        self.assertEqual(located.by_stock, {})
+
+    def test_attach_only_when_created(self):
+        self.assertIsNone(self.create_stockist().enable_locations(create=False))
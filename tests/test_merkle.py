@@ -0,0 +1,93 @@
+import unittest
+
+import app.merkle as merkle_module
+import app.stockist as stockist_module
+
+
+class TestStockMerkle(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        for i in range(300):
+            self.stockist.stock_item('item{0}'.format(i % 40), amount=i % 7, create=True)
+        self.merkle = self.stockist.enable_merkle(bucket_width=16, fanout=4)
+
+    def side_table(self):
+        with self.stockist.connection as connection:
+            cur = connection.cursor()
+            cur.execute('SELECT leaf, hash FROM stock_merkle WHERE hash != 0 ORDER BY leaf')
+            return [tuple(row) for row in cur.fetchall()]
+
+    def test_attach_only_when_created(self):
+        other = stockist_module.SQLiteStockist(':memory:')
+        other.create_database()
+        self.assertIsNone(other.enable_merkle(create=False))
+        self.assertIsNone(other.merkle)
+
+    def test_incremental_matches_rebuild(self):
+        self.stockist.stock_item('apple', amount=5, create=True)
+        self.stockist.increase_stock(3, 10)
+        del self.stockist[7]
+        self.stockist.checkout_engine.checkout({10: 1, 20: 2})
+        with self.stockist.transaction():
+            for stock_id in range(100, 140):
+                self.stockist.increase_stock(stock_id, 2)
+        self.assertEqual(self.stockist.verify(), [])
+        incremental = self.side_table()
+        self.merkle.rebuild_table()
+        self.assertEqual(self.side_table(), incremental)
+
+    def test_memory_drift_is_found_and_repaired(self):
+        self.stockist.increase_stock(40, 5, update_db=False)
+        self.stockist.stock[200]['count'] += 1
+        self.merkle.touch(200)
+        self.assertEqual(self.stockist.verify(), [(32, 48, [40]), (192, 208, [200])])
+        count = self.stockist.database_stock[40]['count']
+        self.assertEqual(self.stockist.repair(), [(32, 48), (192, 208)])
+        self.assertEqual(self.stockist[40]['count'], count)
+        self.assertEqual(self.stockist.verify(), [])
+
+    def test_repair_from_memory(self):
+        self.stockist.new_stock_item('pear', new_id=500, update_db=False)
+        self.assertEqual(self.stockist.verify(), [(496, 512, [500])])
+        self.stockist.repair('memory')
+        self.assertIn(500, self.stockist.database_stock)
+        self.assertEqual(self.stockist.verify(), [])
+        with self.assertRaises(merkle_module.MerkleError):
+            self.stockist.repair('elsewhere')
+
+    def test_rolled_back_write_restores_memory(self):
+        count = self.stockist.stock[5]['count']
+        try:
+            with self.stockist.transaction():
+                self.stockist.increase_stock(5, 3)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.stockist.stock[5]['count'], count)
+        self.assertEqual(self.stockist.verify(), [])
+
+    def test_unwritten_change_is_found(self):
+        self.stockist.increase_stock(5, 3, update_db=False)
+        self.assertEqual(self.stockist.verify(), [(0, 16, [5])])
+
+    def test_outside_edit_leaves_stale_digest(self):
+        with self.stockist.connection as connection:
+            connection.execute('UPDATE stock SET count = 99 WHERE pk = 70')
+            connection.commit()
+        self.stockist.update_stock_from_db(force=True)
+        self.assertEqual(self.stockist.verify(), [(64, 80, [])])
+        self.stockist.repair()
+        self.assertEqual(self.stockist.verify(), [])
+
+    def test_round_trips_follow_depth(self):
+        self.stockist.increase_stock(250, 1, update_db=False)
+        metrics = self.stockist.enable_metrics()
+        self.stockist.verify()
+        # 300 ids in leaves of 16 make 19 leaves: a root query and 3 levels of 4
+        self.assertEqual(metrics.histograms[('sql', 'select stock_merkle')].count, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import app.metrics as metrics_module
+import app.stockist as stockist_module
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = metrics_module.Metrics(buckets=(0.001, 0.01, 0.1))
+
+    def test_histogram(self):
+        for value in (0.0005, 0.002, 0.003, 0.05, 5.0):
+            self.metrics.observe('operation', 'find', value)
+        histogram = self.metrics.histograms[('operation', 'find')]
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.quantile(0.5), 0.01)
+        self.assertEqual(histogram.quantile(0.99), float('inf'))
+
+    def test_statement_label(self):
+        self.assertEqual(metrics_module.statement_label('UPDATE stock SET count=? where pk=?'), 'update stock')
+        self.assertEqual(metrics_module.statement_label('SELECT pk FROM stock WHERE count < ?'), 'select stock')
+        self.assertEqual(metrics_module.statement_label('INSERT INTO stock VALUES(?, ?, ?)'), 'insert stock')
+        self.assertEqual(
+            metrics_module.statement_label('CREATE INDEX IF NOT EXISTS stock_pk ON stock(pk)'),
+            'create stock',
+        )
+
+    def test_prometheus(self):
+        self.metrics.increment('commits', 2)
+        self.metrics.observe('sql', 'select "stock"', 0.005)
+        text = self.metrics.to_prometheus()
+        self.assertIn('# TYPE stockist_commits_total counter\nstockist_commits_total 2\n', text)
+        self.assertIn('stockist_sql_seconds_bucket{le="0.01",statement="select \\"stock\\""} 1\n', text)
+        self.assertIn('stockist_sql_seconds_bucket{le="+Inf",statement="select \\"stock\\""} 1\n', text)
+        self.assertIn('stockist_sql_seconds_count{statement="select \\"stock\\""} 1\n', text)
+
+    def test_sinks(self):
+        events = []
+        self.metrics.add_sink(lambda *event: events.append(event))
+        self.metrics.increment('commits')
+        self.metrics.observe('command', 'count', 0.5)
+        self.assertEqual(events, [('counter', 'commits', '', 1), ('histogram', 'command', 'count', 0.5)])
+
+    def test_save_snapshot_accumulates(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = metrics_module.default_metrics_path(os.path.join(directory, 'stock.db'))
+            self.metrics.increment('commits')
+            self.metrics.observe('command', 'count', 0.5)
+            metrics_module.save_snapshot(path, self.metrics)
+            combined = metrics_module.save_snapshot(path, self.metrics)
+            self.assertEqual(combined.counters[('commits', '')], 2)
+            with open(path) as fh:
+                self.assertEqual(json.load(fh), combined.snapshot())
+            with self.assertRaises(metrics_module.MetricsError):
+                metrics_module.Metrics().merge(combined.snapshot())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_concurrent_saves_keep_every_update(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = metrics_module.default_metrics_path(os.path.join(directory, 'stock.db'))
+            processes = [multiprocessing.Process(target=save_commits, args=(path, 20)) for _ in range(4)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            self.assertEqual(metrics_module.load_snapshot(path)['counters'], [['commits', '', 80]])
+        finally:
+            shutil.rmtree(directory)
+
+
+def save_commits(path, times):
+    for _ in range(times):
+        metrics = metrics_module.Metrics()
+        metrics.increment('commits')
+        metrics_module.save_snapshot(path, metrics)
+
+
+class TestStockistMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+
+    def test_disabled(self):
+        self.assertIsNone(self.stockist.metrics)
+        self.stockist.stock_item('apple', amount=2)
+        self.assertIs(self.stockist.connection, self.stockist._connection)
+        # without metrics the timed methods are called unwrapped
+        self.assertIs(type(self.stockist), stockist_module.SQLiteStockist)
+        self.assertIs(
+            type(self.stockist).increase_stock,
+            stockist_module.DatabaseStockist.__dict__['increase_stock'],
+        )
+
+    def test_disabling_unwraps(self):
+        metrics = self.stockist.enable_metrics()
+        self.assertIsInstance(self.stockist, stockist_module.SQLiteStockist)
+        stock_id = self.stockist.stock_item('apple', amount=2)
+        self.stockist[stock_id]
+        self.stockist.last_stock_id_for_item('apple')
+        self.stockist.database_stock
+        self.assertEqual(metrics.histograms[('operation', '__getitem__')].count, 1)
+        self.assertEqual(metrics.histograms[('operation', 'last_stock_id_for_item')].count, 1)
+        self.assertEqual(metrics.histograms[('operation', 'database_stock')].count, 1)
+        self.stockist.metrics = None
+        self.assertIs(type(self.stockist), stockist_module.SQLiteStockist)
+        self.stockist[stock_id]
+        self.assertEqual(metrics.histograms[('operation', '__getitem__')].count, 1)
+
+    def test_operations_and_sql(self):
+        metrics = self.stockist.enable_metrics()
+        stock_id = self.stockist.stock_item('apple', amount=2)
+        self.stockist.find(count_lt=5)
+        histograms = metrics.histograms
+        # the database override and its base implementation count as one call
+        self.assertEqual(histograms[('operation', 'increase_stock')].count, 1)
+        self.assertEqual(histograms[('operation', 'new_stock_item')].count, 1)
+        self.assertEqual(histograms[('operation', 'stock_item')].count, 1)
+        self.assertEqual(histograms[('sql', 'insert stock')].count, 1)
+        self.assertEqual(histograms[('sql', 'update stock')].count, 1)
+        self.assertEqual(metrics.counters[('sql_rows_written', '')], 2)
+        self.assertEqual(metrics.counters[('sql_rows_read', '')], 1)
+        self.assertEqual(metrics.counters[('commits', '')], 2)
+        metrics.enabled = False
+        self.stockist.increase_stock(stock_id, 1)
+        self.assertEqual(histograms[('operation', 'increase_stock')].count, 1)
+
+    def test_transaction_commits_once(self):
+        metrics = self.stockist.enable_metrics()
+        stock_id = self.stockist.stock_item('apple', amount=2)
+        before = metrics.counters[('commits', '')]
+        with self.stockist.transaction():
+            for _ in range(10):
+                self.stockist.increase_stock(stock_id, 1)
+        self.assertEqual(metrics.counters[('commits', '')], before + 1)
+
+    def test_checkout_lock_wait(self):
+        metrics = self.stockist.enable_metrics()
+        stock_id = self.stockist.stock_item('apple', amount=20)
+        threads = [
+            threading.Thread(target=self.stockist.checkout_engine.checkout, args=({stock_id: 1},))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.histograms[('lock_wait', 'checkout')].count, 4)
+        self.assertEqual(self.stockist[stock_id]['count'], 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import threading
+
+import mock
+
+import app.cart as cart_module
+import app.pay as pay_module
+import app.stockist as stockist_module
+
+
+class BlockingGateway(pay_module.FakeGateway):
+
+    def __init__(self):
+        super(BlockingGateway, self).__init__()
+        self.release = threading.Event()
+
+    def charge(self, amount, idempotency_key):
+        self.release.wait(5)
+        return super(BlockingGateway, self).charge(amount, idempotency_key)
+
+
+class TestPaymentProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.apple = self.stockist.stock_item('apple', amount=5)
+        self.processors = []
+
+    def tearDown(self):
+        for processor in self.processors:
+            processor.shutdown()
+
+    def processor(self, gateway, **kwargs):
+        processor = pay_module.PaymentProcessor(self.stockist, gateway, **kwargs)
+        self.processors.append(processor)
+        return processor
+
+    def cart(self, quantity):
+        cart = cart_module.ShoppingCart(self.stockist)
+        cart.add_item('apple', quantity)
+        return cart
+
+    def test_success_confirms_reservation(self):
+        processor = self.processor(pay_module.FakeGateway())
+        job = self.cart(2).checkout_async(processor, amount=200)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, pay_module.CONFIRMED)
+        self.assertEqual(self.stockist[self.apple]['count'], 3)
+        self.assertEqual(self.stockist.reservations.held(self.apple), 0)
+        self.assertEqual(processor.metrics['confirmed'], 1)
+
+    def test_decline_releases_reservation(self):
+        processor = self.processor(pay_module.FakeGateway(decline_rate=1.0))
+        job = self.cart(2).checkout_async(processor, amount=200)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, pay_module.FAILED)
+        self.assertIsInstance(job.error, pay_module.PaymentDeclined)
+        self.assertEqual(self.stockist[self.apple]['count'], 5)
+        self.assertEqual(self.stockist.available_to_promise(self.apple), 5)
+
+    def test_unexpected_failure_releases_reservation(self):
+        gateway = pay_module.FakeGateway()
+        gateway.refund = mock.Mock(side_effect=RuntimeError('refund service down'))
+        self.stockist.checkout_engine.checkout = mock.Mock(side_effect=ValueError('bad lines'))
+        processor = self.processor(gateway)
+        job = self.cart(1).checkout_async(processor, amount=100)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, pay_module.FAILED)
+        self.assertIsInstance(job.error, RuntimeError)
+        self.assertEqual(self.stockist.reservations.held(self.apple), 0)
+
+    def test_gateway_errors_are_retried(self):
+        gateway = pay_module.FakeGateway(failure_rate=1.0)
+        processor = self.processor(gateway, retries=1, retry_delay=0)
+        job = self.cart(1).checkout_async(processor, amount=100)
+        self.assertTrue(job.wait(5))
+        self.assertIsInstance(job.error, pay_module.GatewayError)
+        self.assertEqual(processor.metrics['failed'], 1)
+
+    def test_stock_held_while_payment_pending(self):
+        gateway = BlockingGateway()
+        processor = self.processor(gateway)
+        job = self.cart(4).checkout_async(processor, amount=400)
+        self.assertEqual(self.stockist.available_to_promise(self.apple), 1)
+        gateway.release.set()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(self.stockist.available_to_promise(self.apple), 1)
+        self.assertEqual(self.stockist[self.apple]['count'], 1)
+
+    def test_idempotency_key(self):
+        gateway = BlockingGateway()
+        processor = self.processor(gateway)
+        first = self.cart(1).checkout_async(processor, amount=100, idempotency_key='order-1')
+        second = processor.submit({}, [], 100, idempotency_key='order-1')
+        self.assertIs(first, second)
+        gateway.release.set()
+        first.wait(5)
+        self.assertEqual(len(gateway.charges), 1)
+
+    def test_duplicate_key_releases_holds(self):
+        gateway = BlockingGateway()
+        processor = self.processor(gateway)
+        first = self.cart(1).checkout_async(processor, amount=100, idempotency_key='order-1')
+        cart = self.cart(3)
+        self.assertIs(cart.checkout_async(processor, amount=300, idempotency_key='order-1'), first)
+        self.assertEqual(cart.lines, {})
+        self.assertEqual(self.stockist.reservations.held(self.apple), 1)
+        self.assertEqual(self.stockist.available_to_promise(self.apple), 4)
+        gateway.release.set()
+        self.assertTrue(first.wait(5))
+
+    def test_finished_jobs_are_evicted(self):
+        processor = self.processor(pay_module.FakeGateway(), workers=1, keep_finished=2)
+        for key in ('a', 'b', 'c'):
+            processor.submit({}, [], 0, idempotency_key=key)
+        processor.join()
+        self.assertEqual(sorted(processor.jobs), ['b', 'c'])
+
+    def test_backpressure(self):
+        gateway = BlockingGateway()
+        processor = self.processor(gateway, workers=1, max_pending=1)
+        self.cart(1).checkout_async(processor, amount=100)
+        # wait for the worker to pick up the first job so the queue is free
+        while processor.queue.qsize():
+            pass
+        self.cart(1).checkout_async(processor, amount=100)
+        cart = self.cart(1)
+        self.assertRaises(pay_module.PaymentBackpressureError, cart.checkout_async, processor, 100, block=False)
+        self.assertEqual(sum(cart.lines.values()), 1)
+        gateway.release.set()
+        processor.join()
+        self.assertEqual(self.stockist[self.apple]['count'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
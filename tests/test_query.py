@@ -0,0 +1,199 @@
+import unittest
+
+import mock
+
+import app.query as query_module
+import app.stockist as stockist_module
+
+
+class TestCompileFind(unittest.TestCase):
+
+    def test_filters(self):
+        sql, params = query_module.compile_find(
+            'stock', '?', count_lt=5, name_prefix='apple', limit=10, offset=20, order_by='-count'
+        )
+        self.assertEqual(
+            sql,
+            'SELECT pk, name, count FROM stock WHERE count < ? AND name >= ? AND name < ?'
+            ' ORDER BY count DESC, pk DESC LIMIT ? OFFSET ?'
+        )
+        self.assertEqual(params, (5, 'apple', 'applf', 10, 20))
+
+    def test_keyset(self):
+        sql, params = query_module.compile_find('stock', '%s', count_between=(1, 3), after=(2, 7), order_by='count')
+        self.assertIn('count BETWEEN %s AND %s', sql)
+        self.assertIn('(count > %s OR (count = %s AND pk > %s))', sql)
+        self.assertEqual(params, (1, 3, 2, 2, 7))
+
+    def test_delete(self):
+        sql, params = query_module.compile_delete('stock', '?', item_name='apple', count_eq=0, ids=[3, 4])
+        self.assertEqual(
+            sql,
+            'DELETE FROM stock WHERE name >= ? AND name < ? AND count = ? AND pk IN (?, ?)'
+        )
+        self.assertEqual(params, ('apple_#', 'apple_$', 0, 3, 4))
+        sql, params = query_module.compile_delete('stock', '%s', ids=range(1000), id_table='ids')
+        self.assertEqual(sql, 'DELETE FROM stock WHERE pk IN (SELECT pk FROM ids)')
+        self.assertEqual(params, ())
+        self.assertRaises(query_module.QueryError, query_module.compile_delete, 'stock', '?')
+
+    def test_name_order(self):
+        sql, params = query_module.compile_find(
+            'stock', '?', order_by='-name', after=('apple', 7), item_name_expression='item(name)'
+        )
+        self.assertIn('(item(name) < ? OR (item(name) = ? AND pk < ?))', sql)
+        self.assertTrue(sql.endswith('ORDER BY item(name) DESC, pk DESC'))
+        self.assertEqual(params, ('apple', 'apple', 7))
+
+    def test_invalid(self):
+        self.assertRaises(query_module.QueryError, query_module.compile_find, 'stock', '?', order_by='colour')
+        self.assertRaises(query_module.QueryError, query_module.compile_find, 'stock', '?', offset=1)
+        self.assertRaises(query_module.QueryError, query_module.compile_find, 'stock', '?', order_by='name')
+        self.assertRaises(query_module.QueryError, query_module.evaluate_find, [], offset=1)
+
+
+class TestStockistFind(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.populate()
+
+    def populate(self):
+        for i, (name, count) in enumerate([
+            ('apple', 3), ('pear', 0), ('apple', 9), ('plum', 1), ('apricot', 1), ('pear', 12),
+        ]):
+            self.stockist.stock_item(name, amount=count, create=True)
+
+    def ids(self, results):
+        return [data['stock_id'] for data in results]
+
+    def test_count_lt(self):
+        self.assertEqual(self.ids(self.stockist.find(count_lt=2)), [1, 3, 4])
+        self.assertEqual(self.ids(self.stockist.find(count_lt=2, order_by='count')), [1, 3, 4])
+        self.assertEqual(self.ids(self.stockist.find(count_lt=4, order_by='-count')), [0, 4, 3, 1])
+
+    def test_count_between(self):
+        self.assertEqual(self.ids(self.stockist.find(count_between=(1, 9))), [0, 2, 3, 4])
+
+    def test_name_prefix(self):
+        self.assertEqual(self.ids(self.stockist.find(name_prefix='ap')), [0, 2, 4])
+        self.assertEqual(self.ids(self.stockist.find(name_prefix='apple_')), [0, 2])
+        self.assertEqual(self.ids(self.stockist.find(name_prefix='ap', order_by='name')), [0, 2, 4])
+
+    def test_pagination(self):
+        self.assertEqual(self.ids(self.stockist.find(limit=2, offset=2)), [2, 3])
+        self.assertEqual(self.ids(self.stockist.iter_find(page_size=2, order_by='count')), [1, 3, 4, 0, 2, 5])
+        self.assertEqual(self.ids(self.stockist.iter_find(page_size=2, limit=3, order_by='-count')), [5, 2, 0])
+        self.assertEqual(self.ids(self.stockist.iter_find(page_size=2, offset=1, order_by='name')), [2, 4, 1, 5, 3])
+
+    def test_name_order_by_item_then_id(self):
+        for _ in range(8):
+            self.stockist.stock_item('apple', create=True)
+        # apple_#10 must not sort before apple_#2 as a string would
+        keys = [
+            (data['unique_name'].split('_#')[0], data['stock_id'])
+            for data in self.stockist.iter_find(page_size=3, order_by='name')
+        ]
+        self.assertEqual(keys, sorted(keys))
+        self.assertIn(('apple', 10), keys)
+        keys = [
+            (data['unique_name'].split('_#')[0], data['stock_id'])
+            for data in self.stockist.iter_find(page_size=3, order_by='-name')
+        ]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+
+    def test_iter_find_sorts_once(self):
+        with mock.patch.object(self.stockist, 'find', wraps=self.stockist.find) as find:
+            self.assertEqual(self.ids(self.stockist.iter_find(page_size=2, offset=1, limit=4)), [1, 2, 3, 4])
+        self.assertEqual(find.call_count, 1)
+
+
+class TestSQLiteStockistFind(TestStockistFind):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.populate()
+        # results must come from the database, not the in-memory copy
+        self.stockist._stock.clear()
+
+    def test_iter_find_sorts_once(self):
+        # the database pages with a keyset instead
+        with mock.patch.object(self.stockist, 'find', wraps=self.stockist.find) as find:
+            self.assertEqual(self.ids(self.stockist.iter_find(page_size=2, offset=1, limit=4)), [1, 2, 3, 4])
+        self.assertEqual(find.call_count, 2)
+
+
+class TestStockistDeleteWhere(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.populate()
+
+    def populate(self):
+        for name, count in [
+            ('apple', 3), ('pear', 0), ('apple', 0), ('plum', 0), ('apples', 0), ('pear', 12),
+        ]:
+            self.stockist.stock_item(name, amount=count, create=True)
+
+    def remaining(self):
+        return sorted(self.stockist.stock)
+
+    def test_count_eq(self):
+        self.assertEqual(self.stockist.delete_where(count_eq=0), [1, 2, 3, 4])
+        self.assertEqual(self.remaining(), [0, 5])
+        self.assertEqual(self.stockist.stock_ids_for_item('pear'), [5])
+
+    def test_item(self):
+        self.assertEqual(self.stockist.delete_where(item='apple', count_eq=0), [2])
+        self.assertEqual(self.stockist.delete_where(item='apple'), [0])
+        self.assertEqual(self.remaining(), [1, 3, 4, 5])
+        self.assertEqual(self.stockist.stock_ids_for_item('apples'), [4])
+
+    def test_ids(self):
+        self.assertEqual(self.stockist.delete_where(ids=[0, 1, 5, 99]), [0, 1, 5])
+        self.assertEqual(self.stockist.delete_where(ids=[2, 3, 4], count_eq=0, item='plum'), [3])
+        self.assertEqual(self.remaining(), [2, 4])
+
+    def test_needs_condition(self):
+        self.assertRaises(stockist_module.StockError, self.stockist.delete_where)
+        self.stockist.lock_stock_list()
+        self.assertRaises(stockist_module.StockLockedError, self.stockist.delete_where, count_eq=0)
+
+
+class TestSQLiteStockistDeleteWhere(TestStockistDeleteWhere):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.populate()
+
+    def remaining(self):
+        remaining = sorted(self.stockist.database_stock)
+        self.assertEqual(remaining, sorted(self.stockist.stock))
+        return remaining
+
+    def test_id_table(self):
+        self.stockist.DELETE_INLINE_IDS = 2
+        self.assertEqual(self.stockist.delete_where(ids=[0, 1, 2, 3]), [0, 1, 2, 3])
+        self.assertEqual(self.remaining(), [4, 5])
+        self.assertFalse(self.stockist.table_exists(self.stockist.DELETE_IDS_TABLE))
+
+    def test_failed_delete_restores_memory(self):
+        with mock.patch.object(query_module, 'compile_delete', return_value=('DELETE FROM missing', ())):
+            self.assertRaises(Exception, self.stockist.delete_where, count_eq=0)
+        self.assertEqual(self.remaining(), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(sorted(self.stockist.stock_ids_for_item('apple')), [0, 2])
+
+    def test_history_and_merkle(self):
+        self.stockist.enable_history()
+        self.stockist.enable_merkle(bucket_width=2, fanout=2)
+        stock_id = self.stockist.stock_item('quince', amount=4, create=True)
+        self.stockist.delete_where(item='quince')
+        self.assertEqual(self.stockist.verify(), [])
+        self.assertEqual(self.stockist.count_at(stock_id, self.stockist.history.clock()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import app.batch as batch_module
+import app.server as server_module
+import app.stockist as stockist_module
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets not available')
+class TestStockServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stock.sock')
+        self.stockist = stockist_module.SQLiteStockist(os.path.join(self.directory, 'stock.db'))
+        self.stockist.create_database()
+        self.server = server_module.StockServer(self.stockist, self.path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_requests(self):
+        client = server_module.connect(self.path)
+        self.assertEqual(client.request('stock apple 3'), [])
+        self.assertEqual(client.request('count apple'), ['> apple_#0: 3'])
+        self.assertRaises(batch_module.BatchError, client.request, 'count 5')
+        self.assertEqual(client.request('count 0'), ['3'])
+        client.close()
+        self.assertEqual(self.stockist.database_stock[0]['count'], 3)
+
+    def test_client_flags(self):
+        client = server_module.connect(self.path)
+        self.assertEqual(client.request('stock apple 3 --verbose'), ['apple_#0: 3'])
+        self.assertRaises(batch_module.BatchError, client.request, 'stock pear --create --lock')
+        self.assertFalse(self.stockist.is_locked)
+        client.close()
+        self.assertNotIn('pear', self.stockist)
+
+    def test_concurrent_clients(self):
+        server_module.connect(self.path).request('stock apple 0')
+
+        def shopper():
+            client = server_module.connect(self.path)
+            for _ in range(25):
+                client.request('stock 0 1')
+            client.close()
+
+        threads = [threading.Thread(target=shopper) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.stockist[0]['count'], 200)
+
+    def test_single_server_per_socket(self):
+        self.assertRaises(batch_module.BatchError, server_module.StockServer, self.stockist, self.path)
+
+    def test_stale_socket(self):
+        self.assertIsNone(server_module.connect(os.path.join(self.directory, 'missing.sock')))
+        stale = os.path.join(self.directory, 'stale.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        self.assertIsNone(server_module.connect(stale))
+        server = server_module.StockServer(self.stockist, stale)
+        server.server_close()
+        self.assertFalse(os.path.exists(stale))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import unittest
+
+import mock
+
+import app.shared as shared_module
+import app.stockist as stockist_module
+
+
+def read_counts(name, item, queue):
+    reader = shared_module.SharedStockReader(name)
+    try:
+        queue.put(reader.counts_for_item(item))
+    finally:
+        reader.close()
+
+
+class TestSharedStock(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'stockist_test_{0}'.format(os.getpid())
+        self.stockist = stockist_module.Stockist()
+        for i in range(20):
+            self.stockist.stock_item('item{0}'.format(i % 4), amount=i, create=True)
+        self.publisher = self.stockist.publish_shared(self.name, capacity=8)
+        self.reader = shared_module.SharedStockReader(self.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close()
+
+    def test_reads_published_counts(self):
+        for stock_id, data in self.stockist.stock.items():
+            self.assertEqual(self.reader.count(stock_id), data['count'])
+        self.assertEqual(
+            self.reader.counts_for_item('item1'),
+            [(stock_id, self.stockist.stock[stock_id]['count']) for stock_id in (1, 5, 9, 13, 17)],
+        )
+
+    def test_follows_mutations(self):
+        self.stockist.increase_stock(3, 10)
+        del self.stockist[5]
+        self.stockist.checkout_engine.checkout({9: 2})
+        self.assertEqual(self.reader.count(3), 13)
+        self.assertIsNone(self.reader.get(5))
+        self.assertEqual(self.reader.count(9), 7)
+        self.assertNotIn(5, self.reader.stock_ids_for_item('item1'))
+
+    def test_missing_ids(self):
+        with self.assertRaises(KeyError):
+            self.reader.count(500)
+        self.assertEqual(self.reader.get(500, 'none'), 'none')
+        self.assertEqual(self.reader.counts_for_item('pear'), [])
+
+    def test_reattaches_after_growth(self):
+        for i in range(200):
+            self.stockist.stock_item('pear{0}'.format(i), amount=i + 1, create=True)
+        self.assertGreater(self.publisher.directory.words[1], 0)
+        self.assertGreater(self.publisher.directory.words[2], 0)
+        self.assertEqual(self.reader.count(0), 0)
+        self.assertEqual(self.reader.counts_for_item('pear199'), [(219, 200)])
+
+    def test_growth_publishes_filled_generations(self):
+        # a reader attaching just as the old generation is retired sees every count
+        seen = []
+        close = shared_module.Segment.close
+
+        def retire(segment, unlink=False):
+            if unlink and not seen:
+                reader = shared_module.SharedStockReader(self.name)
+                seen.append((reader.count(19), reader.counts_for_item('item3')))
+                reader.close()
+            close(segment, unlink)
+
+        with mock.patch.object(shared_module.Segment, 'close', retire):
+            self.stockist.stock_item('pear', amount=1, create=True)
+            self.publisher._grow_counts(100)
+        self.assertEqual(seen[0][0], 19)
+        self.assertEqual([stock_id for stock_id, _ in seen[0][1]], [3, 7, 11, 15, 19])
+
+    def test_negative_ids(self):
+        self.publisher.touch(-1)
+        self.assertEqual(self.publisher.counts.words[1], 0)
+        self.assertEqual(self.reader.count(0), 0)
+        self.assertRaises(shared_module.SharedStockError, self.publisher._write_count, -1, 5)
+
+    def test_reader_in_another_process(self):
+        self.stockist.increase_stock(2, 5)
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=read_counts, args=(self.name, 'item2', queue))
+        process.start()
+        counts = queue.get(timeout=10)
+        process.join()
+        self.assertEqual(counts, [(2, 7), (6, 6), (10, 10), (14, 14), (18, 18)])
+
+    def test_missing_segment(self):
+        with self.assertRaises(shared_module.SharedStockError):
+            shared_module.SharedStockReader(self.name + '_nothing')
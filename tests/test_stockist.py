@@ -106,13 +106,14 @@ class TestStockist(unittest.TestCase):
 
     def test___delitem__(self):
         self.stockist.delete_stock_entry = mock.Mock()
-        self.stockist.stock_ids_for_item = mock.Mock(return_value=[2])
+        self.stockist.delete_where = mock.Mock()
         
         del self.stockist[1]
         self.stockist.delete_stock_entry.assert_called_with(1)
         
         del self.stockist['test']
-        self.stockist.delete_stock_entry.assert_called_with(2)
+        self.stockist.delete_where.assert_called_with(item='test')
+        self.assertEqual(self.stockist.delete_stock_entry.call_count, 1)
         
     def test___contains__(self):
         self.stockist[1] = 'test'
@@ -325,16 +326,10 @@ class TestDatabaseStockist(TestStockist):
         self.stockist._name_id_map = {'test': set((2, 'test_#2'))}
 
         if self.stockist.DELETE_SQL_STRING is not None:
-            with mock.patch('app.stockist.DatabaseStockist.connection') as con:
-                cursor = mock.MagicMock(execute=mock.Mock())
-                connection = mock.MagicMock(cursor=lambda: cursor, commit=mock.Mock())
-                con.__enter__ = mock.Mock(return_value=connection)
+            self.stockist._storage = mock.Mock()
+            with mock.patch('app.stockist.DatabaseStockist.connection'):
                 self.stockist.delete_stock_entry(2, update_db=True)
-
-            expected = self.stockist.DELETE_SQL_STRING.format(
-                table=self.stockist.STOCK_TABLE
-            )
-            cursor.execute.assert_called_with(expected, (2,))
+            self.stockist._storage.delete.assert_called_with(2)
         else:
             self.assertRaises(NotImplementedError, self.stockist.delete_stock_entry, 2, update_db=True)
         
@@ -372,16 +367,10 @@ class TestDatabaseStockist(TestStockist):
         
         if self.stockist.INSERT_SQL_STRING is not None:
             self.stockist.create_stock_entry = mock.Mock(return_value=(1, str(new_mock) + '_#1', 0))
-            with mock.patch('app.stockist.DatabaseStockist.connection') as con:
-                cursor = mock.MagicMock(execute=mock.Mock())
-                connection = mock.MagicMock(cursor=lambda: cursor, commit=mock.Mock())
-                con.__enter__ = mock.Mock(return_value=connection)
+            self.stockist._storage = mock.Mock()
+            with mock.patch('app.stockist.DatabaseStockist.connection'):
                 self.assertEqual(1, self.stockist.new_stock_item(new_mock, update_db=True))
-            
-            expected = self.stockist.INSERT_SQL_STRING.format(
-                table=self.stockist.STOCK_TABLE
-            )
-            cursor.execute.assert_called_with(expected, (1, str(new_mock) + '_#1', 0))
+            self.stockist._storage.insert.assert_called_with(1, str(new_mock) + '_#1', 0)
         else:
             self.assertRaises(NotImplementedError, self.stockist.new_stock_item, new_mock, update_db=True)
         
@@ -403,17 +392,14 @@ class TestDatabaseStockist(TestStockist):
         self.assertEqual(self.stockist._stock[0]['count'], 2)
 
         if self.stockist.UPDATE_SQL_STRING is not None:
-            self.stockist._stock = {0: {'count': 0}, 1: {'count': 1}}
-            with mock.patch('app.stockist.DatabaseStockist.connection') as con:
-                cursor = mock.MagicMock(execute=mock.Mock())
-                connection = mock.MagicMock(cursor=lambda: cursor, commit=mock.Mock())
-                con.__enter__ = mock.Mock(return_value=connection)
+            self.stockist._stock = {
+                0: {'stock_id': 0, 'unique_name': 'test_#0', 'count': 0},
+                1: {'stock_id': 1, 'unique_name': 'test_#1', 'count': 1},
+            }
+            self.stockist._storage = mock.Mock()
+            with mock.patch('app.stockist.DatabaseStockist.connection'):
                 self.stockist.increase_stock(0, update_db=True)
-            
-            expected = self.stockist.UPDATE_SQL_STRING.format(
-                table=self.stockist.STOCK_TABLE
-            )
-            cursor.execute.assert_called_with(expected, (1, 0))
+            self.stockist._storage.put.assert_called_with(0, 'test_#0', 1)
         else:
             self.assertRaises(NotImplementedError, self.stockist.increase_stock, 0, update_db=True)
 
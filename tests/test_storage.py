@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.backends as backends_module
+import app.stockist as stockist_module
+import app.storage as storage_module
+
+
+class TestEncoding(unittest.TestCase):
+
+    def test_round_trip(self):
+        for stock_id, name, count in ((0, 'apple_#0', 5), (7, 'pear_#3', -2), (2 ** 40, 'ümlaut_#1099511627776', 0)):
+            value = storage_module.encode_value(stock_id, name, count)
+            self.assertEqual(storage_module.decode_value(stock_id, value), (name, count))
+        self.assertEqual(len(storage_module.encode_value(12, 'apple_#12', 1)), storage_module.VALUE.size + 5)
+        self.assertEqual(storage_module.decode_key(storage_module.encode_key(99)), 99)
+        self.assertRaises(storage_module.StorageError, storage_module.encode_key, -1)
+
+
+class TestMemoryStorage(unittest.TestCase):
+
+    # every backend runs these; subclasses only say how to open one
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = self.create_storage()
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.directory)
+
+    def create_storage(self):
+        return storage_module.MemoryStorage()
+
+    def populate(self):
+        for stock_id in (5, 1, 3):
+            self.storage.put(stock_id, 'apple_#{0}'.format(stock_id), stock_id * 10)
+
+    def test_get_put_delete(self):
+        self.assertIsNone(self.storage.get(1))
+        self.storage.put(1, 'apple_#1', 4)
+        self.storage.put(1, 'apple_#1', 6)
+        self.assertEqual(self.storage.get(1), ('apple_#1', 6))
+        self.storage.insert(2, 'pear_#2', 1)
+        self.assertEqual(self.storage.get(2), ('pear_#2', 1))
+        self.storage.delete(1)
+        self.storage.delete(1)
+        self.assertIsNone(self.storage.get(1))
+
+    def test_scan(self):
+        self.populate()
+        self.assertEqual(self.storage.scan(), [(1, 'apple_#1', 10), (3, 'apple_#3', 30), (5, 'apple_#5', 50)])
+        self.assertEqual(self.storage.scan(start=2, stop=5), [(3, 'apple_#3', 30)])
+        self.assertEqual(self.storage.snapshot(), {1: ('apple_#1', 10), 3: ('apple_#3', 30), 5: ('apple_#5', 50)})
+
+    def test_batch(self):
+        self.populate()
+        with self.storage.batch():
+            self.storage.put(1, 'apple_#1', 11)
+            with self.storage.batch():
+                self.storage.delete(3)
+            self.assertEqual(self.storage.get(1), ('apple_#1', 11))
+        self.assertEqual(self.storage.snapshot(), {1: ('apple_#1', 11), 5: ('apple_#5', 50)})
+
+    def test_failed_batch(self):
+        self.populate()
+        with self.assertRaises(ValueError):
+            with self.storage.batch():
+                self.storage.put(1, 'apple_#1', 0)
+                self.storage.put(9, 'pear_#9', 1)
+                self.storage.delete(5)
+                raise ValueError
+        self.assertEqual(self.storage.snapshot(), {1: ('apple_#1', 10), 3: ('apple_#3', 30), 5: ('apple_#5', 50)})
+
+    def test_clear(self):
+        self.populate()
+        self.storage.clear()
+        self.assertEqual(self.storage.scan(), [])
+        self.storage.put(2, 'fig_#2', 1)
+        self.assertEqual(self.storage.scan(), [(2, 'fig_#2', 1)])
+
+
+class TestDBMStorage(TestMemoryStorage):
+
+    def create_storage(self):
+        return storage_module.DBMStorage(os.path.join(self.directory, 'stock'))
+
+    def test_not_a_dbm_file(self):
+        path = os.path.join(self.directory, 'stock.db')
+        stockist = stockist_module.SQLiteStockist(path)
+        stockist.create_database()
+        stockist.connection.close()
+        self.assertRaises(storage_module.StorageError, storage_module.DBMStorage, path)
+
+    def test_reopen(self):
+        self.populate()
+        self.storage.close()
+        self.assertRaises(storage_module.StorageError, self.storage.get, 1)
+        self.storage = self.create_storage()
+        self.assertEqual(len(self.storage.scan()), 3)
+
+
+class TestSQLStorage(TestMemoryStorage):
+
+    def create_storage(self):
+        stockist = stockist_module.SQLiteStockist(':memory:')
+        stockist.create_database()
+        return stockist.storage
+
+
+class TestSQLiteStorageStockist(unittest.TestCase):
+
+    # the same stockist operations, read back through a freshly opened stockist
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stock.db')
+        self.stockist = self.create_stockist()
+        self.stockist.create_database()
+
+    def tearDown(self):
+        self.close(self.stockist)
+        shutil.rmtree(self.directory)
+
+    def create_stockist(self):
+        return stockist_module.SQLiteStockist(self.path)
+
+    def close(self, stockist):
+        stockist.connection.close()
+
+    def reopen(self):
+        self.close(self.stockist)
+        reopened = self.create_stockist()
+        reopened.create_database()
+        reopened.update_stock_from_db()
+        return reopened
+
+    def test_round_trip(self):
+        for i in range(6):
+            self.stockist.stock_item('apple' if i % 2 else 'pear', amount=i + 1, create=True)
+        self.stockist.increase_stock(0, 4)
+        del self.stockist[1]
+        self.stockist.delete_where(count_eq=6)
+        self.stockist.apply_deltas([2, 3], [-1, 2])
+        self.stockist.decrement_stock({4: 2})
+        expected = dict(self.stockist.stock)
+        self.stockist = self.reopen()
+        self.assertEqual(dict(self.stockist.stock), expected)
+        self.assertEqual(sorted(self.stockist.stock_ids_for_item('apple')), [3])
+
+    def test_failed_decrement(self):
+        self.stockist.stock_item('apple', amount=2, create=True)
+        self.stockist.stock_item('pear', amount=1, create=True)
+        self.assertRaises(stockist_module.StockError, self.stockist.decrement_stock, {0: 1, 1: 3})
+        self.stockist = self.reopen()
+        self.assertEqual(self.stockist.stock_count, [(0, 2), (1, 1)])
+
+    def test_dump_and_reset(self):
+        for i in range(3):
+            self.stockist.new_stock_item('fig')
+        self.stockist.dump_stock_to_database()
+        self.assertEqual(sorted(self.stockist.database_stock), [0, 1, 2])
+        self.stockist.reset_database()
+        self.assertEqual(self.stockist.database_stock, {})
+
+
+class TestDBMStorageStockist(TestSQLiteStorageStockist):
+
+    def create_stockist(self):
+        return backends_module.create_stockist('dbm', self.path)
+
+    def close(self, stockist):
+        stockist.close()
+
+    def test_external_deletion_on_force(self):
+        self.stockist.stock_item('apple', amount=2, create=True)
+        self.stockist.stock_item('apple', amount=2, create=True)
+        self.stockist.storage.delete(0)
+        self.stockist.update_stock_from_db(force=True)
+        self.assertEqual(list(self.stockist.stock), [1])
+        self.assertRaises(stockist_module.StockError, self.stockist.enable_merkle)
+        self.assertIsNone(self.stockist.enable_locations(create=False))
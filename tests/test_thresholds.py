@@ -0,0 +1,107 @@
+import unittest
+
+import mock
+
+import app.stockist as stockist_module
+import app.thresholds as thresholds_module
+
+
+class TestStockThresholds(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = self.create_stockist()
+        for i in range(6):
+            self.stockist.stock_item('apple' if i % 2 else 'pear', amount=5, create=True)
+        self.thresholds = self.stockist.enable_thresholds()
+        self.events = []
+        self.thresholds.subscribe(self.events.extend)
+
+    def tearDown(self):
+        self.thresholds.close()
+
+    def create_stockist(self):
+        return stockist_module.Stockist()
+
+    def received(self):
+        self.thresholds.dispatcher.flush(5)
+        return [(event.event, event.kind, event.target, event.count) for event in self.events]
+
+    def test_batch_crossings(self):
+        self.thresholds.set_threshold(0, 3)
+        self.stockist.increase_stock(0, -1)
+        self.stockist.increase_stock(0, -2)
+        self.stockist.increase_stock(0, -1)
+        self.stockist.increase_stock(0, 4)
+        self.assertEqual(self.received(), [('below', 'batch', 0, 2), ('restored', 'batch', 0, 5)])
+
+    def test_item_totals(self):
+        self.thresholds.set_threshold('apple', 12)
+        self.stockist.increase_stock(1, -3)
+        self.assertEqual(self.received(), [])
+        del self.stockist[5]
+        self.stockist.checkout_engine.checkout({3: 1})
+        self.stockist.stock_item('apple', amount=10, create=True)
+        self.assertEqual(self.received(), [('below', 'item', 'apple', 7), ('restored', 'item', 'apple', 16)])
+        self.assertEqual(self.thresholds.totals['apple'], 16)
+
+    def test_unwatched_rows(self):
+        self.thresholds.set_threshold('apple', 1)
+        self.stockist.increase_stock(0, -5)
+        self.stockist.delete_where(item='pear')
+        self.assertEqual(self.received(), [])
+        self.assertNotIn(0, self.thresholds.seen)
+
+    def test_below_and_clear(self):
+        self.thresholds.set_threshold('pear', 20)
+        self.thresholds.set_threshold(1, 2)
+        self.assertEqual(self.thresholds.below(), [('item', 'pear', 15, 20)])
+        self.thresholds.clear_threshold('pear')
+        self.assertEqual(self.thresholds.thresholds(), [('batch', 1, 2)])
+        self.assertRaises(thresholds_module.ThresholdError, self.thresholds.clear_threshold, 'pear')
+        self.assertRaises(thresholds_module.ThresholdError, self.thresholds.set_threshold, 'pear', -1)
+
+
+class TestSQLiteStockThresholds(TestStockThresholds):
+
+    def create_stockist(self):
+        stockist = stockist_module.SQLiteStockist(':memory:')
+        stockist.create_database()
+        return stockist
+
+    def test_persisted(self):
+        self.thresholds.set_threshold('apple', 12)
+        self.thresholds.set_threshold(4, 3)
+        self.thresholds.set_threshold(4, 6)
+        self.stockist.increase_stock(1, -3)
+        reloaded = stockist_module.SQLiteStockist(self.stockist._connection)
+        reloaded.update_stock_from_db()
+        thresholds = reloaded.enable_thresholds(create=False)
+        self.assertEqual(thresholds.thresholds(), [('batch', 4, 6), ('item', 'apple', 12)])
+        self.assertEqual(thresholds.totals['apple'], 12)
+        self.assertEqual(thresholds.below(), [('batch', 4, 5, 6)])
+
+    def test_attach_only_when_created(self):
+        other = self.create_stockist()
+        self.assertIsNone(other.enable_thresholds(create=False))
+
+    def test_events_wait_for_commit(self):
+        self.thresholds.set_threshold(0, 3)
+        with self.stockist.transaction():
+            self.stockist.increase_stock(0, -4)
+            self.assertEqual(self.received(), [])
+        self.assertEqual(self.received(), [('below', 'batch', 0, 1)])
+
+    def test_rollback_publishes_nothing(self):
+        self.thresholds.set_threshold(0, 3)
+        self.thresholds.set_threshold('apple', 14)
+        with self.assertRaises(RuntimeError):
+            with self.stockist.transaction():
+                self.stockist.increase_stock(0, -4)
+                self.stockist.increase_stock(1, -2)
+                raise RuntimeError
+        self.assertEqual(self.received(), [])
+        self.assertEqual(self.thresholds.below(), [])
+        with mock.patch.object(self.stockist.storage, 'put', side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, self.stockist.increase_stock, 0, -4)
+        self.assertEqual(self.received(), [])
+
@@ -0,0 +1,67 @@
+import unittest
+
+import app.stockist as stockist_module
+import app.vectorized as vectorized_module
+
+
+@unittest.skipUnless(vectorized_module.numpy_available(), 'NumPy not installed')
+class TestVectorizedStockist(unittest.TestCase):
+
+    def setUp(self):
+        self.stockist = stockist_module.Stockist()
+        self.populate()
+
+    def populate(self):
+        for name, count in [('apple', 3), ('pear', 0), ('apple', 9), ('plum', 5)]:
+            self.stockist.stock_item(name, amount=count, create=True)
+
+    def test_count_arrays(self):
+        ids, counts = self.stockist.count_arrays()
+        self.assertEqual(ids.tolist(), [0, 1, 2, 3])
+        self.assertEqual(counts.tolist(), [3, 0, 9, 5])
+
+    def test_apply_deltas(self):
+        changed, new_counts, applied = self.stockist.apply_deltas([2, 0, 2, 1, 3], [-4, 2, 1, 0, 0])
+        self.assertEqual(changed.tolist(), [0, 2])
+        self.assertEqual(new_counts.tolist(), [5, 6])
+        self.assertEqual(applied.tolist(), [2, -3])
+        self.assertEqual(self.stockist[0]['count'], 5)
+        self.assertEqual(self.stockist[2]['count'], 6)
+
+    def test_bounds(self):
+        self.assertRaises(vectorized_module.VectorizedError, self.stockist.apply_deltas, [0, 1], [-1, -1])
+        self.assertEqual(self.stockist[0]['count'], 3)
+        self.assertRaises(vectorized_module.VectorizedError, self.stockist.apply_deltas, [99], [1])
+        self.assertRaises(vectorized_module.VectorizedError, self.stockist.apply_deltas, [0, 1], [1])
+        self.stockist.apply_deltas([1], [-2], allow_negative=True)
+        self.assertEqual(self.stockist[1]['count'], -2)
+
+    def test_statistics(self):
+        stats = self.stockist.count_statistics(percentiles=(50,))
+        self.assertEqual(stats['entries'], 4)
+        self.assertEqual(stats['total'], 17)
+        self.assertEqual(stats['zero'], 1)
+        self.assertEqual(stats['percentiles'][50], 4.0)
+        self.assertEqual(self.stockist.zero_count_ids().tolist(), [1])
+        self.assertEqual(stockist_module.Stockist().count_statistics()['total'], 0)
+
+
+@unittest.skipUnless(vectorized_module.numpy_available(), 'NumPy not installed')
+class TestVectorizedSQLiteStockist(TestVectorizedStockist):
+
+    def setUp(self):
+        self.stockist = stockist_module.SQLiteStockist(':memory:')
+        self.stockist.create_database()
+        self.populate()
+
+    def test_apply_deltas_writes_database(self):
+        self.stockist.enable_history(checkpoint_every=0)
+        self.stockist.apply_deltas([0, 3], [1, -5])
+        self.assertEqual(self.stockist.database_stock[0]['count'], 4)
+        self.assertEqual(self.stockist.database_stock[3]['count'], 0)
+        # history starts from the counts already stored, so totals are the real counts
+        self.assertEqual(self.stockist.totals_at(self.stockist.history.clock()), {0: 4, 2: 9})
+
+
+if __name__ == '__main__':
+    unittest.main()